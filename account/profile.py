@@ -1,9 +1,7 @@
 import calendar
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time
 
-from django.db.models import Count
-from django.db.models.functions import TruncDay
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.views import View
@@ -12,8 +10,9 @@ from django.views.generic import TemplateView
 from account.models import User
 from blog.models import Blog
 from contest.models import ContestUserRating
-from contest.statistics import get_participant_rank
+from contest.statistics import get_final_rank
 from problem.statistics import get_accept_problem_count
+from submission.activity import daily_counts
 from submission.util import SubmissionStatus
 
 
@@ -31,7 +30,7 @@ class ProfileView(TemplateView):
                    order_by("-contest__start_time")[:5]
         for cp in ret:
             if not cp.star and cp.end_time(cp.contest) < datetime.now():
-                cp.rank = get_participant_rank(cp.contest, self.user.id)
+                cp.rank = get_final_rank(cp)
         return ret
 
     def get_recent_gyms(self):
@@ -61,8 +60,6 @@ class ProfileView(TemplateView):
     def get_heatmap_data(self):
         now = datetime.now()
         one_year_ago = now.replace(year=now.year - 1, hour=0, minute=0, second=0, microsecond=0)
-        query_ret = self.user.submission_set.filter(create_time__gte=one_year_ago). \
-                annotate(date=TruncDay('create_time')).values("date").order_by("date").annotate(count=Count('id'))
         min_date = one_year_ago - timedelta(days=1)
         stat_dict = dict()
         last_week_set, last_day_set = set(), set()
@@ -74,8 +71,8 @@ class ProfileView(TemplateView):
             if min_date.day > last_day - 1:
                 last_day_set.add(min_date)
             min_date += timedelta(days=1)
-        for r in query_ret:
-            stat_dict[r["date"]] += r["count"]
+        for date, count, _ in daily_counts(self.user.id, one_year_ago.date()):
+            stat_dict[datetime.combine(date, time())] += count
 
         ret = []
         week_number_dict = dict()
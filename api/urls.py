@@ -1,5 +1,6 @@
 from django.conf.urls import url
 
+from dispatcher.views import judge_report_callback
 from home import search_api
 from message.views import ConversationAPI
 from message.views import ReplyAPI
@@ -18,4 +19,5 @@ urlpatterns = [
     url(r'^search/problem/$', search_api.SearchProblemAPI.as_view(), name='problem_search'),
     url(r'^message/reply/(?P<pk>\d+)/$', ReplyAPI.as_view()),
     url(r'^message/c/(?P<pk>\d+)/$', ConversationAPI.as_view()),
+    url(r'^judge/report/(?P<pk>\d+)/$', judge_report_callback),
 ]
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+from django_q.tasks import schedule
+
+from backstage.server.synchronize import resume_all_synchronizations, get_synchronization_progress
+from dispatcher.models import Server
+
+RESUME_TASK = "backstage.server.synchronize.resume_all_synchronizations"
+
+
+class Command(BaseCommand):
+    help = "Restart synchronizations of judge servers with problems queued and expired locks (e.g. crashed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedule', action='store_true',
+                            help="check every minute with django-q, instead of now")
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            if not Schedule.objects.filter(func=RESUME_TASK).exists():
+                schedule(RESUME_TASK, name="resume synchronizations", schedule_type=Schedule.MINUTES, minutes=1)
+            self.stdout.write("Scheduled every minute.")
+            return
+        resume_all_synchronizations()
+        for server in Server.objects.all():
+            progress = get_synchronization_progress(server)
+            self.stdout.write("%s: %d queued, %d done, %d failed" % (server.name, progress["queued"],
+                                                                     progress["problems"], progress["failed"]))
@@ -0,0 +1,164 @@
+import time
+import traceback
+from datetime import datetime
+
+from django.conf import settings
+from django_q.tasks import async_task
+from django_redis import get_redis_connection
+
+from dispatcher.manage import upload_cases
+from dispatcher.models import Server, ServerProblemStatus
+from problem.models import Problem
+from problem.tasks import upload_problem_to_judge_server
+from utils import random_string
+
+SYNC_QUEUE = 'server_sync_queue:%d'  # ids of problems to be synchronized, removed only after synchronized
+SYNC_COUNTER = 'server_sync_counter:%d'  # progress of the lane
+SYNC_LANE_LOCK = 'server_sync_lane:%d'
+
+
+# delete the lock only if it is still held by the lane
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _lock_timeout():
+    # the lock is refreshed between requests, so it should outlive the longest request (manifests, bundles)
+    return sum(settings.JUDGE_HTTP_TIMEOUT) + 60
+
+
+def _redis():
+    return get_redis_connection("judge")
+
+
+def synchronize_server(server, problem_ids):
+    """
+    Upload test data (and special programs) of problems to a server, in the background. Interrupted
+    synchronizations are resumed by `resume_synchronization`, skipping what the server already has.
+    """
+    problem_ids = list(problem_ids)
+    if not problem_ids:
+        return
+    client = _redis()
+    if not client.exists(SYNC_LANE_LOCK % server.pk) and not client.llen(SYNC_QUEUE % server.pk):
+        # a new batch
+        client.delete(SYNC_COUNTER % server.pk)
+    client.rpush(SYNC_QUEUE % server.pk, *problem_ids)
+    resume_synchronization(server)
+
+
+def resume_synchronization(server):
+    """
+    Start the lane of a server if there are problems queued and no lane is running (e.g. the last one crashed and
+    its lock expired)
+    """
+    client = _redis()
+    if client.llen(SYNC_QUEUE % server.pk) and not client.exists(SYNC_LANE_LOCK % server.pk):
+        async_task(run_synchronization, server.pk)
+
+
+def resume_all_synchronizations():
+    """
+    Scheduled with django-q, refer to command `resume_synchronization`
+    """
+    for server in Server.objects.all():
+        resume_synchronization(server)
+
+
+def _synchronize_problems(server, problem_ids, client):
+    lock_key, counter_key = SYNC_LANE_LOCK % server.pk, SYNC_COUNTER % server.pk
+    problems = list(Problem.objects.filter(pk__in=problem_ids))
+    cases = set()
+    for problem in problems:
+        cases.update(problem.pretest_list + problem.sample_list + problem.case_list)
+
+    def progress(case_count, byte_count):
+        with client.pipeline() as pipe:
+            pipe.hincrby(counter_key, "cases", case_count)
+            pipe.hincrby(counter_key, "bytes", byte_count)
+            pipe.expire(lock_key, _lock_timeout())
+            pipe.execute()
+
+    start_time = time.time()
+    error, unavailable = '', set()
+    try:
+        client.expire(lock_key, _lock_timeout())
+        unavailable = set(upload_cases(server, list(cases), progress=progress))
+    except:
+        error = traceback.format_exc()
+    upload_time = time.time() - start_time
+
+    for problem in problems:
+        status, _ = ServerProblemStatus.objects.get_or_create(server=server, problem=problem)
+        problem_unavailable = unavailable.intersection(problem.pretest_list + problem.sample_list + problem.case_list)
+        if error:
+            status.last_status = error
+        elif problem_unavailable:
+            status.last_status = "Data of cases %s cannot be found" % ", ".join(sorted(problem_unavailable))
+        else:
+            try:
+                client.expire(lock_key, _lock_timeout())
+                upload_problem_to_judge_server(problem, server, with_cases=False)
+                status.last_status = ''
+            except:
+                status.last_status = traceback.format_exc()
+        status.save()
+    with client.pipeline() as pipe:
+        pipe.hincrby(counter_key, "problems", len(problem_ids))
+        pipe.hincrby(counter_key, "failed", len([p for p in problems if error or unavailable.intersection(
+            p.pretest_list + p.sample_list + p.case_list)]))
+        pipe.hincrbyfloat(counter_key, "elapsed", upload_time)
+        pipe.execute()
+
+
+def run_synchronization(server_id):
+    """
+    Synchronize problems in the queue of a server, `settings.JUDGE_SYNC_BATCH_SIZE` problems at a time (so that
+    cases shared by problems are asked and uploaded once). Only one lane runs for a server at the same time.
+
+    Problems are removed from the queue one by one once synchronized, rather than trimming the head: if a lane
+    outlives its lock (e.g. a bundle over a slow link), another lane may work on the same head, and neither
+    should drop problems that the other has not synchronized.
+    """
+    server = Server.objects.get(pk=server_id)
+    client = _redis()
+    queue_key, lock_key = SYNC_QUEUE % server_id, SYNC_LANE_LOCK % server_id
+    lane = random_string()
+    while client.llen(queue_key) and client.set(lock_key, lane, nx=True, ex=_lock_timeout()):
+        try:
+            while True:
+                client.expire(lock_key, _lock_timeout())
+                problem_ids = client.lrange(queue_key, 0, settings.JUDGE_SYNC_BATCH_SIZE - 1)
+                if not problem_ids:
+                    break
+                _synchronize_problems(server, [int(problem_id) for problem_id in problem_ids], client)
+                with client.pipeline() as pipe:
+                    for problem_id in problem_ids:
+                        pipe.lrem(queue_key, 1, problem_id)
+                    pipe.execute()
+            server.last_synchronize_time = datetime.now()
+            server.save(update_fields=['last_synchronize_time'])
+        finally:
+            client.eval(RELEASE_SCRIPT, 1, lock_key, lane)
+
+
+def get_synchronization_progress(server):
+    """
+    :return: {queued: problems, problems: done, failed: problems failed, cases: uploaded, bytes: uploaded,
+              throughput: bytes per second or None, running: bool}
+    """
+    client = _redis()
+    with client.pipeline() as pipe:
+        pipe.llen(SYNC_QUEUE % server.pk)
+        pipe.hgetall(SYNC_COUNTER % server.pk)
+        pipe.exists(SYNC_LANE_LOCK % server.pk)
+        queued, counter, running = pipe.execute()
+    counter = {k.decode(): float(v) for k, v in counter.items()}
+    elapsed = counter.get("elapsed", 0)
+    return dict(queued=queued, problems=int(counter.get("problems", 0)), failed=int(counter.get("failed", 0)),
+                cases=int(counter.get("cases", 0)), bytes=int(counter.get("bytes", 0)),
+                throughput=counter.get("bytes", 0) / elapsed if elapsed > 0 else None, running=bool(running))
@@ -1,8 +1,7 @@
+import logging
 import threading
-import traceback
 from datetime import datetime
 
-import multiprocessing
 from django.contrib import messages
 from django.core.cache import cache
 from django.db import transaction
@@ -14,17 +13,21 @@ from django.views.generic.list import ListView
 from django_q.tasks import async_task
 from django_redis import get_redis_connection
 
+from contest.warmup import get_readiness, get_upcoming_contests
 from dispatcher.models import Server, ServerProblemStatus
 from dispatcher.manage import update_token
+from dispatcher.health import get_health
 from dispatcher.semaphore import Semaphore
-from polygon.rejudge import rejudge_submission_set
+from polygon.rejudge import rejudge_submission_set, get_rejudge_progress
 from problem.models import Problem
-from problem.tasks import upload_problem_to_judge_server
 from submission.models import Submission
 from submission.util import SubmissionStatus
 from .forms import ServerEditForm, ServerUpdateTokenForm
+from .synchronize import synchronize_server, get_synchronization_progress
 from ..base_views import BaseCreateView, BaseUpdateView, BaseBackstageMixin
 
+logger = logging.getLogger(__name__)
+
 
 class ServerCreate(BaseCreateView):
     form_class = ServerEditForm
@@ -55,11 +58,12 @@ class ServerList(BaseBackstageMixin, ListView):
         sem.exists_or_init()
         try:
             data['semaphore_available_count'] = sem.available_count
-            data['semaphore_available_keys'] = redis_server.lrange(sem.available_key, 0, sem.available_count) # 1 more actually
-            data['semaphore_available_keys'] = list(map(lambda s: s.decode(), data['semaphore_available_keys']))
+            data['semaphore_available_keys'] = sem.available_tokens
             data['semaphore_grabbed_keys'] = {}
             for key, tt in redis_server.hgetall(sem.grabbed_key).items():
                 data['semaphore_grabbed_keys'][key.decode()] = sem.current_time - float(tt.decode())
+            data['server_health'] = [(server, get_health(server.pk, client=redis_server))
+                                     for server in data['server_list'] if server.enabled]
             data['server_synchronize_status_detail'] = cache.get('server_synchronize_status_detail', '')
             data['server_synchronize_status'] = cache.get('server_synchronize_status', 0)
             data['semaphore_ok'] = True
@@ -67,6 +71,27 @@ class ServerList(BaseBackstageMixin, ListView):
             pass
 
         data['crashed_submission_count'] = Submission.objects.filter(status=SubmissionStatus.SYSTEM_ERROR).count()
+        try:
+            data['rejudge_progress'] = get_rejudge_progress()
+        except:
+            logger.exception("Failed to get rejudge progress")
+        try:
+            data['synchronization_progress'] = []
+            for server in data['server_list']:
+                progress = get_synchronization_progress(server)
+                if progress['queued'] or progress['problems']:
+                    data['synchronization_progress'].append((server, progress))
+        except:
+            logger.exception("Failed to get synchronization progress")
+        try:
+            enabled_servers = [server for server in data['server_list'] if server.enabled]
+            data['contest_readiness'] = []
+            for contest in get_upcoming_contests().order_by("start_time"):
+                readiness = get_readiness(contest)
+                data['contest_readiness'].append((contest, [(server, readiness.get(server.pk))
+                                                            for server in enabled_servers]))
+        except:
+            logger.exception("Failed to get contest readiness")
         return data
 
 
@@ -117,38 +142,20 @@ class ServerUpdateToken(BaseBackstageMixin, FormView):
         return HttpResponseRedirect(reverse('backstage:server'))
 
 
-def sync_and_update_status(server, problem):
-    status, _ = ServerProblemStatus.objects.get_or_create(server=server, problem=problem)
-    try:
-        upload_problem_to_judge_server(problem, server)
-        status.last_status = ''
-    except:
-        status.last_status = traceback.format_exc()
-    status.save()
-
-
-def synchronize_func(server, problems):
-    with multiprocessing.Pool(server.concurrency) as p:
-        p.starmap(sync_and_update_status, [(server, problem) for problem in problems])
-    server.last_synchronize_time = datetime.now()
-    server.save(update_fields=['last_synchronize_time'])
-
-
 class ServerSynchronize(BaseBackstageMixin, View):
 
     def post(self, request, pk):
 
         server = get_object_or_404(Server, pk=pk)
         if request.GET.get("t") == "all":
-            problems = Problem.objects.all()
+            problem_ids = Problem.objects.values_list("id", flat=True)
         elif request.GET.get('t', '').isdigit():
-            problems = Problem.objects.filter(pk=request.GET['t'])
+            problem_ids = Problem.objects.filter(pk=request.GET['t']).values_list("id", flat=True)
         else:
             problem_ids = server.serverproblemstatus_set.select_related("problem").\
                 filter(last_synchronize__lt=F('problem__update_time')).values_list("problem_id", flat=True)
-            problems = Problem.objects.filter(id__in=problem_ids)
 
-        threading.Thread(target=synchronize_func, args=(server, list(problems))).start()
+        synchronize_server(server, problem_ids)
         return HttpResponseRedirect(reverse('backstage:server'))
 
 
@@ -1,6 +1,5 @@
 # Duplicated from dispatcher.tasks to prevent copy-wrong errors...
 
-import requests
 import os
 import threading
 import json
@@ -10,6 +9,7 @@ import traceback
 from django.utils import timezone
 from django.db import transaction
 
+from dispatcher.client import get_session
 from dispatcher.models import Server
 from django.conf import settings
 from problem.models import Problem
@@ -22,6 +22,11 @@ _WORKER_THREAD_NUM = 0
 _WORKER_QUEUE = queue.Queue()
 
 
+def _server_session(server):
+    # the old judge protocol, with its own username
+    return get_session(server.http_address, ('token', server.token))
+
+
 class Dispatcher:
 
     def __init__(self, submission_id):
@@ -64,8 +69,8 @@ class Dispatcher:
             server = Server.objects.get(pk=self.server_id)
             problem_hash = Problem.objects.get(pk=self.problem_id).testdata_hash
             with open(file_path, 'rb') as f:
-                response = requests.post(upload_linker(server.ip, server.port, self.problem_id),
-                                         data=f.read(), auth=('token', server.token)).json()
+                response = _server_session(server).post(upload_linker(server.ip, server.port, self.problem_id),
+                                                        data=f.read()).json()
                 if response['status'] != 'received':
                     raise SystemError('Remote server rejected data send request.', response['message'])
             with transaction.atomic():
@@ -127,9 +132,8 @@ class Dispatcher:
 
                 # Request: wait for one hour
                 server = Server.objects.get(pk=self.server_id)
-                response = requests.post(judge_linker(server.ip, server.port),
-                                         json=request, auth=('token', server.token),
-                                         timeout=3600).json()
+                response = _server_session(server).post(judge_linker(server.ip, server.port),
+                                                        json=request, timeout=3600).json()
                 # print(response)
                 if response['status'] != 'received':
                     raise SystemError('Remote server rejected judge request.', response['message'])
@@ -1,6 +1,8 @@
 from django.shortcuts import render, HttpResponseRedirect, reverse, HttpResponse, redirect
+from django.conf import settings
 from django.db.models import Q
-from utils.site_settings import site_settings_set, SiteSettings
+from utils import instrumentation
+from utils.site_settings import site_settings_set, site_settings_delete, SiteSettings
 from migrate.models import OldSubmission
 from submission.util import SubmissionStatus
 from django.views.generic import ListView, View, TemplateView
@@ -26,12 +28,33 @@ class SiteSettingsUpdate(BaseBackstageMixin, TemplateView):
     def post(self, request):
         key, value = request.POST['key'], request.POST['value']
         if value == '':
-            SiteSettings.objects.filter(key=key).delete()
+            site_settings_delete(key)
         else:
             site_settings_set(key, value)
         return redirect(request.POST['next'])
 
 
+class RequestStatistics(BaseBackstageMixin, TemplateView):
+    """
+    Slowest endpoints and N+1 queries, refer to `utils.instrumentation`
+    """
+
+    template_name = 'backstage/site/requests.jinja2'
+    periods = [(3600, '1 hour'), (6 * 3600, '6 hours'), (86400, '1 day')]
+
+    def get_context_data(self, **kwargs):
+        context = super(RequestStatistics, self).get_context_data(**kwargs)
+        try:
+            period = int(self.request.GET.get('period', 3600))
+        except ValueError:
+            period = 3600
+        context['period'] = period
+        context['periods'] = self.periods
+        context['n_plus_one'] = settings.INSTRUMENTATION_N_PLUS_ONE
+        context['endpoint_list'], context['offender_list'] = instrumentation.report(period)
+        return context
+
+
 class MigrateList(BaseBackstageMixin, ListView):
     template_name = 'backstage/site/migrate.jinja2'
     queryset = OldSubmission.objects.all()
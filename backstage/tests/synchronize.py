@@ -0,0 +1,57 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django_redis import get_redis_connection
+
+from backstage.server import synchronize
+from backstage.server.synchronize import SYNC_QUEUE, SYNC_COUNTER, SYNC_LANE_LOCK, run_synchronization
+
+SERVER_ID = 987654
+
+
+@override_settings(JUDGE_SYNC_BATCH_SIZE=3)
+class SynchronizationTest(SimpleTestCase):
+
+    def setUp(self):
+        self.client = get_redis_connection("judge")
+        self.tearDown()
+        self.client.rpush(SYNC_QUEUE % SERVER_ID, *range(1, 11))
+        server_patch = mock.patch.object(synchronize, "Server")
+        server_patch.start().objects.get.return_value = mock.Mock(pk=SERVER_ID)
+        self.addCleanup(server_patch.stop)
+
+    def tearDown(self):
+        for key in [SYNC_QUEUE, SYNC_COUNTER, SYNC_LANE_LOCK]:
+            self.client.delete(key % SERVER_ID)
+
+    def test_two_lanes(self):
+        synchronized = []
+        calls = {}
+
+        def synchronize_problems(server, problem_ids, client):
+            main = threading.current_thread() is threading.main_thread()
+            calls[main] = calls.get(main, 0) + 1
+            if not main and calls[main] == 2:
+                # the other lane crashes (e.g. its worker is killed) after taking the next batch
+                raise RuntimeError
+            synchronized.extend(problem_ids)
+            if main and calls[main] == 1:
+                # the lock of this lane expires while uploading, and another lane starts over the same queue
+                self.client.delete(SYNC_LANE_LOCK % SERVER_ID)
+                other_lane.start()
+                other_lane.join(10)
+
+        def run_other_lane():
+            try:
+                run_synchronization(SERVER_ID)
+            except RuntimeError:
+                pass
+
+        other_lane = threading.Thread(target=run_other_lane)
+        with mock.patch.object(synchronize, "_synchronize_problems", side_effect=synchronize_problems):
+            run_synchronization(SERVER_ID)
+        self.assertEqual(2, calls[False])
+        self.assertEqual(set(range(1, 11)), set(synchronized))
+        self.assertEqual(0, self.client.llen(SYNC_QUEUE % SERVER_ID))
+        self.assertFalse(self.client.exists(SYNC_LANE_LOCK % SERVER_ID))
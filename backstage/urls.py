@@ -12,7 +12,7 @@ from .problem.views import ProblemList, ProblemVisibleSwitch, ProblemTagList, Pr
     ProblemArchiveList, ProblemArchiveEdit, ProblemArchiveCreate, ProblemSourceBatchEdit, ProblemTagDelete
 from .server.views import ServerCreate, ServerUpdate, ServerList, ServerDelete, ServerRefresh, ServerEnableOrDisable, \
     ServerUpdateToken, ServerSynchronize, ServerProblemStatusList, ServerSemaphoreReset, RejudgeAllCrashedSubmission
-from .site.views import SiteSettingsUpdate, MigrateList, OldSubmissionQuery, OldSubmissionRejudge
+from .site.views import SiteSettingsUpdate, MigrateList, OldSubmissionQuery, OldSubmissionRejudge, RequestStatistics
 from .blog.views import BlogList, BlogRecommendSwitch, BlogVisibleSwitch
 from .log.views import UpdateLogList, UpdateLogCreate, UpdateLogDelete
 
@@ -60,6 +60,7 @@ urlpatterns = [
     url(r'^server/rejudge/crashed/$', RejudgeAllCrashedSubmission.as_view(), name='rejudge_crashed_submission'),
 
     url(r'^site/$', SiteSettingsUpdate.as_view(), name='site'),
+    url(r'^site/requests/$', RequestStatistics.as_view(), name='requests'),
     url(r'^migrate/$', MigrateList.as_view(), name='migrate'),
     url(r'^migrate/code/(?P<submission_id>\d+)/', OldSubmissionQuery.as_view(), name='migrate_code'),
     url(r'^migrate/rejudge/(?P<submission_id>\d+)/', OldSubmissionRejudge.as_view(), name='migrate_rejudge'),
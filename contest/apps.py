@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ContestConfig(AppConfig):
+    name = 'contest'
+
+    def ready(self):
+        # receivers keeping the standings index and checkpoints of the timeline up to date
+        from . import incremental
@@ -0,0 +1,446 @@
+"""
+Redis-backed state for updating standings one submission at a time.
+
+`StandingsIndex` keeps all participants of a contest in a sorted set (ordered lexicographically the same way
+as `ContestParticipant.Meta.ordering`), so the rank of a participant is found with a few O(log n) lookups
+instead of walking through the whole standings.
+
+`ProblemContributionIndex` keeps what each user contributes to the statistics of each contest problem
+(refer to `contest.statistics.problem_contributions`), together with running totals, so a verdict only
+replaces one contribution.
+
+Both are rebuilt from database when missing; refer to `contest.statistics.apply_submission_to_standings`.
+
+`TimelineIndex` keeps checkpoints of standings state along contest time, refer to `contest.timeline`.
+"""
+
+import json
+import pickle
+import time
+import zlib
+from datetime import timedelta
+from math import fsum
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from submission.models import Submission
+from .models import Contest, ContestParticipant, ContestProblem
+
+INDEX_TIMEOUT = 86400 * 3
+
+CONTEST_PROBLEM_STATISTICS_FIELDS = ["ac_user_count", "total_user_count", "ac_count", "total_count",
+                                     "first_yes_time", "first_yes_by", "max_score", "avg_score"]
+
+# fields of participants that standings depend on
+STANDINGS_FIELDS = {"score", "penalty", "is_confirmed", "star"}
+
+SCORE_OFFSET = 10 ** 11
+PENALTY_OFFSET = 10 ** 14
+STAR_POSITION = 28
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+class StandingsIndex(object):
+
+    def __init__(self, contest: Contest, client=None):
+        self.contest = contest
+        self.client = client or _redis()
+        self.prefix = "STANDINGS:%d" % contest.pk
+        self.all_key = self.prefix + ":RANK"
+        self.unstarred_key = self.prefix + ":RANK_UNSTARRED"
+        self.member_key = self.prefix + ":MEMBER"
+        self.ready_key = self.prefix + ":READY"
+
+    @staticmethod
+    def encode_key(is_confirmed, score, penalty):
+        return "%d%012d%015d" % (0 if is_confirmed else 1, SCORE_OFFSET + min(-score, SCORE_OFFSET - 1),
+                                 PENALTY_OFFSET + penalty)
+
+    def encode(self, user_id, is_confirmed, score, penalty, star):
+        return "%s%d:%d" % (self.encode_key(is_confirmed, score, penalty), 1 if star else 0, user_id)
+
+    def rank_prefix(self, member):
+        """
+        Members sharing a rank prefix (within the same confirmed group) share a rank,
+        same as `find_key` in `participants_with_rank`
+        """
+        return member[:13 + (15 if self.contest.penalty_counts else 0)]
+
+    @property
+    def ready(self):
+        return self.client.exists(self.ready_key)
+
+    def rebuild(self, rows=None):
+        """
+        :param rows: list of (user_id, is_confirmed, score, penalty, star), load from database if None
+        """
+        if rows is None:
+            rows = self.contest.contestparticipant_set.values_list("user_id", "is_confirmed", "score", "penalty",
+                                                                   "star")
+        members = {user_id: self.encode(user_id, *rest) for user_id, *rest in rows}
+        unstarred = [m for m in members.values() if m[STAR_POSITION] == '0']
+        with self.client.pipeline() as pipe:
+            pipe.delete(self.all_key, self.unstarred_key, self.member_key)
+            if members:
+                pipe.zadd(self.all_key, {m: 0 for m in members.values()})
+                pipe.hmset(self.member_key, members)
+            if unstarred:
+                pipe.zadd(self.unstarred_key, {m: 0 for m in unstarred})
+            pipe.set(self.ready_key, 1)
+            for key in (self.all_key, self.unstarred_key, self.member_key, self.ready_key):
+                pipe.expire(key, INDEX_TIMEOUT)
+            pipe.execute()
+
+    def update(self, user_id, is_confirmed, score, penalty, star):
+        if not self.ready:
+            return
+        member = self.encode(user_id, is_confirmed, score, penalty, star)
+        old_member = self.client.hget(self.member_key, user_id)
+        with self.client.pipeline() as pipe:
+            if old_member is not None:
+                pipe.zrem(self.all_key, old_member)
+                pipe.zrem(self.unstarred_key, old_member)
+            pipe.zadd(self.all_key, {member: 0})
+            if not star:
+                pipe.zadd(self.unstarred_key, {member: 0})
+            pipe.hset(self.member_key, user_id, member)
+            pipe.execute()
+
+    def remove(self, user_id):
+        if not self.ready:
+            return
+        old_member = self.client.hget(self.member_key, user_id)
+        if old_member is not None:
+            with self.client.pipeline() as pipe:
+                pipe.zrem(self.all_key, old_member)
+                pipe.zrem(self.unstarred_key, old_member)
+                pipe.hdel(self.member_key, user_id)
+                pipe.execute()
+
+    def _rank_in(self, key, member):
+        """
+        1 + number of members before the first one that shares rank with `member`
+        """
+        prefix = self.rank_prefix(member)
+        rank = self.client.zlexcount(key, '-', '(' + prefix)
+        if prefix[0] == '1':
+            # unconfirmed ones tie with the last confirmed ones if they share the same key
+            last_confirmed = self.client.zrevrangebylex(key, '(1', '-', start=0, num=1)
+            if last_confirmed and self.rank_prefix(last_confirmed[0].decode())[1:] == prefix[1:]:
+                rank = self.client.zlexcount(key, '-', '(0' + prefix[1:])
+        return rank + 1
+
+    def get_rank(self, user_id):
+        """
+        :return: (rank, actual_rank), same as `participants_with_rank`; None if user does not participate
+        """
+        member = self.client.hget(self.member_key, user_id)
+        if member is None:
+            return None
+        member = member.decode()
+        rank = self._rank_in(self.all_key, member)
+        if member[STAR_POSITION] == '1':
+            return rank, 0
+        return rank, self._rank_in(self.unstarred_key, member)
+
+
+class ProblemContributionIndex(object):
+
+    def __init__(self, contest: Contest, problem_id, client=None):
+        self.contest = contest
+        self.problem_id = problem_id
+        self.client = client or _redis()
+        self.prefix = "STANDINGS:%d:PROBLEM:%d" % (contest.pk, problem_id)
+        self.lock_key = self.prefix + ":LOCK"
+        self.contribution_key = self.prefix + ":CONTRIBUTION"
+        self.best_key = self.prefix + ":BEST"
+        self.first_yes_key = self.prefix + ":FIRST_YES"
+        self.counter_key = self.prefix + ":COUNTER"
+
+    @property
+    def ready(self):
+        return self.client.exists(self.counter_key)
+
+    def lock(self):
+        """
+        Contributions are read-modify-write, so updates on one problem (and saving the aggregates) are serialized
+        """
+        return self.client.lock(self.lock_key, timeout=60)
+
+    def rebuild(self, contributions: dict):
+        """
+        :param contributions: {<user_id>: contribution}
+        """
+        with self.client.pipeline() as pipe:
+            pipe.delete(self.contribution_key, self.best_key, self.first_yes_key, self.counter_key)
+            counter = dict(ac=0, tot=0, ac_user=0)
+            for user_id, c in contributions.items():
+                self._add(pipe, user_id, c, counter)
+            pipe.hmset(self.counter_key, counter)
+            for key in (self.contribution_key, self.best_key, self.first_yes_key, self.counter_key):
+                pipe.expire(key, INDEX_TIMEOUT)
+            pipe.execute()
+
+    def _add(self, pipe, user_id, c, counter):
+        pipe.hset(self.contribution_key, user_id, json.dumps(c))
+        pipe.zadd(self.best_key, {user_id: c["best"]})
+        if c["first_yes"] is not None:
+            pipe.zadd(self.first_yes_key, {json.dumps(c["first_yes"]): c["first_yes"][0]})
+        counter["ac"] += c["ac"]
+        counter["tot"] += c["tot"]
+        counter["ac_user"] += 1 if c["ac"] > 0 else 0
+
+    def replace(self, user_id, c):
+        """
+        :param c: new contribution of user, None if there is none
+        """
+        old = self.client.hget(self.contribution_key, user_id)
+        delta = dict(ac=0, tot=0, ac_user=0)
+        with self.client.pipeline() as pipe:
+            if old is not None:
+                old = json.loads(old)
+                pipe.hdel(self.contribution_key, user_id)
+                pipe.zrem(self.best_key, user_id)
+                if old["first_yes"] is not None:
+                    pipe.zrem(self.first_yes_key, json.dumps(old["first_yes"]))
+                delta = dict(ac=-old["ac"], tot=-old["tot"], ac_user=-1 if old["ac"] > 0 else 0)
+            if c is not None:
+                self._add(pipe, user_id, c, delta)
+            for k, v in delta.items():
+                pipe.hincrby(self.counter_key, k, v)
+            pipe.execute()
+
+    def aggregate(self, p):
+        """
+        Same as `contest.statistics.aggregate_problem`, with running totals.
+        :param p: ContestProblem
+        """
+        with self.client.pipeline() as pipe:
+            pipe.hgetall(self.counter_key)
+            pipe.zrange(self.best_key, 0, -1, withscores=True)
+            pipe.zrange(self.first_yes_key, 0, 0)
+            counter, best, first_yes = pipe.execute()
+        counter = {k.decode(): int(v) for k, v in counter.items()}
+        best = [score for _, score in best]
+        first_yes = json.loads(first_yes[0]) if first_yes else None
+        p.ac_user_count = counter["ac_user"]
+        p.total_user_count = len(best)
+        p.ac_count = counter["ac"]
+        p.total_count = counter["tot"]
+        p.first_yes_time = timedelta(microseconds=first_yes[1]) if first_yes is not None else None
+        p.first_yes_by = first_yes[2] if first_yes is not None else None
+        p.max_score = best[-1] if best else 0.0
+        p.avg_score = fsum(best) / len(best) if best else 0.0
+
+
+class TimelineIndex(object):
+    """
+    Pair k is (checkpoint k: state after submissions with contest time <= k * interval,
+    chunk k: submissions with contest time in (k * interval, (k + 1) * interval]).
+
+    Pairs [0, valid) are up-to-date. A change of submission at contest time t truncates them to those ending
+    before t, so the pairs of the past are kept while a contest (or a virtual participation) goes on.
+    """
+
+    COMMIT_SCRIPT = """
+    if redis.call('get', KEYS[2]) == ARGV[1] then
+        redis.call('set', KEYS[1], ARGV[2], 'ex', ARGV[3])
+        return 1
+    end
+    return 0
+    """
+
+    TRUNCATE_SCRIPT = """
+    redis.call('incr', KEYS[2])
+    redis.call('expire', KEYS[2], ARGV[2])
+    if tonumber(redis.call('get', KEYS[1]) or '0') > tonumber(ARGV[1]) then
+        redis.call('set', KEYS[1], ARGV[1], 'ex', ARGV[2])
+    end
+    """
+
+    def __init__(self, contest_id, interval: timedelta=None, client=None):
+        self.client = client or _redis()
+        self.interval = interval or timedelta(minutes=settings.STANDINGS_CHECKPOINT_INTERVAL)
+        self.prefix = "STANDINGS:%d:TIMELINE:%d" % (contest_id, self.interval.total_seconds())
+        self.valid_key = self.prefix + ":VALID"
+        # changes whenever pairs are truncated, so that a build started before that does not commit
+        self.epoch_key = self.prefix + ":EPOCH"
+        self.building_key = self.prefix + ":BUILDING"
+
+    def pair_key(self, k):
+        return self.prefix + ":PAIR:%d" % k
+
+    def index_of(self, contest_time: timedelta):
+        """
+        Index of the last checkpoint not later than `contest_time`
+        """
+        return max(contest_time // self.interval, 0)
+
+    def chunk_of(self, contest_time: timedelta):
+        """
+        Index of the chunk containing a submission at `contest_time` (checkpoint 0 contains those before start)
+        """
+        if contest_time <= timedelta():
+            return 0
+        return (contest_time - timedelta(microseconds=1)) // self.interval
+
+    def state(self):
+        """
+        :return: (number of valid pairs, epoch)
+        """
+        with self.client.pipeline() as pipe:
+            pipe.setnx(self.epoch_key, 0)
+            pipe.expire(self.epoch_key, INDEX_TIMEOUT)
+            pipe.get(self.valid_key)
+            pipe.get(self.epoch_key)
+            _, _, valid, epoch = pipe.execute()
+        return int(valid or 0), epoch
+
+    def load(self, k):
+        """
+        :return: (pickled checkpoint, list of events in chunk), None if missing
+        """
+        pair = self.client.get(self.pair_key(k))
+        if pair is None:
+            return None
+        return pickle.loads(zlib.decompress(pair))
+
+    def acquire_build(self):
+        return self.client.set(self.building_key, 1, ex=60, nx=True)
+
+    def release_build(self):
+        self.client.delete(self.building_key)
+
+    def commit(self, epoch, start, pairs):
+        """
+        Save pairs [start, start + len(pairs)), which take effect only if nothing changed since `epoch`
+        """
+        with self.client.pipeline() as pipe:
+            for k, pair in enumerate(pairs, start=start):
+                pipe.set(self.pair_key(k), zlib.compress(pickle.dumps(pair, pickle.HIGHEST_PROTOCOL), 1),
+                         ex=INDEX_TIMEOUT)
+            pipe.execute()
+        self.client.eval(self.COMMIT_SCRIPT, 2, self.valid_key, self.epoch_key,
+                         epoch, start + len(pairs), INDEX_TIMEOUT)
+
+    def truncate(self, valid):
+        self.client.eval(self.TRUNCATE_SCRIPT, 2, self.valid_key, self.epoch_key, valid, INDEX_TIMEOUT)
+
+    def truncate_at(self, contest_time: timedelta):
+        self.truncate(self.chunk_of(contest_time))
+
+
+def _standings_version_key(contest_id, frozen=False):
+    return "STANDINGS_VERSION:%d%s" % (contest_id, ":FROZEN" if frozen else "")
+
+
+def get_standings_version(contest_id, frozen=False):
+    """
+    Version of standings, which changes whenever a participant or a contest problem of the contest changes.
+    Snapshots of standings are keyed by it, refer to `contest.statistics.get_contest_rank_snapshot`.
+
+    :param frozen: version of standings as of freeze time, which does not change with verdicts after freeze
+    """
+    # start from current time, so that a version key recreated after expiring never repeats an old version
+    return cache.get_or_set(_standings_version_key(contest_id, frozen), int(time.time() * 1000), INDEX_TIMEOUT)
+
+
+def bump_standings_version(contest_id, public=True, frozen=True):
+    """
+    :param public: whether standings change
+    :param frozen: whether standings as of freeze time change
+    """
+    for variant, bump in ((False, public), (True, frozen)):
+        if bump:
+            try:
+                cache.incr(_standings_version_key(contest_id, variant))
+            except ValueError:
+                pass
+
+
+def _freeze_offset_key(contest_id):
+    return "CONTEST_FREEZE_OFFSET:%d" % contest_id
+
+
+def get_freeze_offset(contest_id):
+    """
+    :return: contest time of freeze, None if the contest is not frozen; cached until the contest is saved
+    """
+    def load():
+        contest = Contest.objects.filter(pk=contest_id).only("freeze", "freeze_time", "start_time").first()
+        if contest is None or not contest.freeze or contest.freeze_time is None or contest.start_time is None:
+            return -1
+        return (contest.freeze_time - contest.start_time).total_seconds()
+
+    offset = cache.get_or_set(_freeze_offset_key(contest_id), load, INDEX_TIMEOUT)
+    return None if offset < 0 else timedelta(seconds=offset)
+
+
+def clear_final_ranks(contest_id):
+    """
+    Saved ranks of an ended contest are cleared once standings change, refer to `contest.statistics.save_final_ranks`
+    """
+    ContestParticipant.objects.filter(contest_id=contest_id, final_rank__isnull=False).update(final_rank=None)
+
+
+@receiver(post_save, sender=ContestParticipant)
+def update_participant_in_index(sender, instance, created=False, update_fields=None, **kwargs):
+    StandingsIndex(Contest(pk=instance.contest_id, penalty_counts=0)).update(
+        instance.user_id, instance.is_confirmed, instance.score, instance.penalty, instance.star)
+    # scores of participants are calculated again for frozen standings, where only who participates matters
+    bump_standings_version(instance.contest_id, frozen=created or update_fields is None or "star" in update_fields)
+    # ranks are only saved for ended contests, so this costs nothing while a contest is running
+    if instance.final_rank is not None and \
+            (update_fields is None or STANDINGS_FIELDS.intersection(update_fields)):
+        clear_final_ranks(instance.contest_id)
+        instance.final_rank = None
+
+
+@receiver(post_delete, sender=ContestParticipant)
+def remove_participant_from_index(sender, instance, **kwargs):
+    StandingsIndex(Contest(pk=instance.contest_id, penalty_counts=0)).remove(instance.user_id)
+    bump_standings_version(instance.contest_id)
+    if instance.final_rank is not None:
+        clear_final_ranks(instance.contest_id)
+
+
+@receiver(post_save, sender=ContestProblem)
+@receiver(post_delete, sender=ContestProblem)
+def contest_problem_changed(sender, instance, update_fields=None, **kwargs):
+    # statistics are saved after each verdict, while the details of standings do not depend on them
+    statistics_only = update_fields is not None and set(update_fields).issubset(CONTEST_PROBLEM_STATISTICS_FIELDS)
+    # frozen standings calculate statistics as of freeze time by themselves
+    bump_standings_version(instance.contest_id, frozen=not statistics_only)
+    if not statistics_only:
+        TimelineIndex(instance.contest_id).truncate(0)
+
+
+@receiver(post_save, sender=Contest)
+def contest_changed(sender, instance, **kwargs):
+    TimelineIndex(instance.pk).truncate(0)
+    cache.delete(_freeze_offset_key(instance.pk))
+    bump_standings_version(instance.pk)
+
+
+TIMELINE_SUBMISSION_FIELDS = {"status", "status_percent", "create_time", "contest_time", "contest", "author",
+                              "problem"}
+
+
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+def submission_changed(sender, instance, update_fields=None, **kwargs):
+    if instance.contest_id is None or instance.contest_time is None:
+        return
+    if update_fields is not None and not TIMELINE_SUBMISSION_FIELDS.intersection(update_fields):
+        return
+    TimelineIndex(instance.contest_id).truncate_at(instance.contest_time)
+    freeze = get_freeze_offset(instance.contest_id)
+    if freeze is not None and instance.contest_time <= freeze:
+        bump_standings_version(instance.contest_id, public=False)
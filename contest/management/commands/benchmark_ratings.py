@@ -0,0 +1,48 @@
+import random
+import time
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand
+
+from contest.ratings import RatingContestant, _process, _process_naive
+
+
+def synthetic_contestants(rand, ratings, noise=600, point_size=50):
+    """
+    Contestants of a contest, also used by tests of ratings
+
+    :param ratings: ratings of users 1, 2, ...
+    :return: contestants whose points are their ratings, plus noise of at most `noise`, in units of `point_size`
+             (stronger contestants tend to get more points)
+    """
+    return [RatingContestant(user, 0, max(rating + rand.randint(-noise, noise), 0) // point_size, rating)
+            for user, rating in enumerate(ratings, start=1)]
+
+
+class Command(BaseCommand):
+    help = "Time rating calculation on synthetic contests, and check deltas against the naive implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+        parser.add_argument('--naive-limit', type=int, default=1000,
+                            help="run the naive O(n^2 log R) implementation only on contests up to this size")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rand = random.Random(options['seed'])
+        self.stdout.write("%10s %12s %12s %10s" % ("size", "naive (s)", "fast (s)", "same"))
+        for size in options['sizes']:
+            contestants = synthetic_contestants(rand, [int(rand.gauss(1500, 350)) for _ in range(size)])
+            naive_time, same = None, None
+            if size <= options['naive_limit']:
+                expected = deepcopy(contestants)
+                start = time.time()
+                _process_naive(expected)
+                naive_time = time.time() - start
+            start = time.time()
+            _process(contestants)
+            fast_time = time.time() - start
+            if naive_time is not None:
+                same = {c.user: c.delta for c in expected} == {c.user: c.delta for c in contestants}
+            self.stdout.write("%10d %12s %12.3f %10s" % (size, "%.3f" % naive_time if naive_time is not None else "-",
+                                                         fast_time, "-" if same is None else same))
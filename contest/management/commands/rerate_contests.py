@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from contest.models import Contest, ContestUserRating
+from contest.ratings import recalculate_rating_changes
+
+
+class Command(BaseCommand):
+    help = "Rate rated contests again in chronological order, e.g. after standings of one of them changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('since', type=int, help="primary key of the first contest to rate again")
+        parser.add_argument('--until', type=int, help="primary key of the last contest to rate again")
+
+    def handle(self, *args, **options):
+        try:
+            first = Contest.objects.get(pk=options['since'])
+            last = Contest.objects.get(pk=options['until']) if options['until'] else None
+        except Contest.DoesNotExist:
+            raise CommandError("Contest does not exist")
+        rated_contest_ids = ContestUserRating.objects.values_list("contest_id", flat=True).distinct()
+        contests = Contest.objects.filter(pk__in=rated_contest_ids, end_time__gte=first.end_time)
+        if last is not None:
+            contests = contests.filter(end_time__lte=last.end_time)
+        contests = list(contests.order_by("end_time", "pk"))
+        recalculate_rating_changes(contests)
+        self.stdout.write("%d contests rated: %s" % (len(contests), ", ".join(str(c.pk) for c in contests)))
@@ -0,0 +1,26 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from contest.models import Contest
+from contest.statistics import save_final_ranks
+
+
+class Command(BaseCommand):
+    help = "Save ranks of participants of ended contests, read by profiles (refer to contest.statistics." \
+           "save_final_ranks), e.g. for contests ended before ranks were saved"
+
+    def add_arguments(self, parser):
+        parser.add_argument('contests', type=int, nargs='*', help="primary keys of contests, all ended by default")
+
+    def handle(self, *args, **options):
+        contests = Contest.objects.filter(end_time__lt=datetime.now())
+        if options['contests']:
+            contests = contests.filter(pk__in=options['contests'])
+        start, count = time.time(), 0
+        for contest in contests.order_by("pk").iterator():
+            ranks = save_final_ranks(contest)
+            count += len(ranks)
+            self.stdout.write("%d: %d participants" % (contest.pk, len(ranks)))
+        self.stdout.write("%d ranks saved in %.1f s" % (count, time.time() - start))
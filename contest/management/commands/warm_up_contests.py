@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+from django_q.tasks import schedule
+
+from contest.models import Contest
+from contest.warmup import warm_up_contest, get_upcoming_contests
+from dispatcher.models import Server
+
+WARMUP_TASK = "contest.warmup.warm_up_upcoming_contests"
+
+
+class Command(BaseCommand):
+    help = "Push test data of upcoming contests to all enabled judge servers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('contest', nargs='*', type=int, help="ids of contests, upcoming ones by default")
+        parser.add_argument('--schedule', action='store_true',
+                            help="warm up upcoming contests every 5 minutes with django-q, instead of now")
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            if not Schedule.objects.filter(func=WARMUP_TASK).exists():
+                schedule(WARMUP_TASK, name="warm up contests", schedule_type=Schedule.MINUTES, minutes=5)
+            self.stdout.write("Scheduled every 5 minutes.")
+            return
+        contests = Contest.objects.filter(pk__in=options['contest']) if options['contest'] else get_upcoming_contests()
+        servers = {server.pk: server for server in Server.objects.all()}
+        for contest in contests:
+            for server_id, readiness in warm_up_contest(contest).items():
+                self.stdout.write("%s on %s: %s" % (contest, servers[server_id].name,
+                                                    "ready" if readiness["ready"] else
+                                                    "%d cases missing %s" % (readiness["missing"], readiness["error"])))
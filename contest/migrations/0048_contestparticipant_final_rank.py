@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0047_auto_20181113_2038'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contestparticipant',
+            name='final_rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
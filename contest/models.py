@@ -260,6 +260,8 @@ class ContestParticipant(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     join_time = models.DateTimeField(blank=True, null=True) # default: join when contest begins
     is_confirmed = models.BooleanField(default=False)
+    # actual rank in public standings of the ended contest, None if not saved (refer to contest.statistics)
+    final_rank = models.IntegerField(blank=True, null=True)
 
     def start_time(self, contest: Contest):
         # the contest should be a cached contest
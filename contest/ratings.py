@@ -1,10 +1,18 @@
 from math import sqrt
 
-from contest.statistics import get_contest_rank
+import numpy as np
+from django.db import transaction
+
+from contest.statistics import get_contest_rank, save_final_ranks
 from contest.models import ContestUserRating, Contest
 
 
 INITIAL_RATING = 1500
+# bounds of the binary search in `_get_rating_to_rank`
+RATING_LOWER_BOUND, RATING_UPPER_BOUND = 1, 8000
+# seeds closer than this to the rank compared with are recalculated the same way as `_process_naive`,
+# so that rounding errors of vectorized sums never change a delta
+SEED_TOLERANCE = 1E-6
 
 
 class RatingContestant:
@@ -33,9 +41,10 @@ def get_previous_ratings(contest: Contest):
     return result
 
 
-def calculate_rating_changes(contest: Contest):
-    clear_previous_ratings(contest)
-    previous_ratings = get_previous_ratings(contest)
+def _rating_contestants(contest: Contest, previous_ratings: dict):
+    """
+    :return: (contestants, {user_id: solved}, {user_id: rank})
+    """
     standing_rows = get_contest_rank(contest)
     contestants = []
     query_solved, query_rank = {}, {}
@@ -43,18 +52,61 @@ def calculate_rating_changes(contest: Contest):
         if not standing_row.get("actual_rank"):
             continue
         user, rank = standing_row["user"], standing_row["actual_rank"]
-        contestants.append(RatingContestant(user, rank, standing_row["score"], previous_ratings[user]))
+        contestants.append(RatingContestant(user, rank, standing_row["score"],
+                                            previous_ratings.get(user, INITIAL_RATING)))
         query_solved[user] = sum(map(lambda detail: int(detail["solved"]), standing_row["detail"].values()))
         query_rank[user] = rank
+    return contestants, query_solved, query_rank
+
+
+def _rate_contest(contest: Contest, previous_ratings: dict):
+    contestants, query_solved, query_rank = _rating_contestants(contest, previous_ratings)
     _process(contestants)
 
-    new_ratings = list(map(lambda contestant: ContestUserRating(rating=contestant.rating + contestant.delta,
-                                                                user_id=contestant.user,
-                                                                contest=contest,
-                                                                modified=contest.end_time,
-                                                                solved=query_solved[contestant.user],
-                                                                rank=query_rank[contestant.user]), contestants))
-    ContestUserRating.objects.bulk_create(new_ratings)
+    return list(map(lambda contestant: ContestUserRating(rating=contestant.rating + contestant.delta,
+                                                         user_id=contestant.user,
+                                                         contest=contest,
+                                                         modified=contest.end_time,
+                                                         solved=query_solved[contestant.user],
+                                                         rank=query_rank[contestant.user]), contestants))
+
+
+def calculate_rating_changes(contest: Contest):
+    clear_previous_ratings(contest)
+    previous_ratings = get_previous_ratings(contest)
+    ContestUserRating.objects.bulk_create(_rate_contest(contest, previous_ratings))
+    save_final_ranks(contest)
+
+
+def recalculate_rating_changes(contests: list):
+    """
+    Rate contests again in chronological order, each one based on the ratings after the ones before it.
+
+    :param contests: rated contests, ratings of other contests ending in the same period are kept as is
+    """
+    contests = sorted(contests, key=lambda c: (c.end_time, c.pk))
+    if not contests:
+        return
+    contest_ids = [contest.pk for contest in contests]
+    with transaction.atomic():
+        ContestUserRating.objects.filter(contest_id__in=contest_ids).delete()
+        # ratings of other contests are applied in the same order
+        other_ratings = list(ContestUserRating.objects.filter(modified__gte=contests[0].end_time).
+                             order_by("modified").values_list("modified", "user_id", "rating"))
+        current_ratings = {}
+        for user_id, rating in ContestUserRating.objects.filter(modified__lt=contests[0].end_time).\
+                order_by("modified").values_list("user_id", "rating"):
+            current_ratings[user_id] = rating
+        other_index = 0
+        for contest in contests:
+            while other_index < len(other_ratings) and other_ratings[other_index][0] < contest.end_time:
+                _, user_id, rating = other_ratings[other_index]
+                current_ratings[user_id] = rating
+                other_index += 1
+            new_ratings = _rate_contest(contest, current_ratings)
+            ContestUserRating.objects.bulk_create(new_ratings)
+            for rating in new_ratings:
+                current_ratings[rating.user_id] = rating.rating
 
 
 def clear_previous_ratings(contest: Contest):
@@ -112,7 +164,10 @@ def _reassign_ranks(contestants: list):
         contestants[j].rank = rank
 
 
-def _process(contestants):
+def _process_naive(contestants):
+    """
+    Reference implementation of `_process`, in O(n^2 log R)
+    """
     if len(contestants) == 0:
         return
     _reassign_ranks(contestants)
@@ -126,6 +181,76 @@ def _process(contestants):
         contestant.need_rating = _get_rating_to_rank(contestants, mid_rank)
         contestant.delta = int((contestant.need_rating - contestant.rating) / 2)
 
+    _adjust_deltas(contestants)
+    _validate_deltas(contestants)
+
+
+def _get_seed_table(ratings, low: int, high: int):
+    """
+    :param ratings: array of ratings of contestants
+    :return: array of `_get_seed(contestants, r)` for r in [low, high]
+    """
+    values, counts = np.unique(ratings, return_counts=True)
+    counts = counts.astype(np.float64)
+    table = np.empty(high - low + 1)
+    block = max(1, (1 << 20) // len(values))
+    for start in range(low, high + 1, block):
+        r = np.arange(start, min(start + block, high + 1), dtype=np.float64)
+        table[start - low:start - low + len(r)] = \
+            1 + (1 / (1 + np.power(10, (r[:, None] - values[None, :]) / 400))) @ counts
+    return table
+
+
+def _process(contestants):
+    """
+    Same as `_process_naive`, in O(n log n + R * D) where D is the number of distinct ratings.
+
+    Since seeds only depend on ratings, `_get_seed` is tabulated for all ratings with vectorized sums,
+    and binary searches run on all contestants at once.
+    """
+    if len(contestants) == 0:
+        return
+    _reassign_ranks(contestants)
+    ratings = np.array([c.rating for c in contestants], dtype=np.int64)
+    low = min(RATING_LOWER_BOUND, int(ratings.min()))
+    high = max(RATING_UPPER_BOUND, int(ratings.max()))
+    seed_table = _get_seed_table(ratings, low, high)
+
+    # `a.seed` excludes a itself, who wins against itself with probability 0.5
+    seeds = seed_table[ratings - low] - 0.5
+    mid_ranks = np.sqrt(np.array([c.rank for c in contestants]) * seeds)
+    left = np.full(len(contestants), RATING_LOWER_BOUND, dtype=np.int64)
+    right = np.full(len(contestants), RATING_UPPER_BOUND, dtype=np.int64)
+    ambiguous = np.zeros(len(contestants), dtype=bool)
+    while True:
+        active = right - left > 1
+        if not active.any():
+            break
+        mid = (left + right) // 2
+        seed = seed_table[mid - low]
+        ambiguous |= active & (np.abs(seed - mid_ranks) <= SEED_TOLERANCE)
+        go_left = active & (seed < mid_ranks)
+        go_right = active & ~go_left
+        right = np.where(go_left, mid, right)
+        left = np.where(go_right, mid, left)
+
+    for i, contestant in enumerate(contestants):
+        if ambiguous[i]:
+            contestant.seed = 1
+            for b in contestants:
+                if contestant.user != b.user:
+                    contestant.seed += _get_elo_win_probability(b, contestant)
+            contestant.need_rating = _get_rating_to_rank(contestants, sqrt(contestant.rank * contestant.seed))
+        else:
+            contestant.seed = float(seeds[i])
+            contestant.need_rating = int(left[i])
+        contestant.delta = int((contestant.need_rating - contestant.rating) / 2)
+
+    _adjust_deltas(contestants)
+    _validate_deltas(contestants)
+
+
+def _adjust_deltas(contestants):
     _sort_by_rating_desc(contestants)
 
     sum_delta = sum(map(lambda c: c.delta, contestants))
@@ -139,17 +264,48 @@ def _process(contestants):
     for contestant in contestants:
         contestant.delta += inc
 
-    _validate_deltas(contestants)
+
+class _PrefixMin:
+    """
+    Fenwick tree of (value, contestant), for minimum of the first k positions
+    """
+
+    def __init__(self, size):
+        self.tree = [None] * (size + 1)
+
+    def update(self, position, value, contestant):
+        position += 1
+        while position < len(self.tree):
+            if self.tree[position] is None or value < self.tree[position][0]:
+                self.tree[position] = (value, contestant)
+            position += position & -position
+
+    def query(self, k):
+        result = None
+        while k > 0:
+            if self.tree[k] is not None and (result is None or self.tree[k][0] < result[0]):
+                result = self.tree[k]
+            k -= k & -k
+        return result
 
 
 def _validate_deltas(contestants):
+    """
+    For any contestant placed before another one (in points desc):
+    1. if rated higher, the new rating should not be lower;
+    2. if rated lower, the delta should not be lower.
+    """
     _sort_by_points_desc(contestants)
-    for i in range(len(contestants)):
-        for j in range(i + 1, len(contestants)):
-            if contestants[i].rating > contestants[j].rating:
-                if contestants[i].rating + contestants[i].delta < contestants[j].rating + contestants[j].delta:
-                    raise ValueError("First rating invariant failed: %d vs. %d." % (contestants[i].user, contestants[j].user))
-            elif contestants[i].rating < contestants[j].rating:
-                if contestants[i].delta < contestants[j].delta:
-                    raise ValueError(
-                        "Second rating invariant failed: %d vs. %d." % (contestants[i].user, contestants[j].user))
+    ratings = sorted(set(c.rating for c in contestants))
+    position = {rating: i for i, rating in enumerate(ratings)}
+    higher, lower = _PrefixMin(len(ratings)), _PrefixMin(len(ratings))
+    for b in contestants:
+        p = position[b.rating]
+        a = higher.query(len(ratings) - 1 - p)
+        if a is not None and a[0] < b.rating + b.delta:
+            raise ValueError("First rating invariant failed: %d vs. %d." % (a[1].user, b.user))
+        a = lower.query(p)
+        if a is not None and a[0] < b.delta:
+            raise ValueError("Second rating invariant failed: %d vs. %d." % (a[1].user, b.user))
+        higher.update(len(ratings) - 1 - p, b.rating + b.delta, b)
+        lower.update(p, b.delta, b)
@@ -1,10 +1,12 @@
+import json
 import zipfile
 from collections import Counter
+from datetime import timedelta
 from os import path
 
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, Http404
 from django.shortcuts import HttpResponseRedirect, reverse
 from django.views.generic import View
 from django.views.generic.list import ListView
@@ -15,7 +17,8 @@ from utils.csv_writer import write_csv
 from utils.download import respond_generate_file
 from utils.language import LANG_EXT
 from .models import ContestParticipant
-from .statistics import get_contest_rank, invalidate_contest, calculate_problems
+from .statistics import get_contest_rank, get_contest_rank_snapshot, invalidate_contest, calculate_problems
+from .timeline import get_timeline
 from .views import BaseContestMixin
 
 
@@ -45,13 +48,20 @@ class ContestStandings(BaseContestMixin, ListView):
     def get_queryset(self):
         if self.virtual_progress is not None:
             return get_contest_rank(self.contest, self.virtual_progress)
-        return get_contest_rank(self.contest)
+        frozen = settings.CONTEST_FROZEN_STANDINGS and self.contest.is_frozen and not self.privileged
+        self.snapshot = get_contest_rank_snapshot(self.contest, frozen=frozen)
+        return self.snapshot
 
     def get_context_data(self, **kwargs):
         data = super(ContestStandings, self).get_context_data(**kwargs)
+        # only rows on this page are decoded
+        rank_list = list(data['rank_list'])
         contest_participants = {user.user_id: user for user in
-                                ContestParticipant.objects.filter(contest=self.contest).select_related('user').
-                                    all()}
+                                ContestParticipant.objects.filter(contest=self.contest,
+                                                                  user_id__in=[rank['user'] for rank in rank_list]).
+                                    select_related('user').all()}
+        # a snapshot being rebuilt may still contain removed participants
+        data['rank_list'] = [rank for rank in rank_list if rank['user'] in contest_participants]
         for rank in data['rank_list']:
             # convert user_id to actual user
             rank.update(user=contest_participants[rank['user']])
@@ -59,9 +69,55 @@ class ContestStandings(BaseContestMixin, ListView):
             problems = self.contest.contest_problem_list # to make sure we get a cache
             if self.virtual_progress is not None:
                 calculate_problems(self.contest, problems, self.virtual_progress)
+            else:
+                self.snapshot.apply_problem_statistics(problems)
         return data
 
 
+class ContestStandingsReplay(BaseContestMixin, View):
+    """
+    Standings over time as JSON lines, one frame per line: {"time": seconds, "standings": [[user_id, rank,
+    actual_rank, score, penalty, detail], ...]}, e.g. for a resolver.
+
+    GET parameters: start, end, step (in seconds)
+    """
+    MAX_FRAMES = 2000
+
+    def test_func(self):
+        if self.privileged:
+            return True
+        # frames after freeze are revealed, so only after contest is ended
+        if self.contest.status <= 0 or self.contest.access_level == 0 or \
+                self.contest.common_status_access_level < 0:
+            return False
+        if self.contest.common_status_access_level > 0:
+            return True
+        return super(ContestStandingsReplay, self).test_func()
+
+    def get(self, request, cid):
+        if not self.contest.finite:
+            raise Http404
+        try:
+            start = timedelta(seconds=max(int(request.GET.get('start', 0)), 0))
+            end = min(timedelta(seconds=int(request.GET.get('end', 0))), self.contest.length) \
+                if request.GET.get('end') else self.contest.length
+            step = timedelta(seconds=max(int(request.GET.get('step', 60)), 10))
+        except ValueError:
+            raise Http404
+        step = max(step, (end - start) / self.MAX_FRAMES)
+        participants = self.contest.contestparticipant_set.only("user_id", "star")
+
+        def frames():
+            for t, items in get_timeline(self.contest).replay(participants, start, end, step):
+                yield json.dumps({
+                    "time": int(t.total_seconds()),
+                    "standings": [[p.user_id, p.rank, p.actual_rank, p.score, p.penalty, p.detail_at["detail"]]
+                                  for p in items]
+                }) + "\n"
+
+        return StreamingHttpResponse(frames(), content_type="application/x-ndjson")
+
+
 class ContestUpdateStandings(BaseContestMixin, View):
     def get(self, request, cid):
         if not self.privileged:
@@ -1,4 +1,5 @@
 import json
+from math import fsum
 from datetime import datetime, timedelta
 from threading import Thread
 
@@ -7,6 +8,8 @@ from django.db import transaction
 
 from problem.statistics import invalidate_problem
 from submission.util import SubmissionStatus
+from .incremental import StandingsIndex, ProblemContributionIndex, TimelineIndex, get_standings_version, \
+    clear_final_ranks, CONTEST_PROBLEM_STATISTICS_FIELDS
 from .models import Contest, ContestParticipant
 
 
@@ -21,6 +24,10 @@ def RANK_AS_DICT(x):
     }
 
 
+def _timedelta_to_microseconds(t: timedelta):
+    return (t.days * 86400 + t.seconds) * 1000000 + t.microseconds
+
+
 def get_submission_filter(contest: Contest, snapshot: timedelta, **kwargs):
     ret = contest.submission_set.filter(**kwargs). \
         only("id", "status", "create_time", "author_id", "problem_id", "contest_id", "contest_time", "status_percent")
@@ -31,6 +38,60 @@ def get_submission_filter(contest: Contest, snapshot: timedelta, **kwargs):
     return ret
 
 
+def problem_contributions(contest: Contest, submissions, snapshot: timedelta=None):
+    """
+    :param submissions: submissions in the order of `get_submission_filter`
+    :return:
+    {
+        (<problem_id>, <user_id>): {
+            ac: int (accepted submission count),
+            tot: int (submission count),
+            best: float (best status percent),
+            first_yes: None / [order key, contest time (microseconds), user_id] for the first accepted one
+        }
+    }
+
+    What one user contributes to the statistics of one problem, which only depends on submissions of
+    that user on that problem. This makes it possible to refresh one pair at a time.
+    """
+    ans = dict()
+    for submission in submissions:
+        apply_submission_to_contributions(ans, submission, snapshot is not None)
+    return ans
+
+
+def apply_submission_to_contributions(contributions: dict, submission, order_by_contest_time: bool):
+    c = contributions.setdefault((submission.problem_id, submission.author_id),
+                                 dict(ac=0, tot=0, best=submission.status_percent, first_yes=None))
+    if SubmissionStatus.is_accepted(submission.status):
+        c["ac"] += 1
+        if submission.contest_time is not None and c["first_yes"] is None:
+            if order_by_contest_time:
+                order_key = submission.contest_time.total_seconds()
+            else:
+                order_key = submission.create_time.timestamp()
+            c["first_yes"] = [order_key, _timedelta_to_microseconds(submission.contest_time), submission.author_id]
+    c["best"] = max(c["best"], submission.status_percent)
+    c["tot"] += 1
+
+
+def aggregate_problem(p, contributions: list):
+    """
+    :param p: ContestProblem, fields will be updated without writing to database
+    :param contributions: contributions of all users on this problem, refer to `problem_contributions`
+    """
+    first_yes = min(filter(lambda c: c is not None, map(lambda c: c["first_yes"], contributions)), default=None)
+    best = [c["best"] for c in contributions]
+    p.ac_user_count = sum(1 for c in contributions if c["ac"] > 0)
+    p.total_user_count = len(contributions)
+    p.ac_count = sum(c["ac"] for c in contributions)
+    p.total_count = sum(c["tot"] for c in contributions)
+    p.first_yes_time = timedelta(microseconds=first_yes[1]) if first_yes is not None else None
+    p.first_yes_by = first_yes[2] if first_yes is not None else None
+    p.max_score = max(best) if p.total_user_count > 0 else 0.0
+    p.avg_score = fsum(best) / p.total_user_count if p.total_user_count > 0 else 0.0
+
+
 def calculate_problems(contest: Contest, problems: list, snapshot: timedelta=None):
     """
 
@@ -40,45 +101,134 @@ def calculate_problems(contest: Contest, problems: list, snapshot: timedelta=Non
     :return:
     {
         <problem_id>: {
-            user_ac: int,
-            user_tot: int,
-            ac: int,
-            tot: int,
-            first_yes: None/int
+            <user_id>: contribution, refer to `problem_contributions`
         }
     }
     """
     problem_ids = list(map(lambda p: p.problem_id, problems))
-    ans = {problem_id: dict(user_ac=set(), user_tot=dict(), ac=0, tot=0, first_yes_time=None, first_yes_by=None)
-           for problem_id in problem_ids}
-    for submission in get_submission_filter(contest, snapshot, problem_id__in=problem_ids):
-        pstat = ans[submission.problem_id]
-        status = submission.status
-        if SubmissionStatus.is_accepted(status):
-            pstat["user_ac"].add(submission.author_id)
-            pstat["ac"] += 1
-            if submission.contest_time is not None and pstat["first_yes_time"] is None:
-                pstat["first_yes_time"] = submission.contest_time
-                pstat["first_yes_by"] = submission.author_id
-        if (submission.author_id in pstat["user_tot"] and pstat["user_tot"][submission.author_id] < submission.status_percent) or \
-                submission.author_id not in pstat["user_tot"]:
-            pstat["user_tot"][submission.author_id] = submission.status_percent
-        pstat["tot"] += 1
+    if snapshot is not None:
+        from .timeline import get_timeline
+        ans = get_timeline(contest).state_at(snapshot).problem_contributions(problem_ids)
+    else:
+        ans = {problem_id: dict() for problem_id in problem_ids}
+        contributions = problem_contributions(contest, get_submission_filter(contest, snapshot,
+                                                                             problem_id__in=problem_ids), snapshot)
+        for (problem_id, user_id), c in contributions.items():
+            ans[problem_id][user_id] = c
 
     for p in problems:
-        pstat = ans[p.problem_id]
-        p.ac_user_count = len(pstat["user_ac"])
-        p.total_user_count = len(pstat["user_tot"])
-        p.ac_count = pstat["ac"]
-        p.total_count = pstat["tot"]
-        p.first_yes_time = pstat["first_yes_time"]
-        p.first_yes_by = pstat["first_yes_by"]
-        p.max_score = max(pstat["user_tot"].values()) if p.total_user_count > 0 else 0.0
-        p.avg_score = sum(pstat["user_tot"].values()) / p.total_user_count if p.total_user_count > 0 else 0.0
+        aggregate_problem(p, list(ans[p.problem_id].values()))
 
     return ans
 
 
+def new_problem_detail():
+    return {'solved': False, 'attempt': 0, 'score': 0, 'time': 0,
+            'waiting': False, 'pass_time': '', 'partial': False, 'upsolve': 0}
+
+
+def apply_submission_to_detail(contest: Contest, d: dict, submission):
+    """
+    Apply one submission to the detail of (its author, its problem). Submissions of the same author on the
+    same problem should be applied in the order of `get_submission_filter`. Refer to `calculate_participants`.
+    """
+    status = submission.status
+    if not SubmissionStatus.is_judged(submission.status):
+        d['waiting'] = True
+        return
+    if SubmissionStatus.is_scored(submission.status):
+        d['partial'] = True
+
+    if not SubmissionStatus.is_penalty(status):
+        return  # This is probably CE or SE ...
+    contest_problem = contest.get_contest_problem(submission.problem_id)
+    if not contest_problem:  # This problem has been probably deleted
+        return
+
+    pass_time = str(submission.create_time.strftime('%Y-%m-%d %H:%M:%S'))
+    time = int(submission.contest_time.total_seconds()) if submission.contest_time is not None else 0
+    score = 0
+    EPS = 1E-2
+    if contest.scoring_method == 'oi' or contest.scoring_method == "subtask":
+        submission.contest_problem = contest_problem
+        score = submission.status_score
+    elif contest.scoring_method == 'acm' and SubmissionStatus.is_accepted(status):
+        score = 1
+    elif contest.scoring_method == 'cf' and SubmissionStatus.is_accepted(status):
+        contest_length = contest.length.total_seconds()
+        score = int(max(contest_problem.weight * 0.3,
+                        contest_problem.weight * (1 - 0.5 * time / contest_length) - d['attempt'] * 50) + EPS)
+    elif contest.scoring_method == 'tcmtime' and SubmissionStatus.is_accepted(status):
+        score = contest_problem.weight
+
+    # upsolve submission
+    if d['partial']:
+        d['upsolve'] = max(d['upsolve'], score)
+    elif d['upsolve'] <= 0:
+        d['upsolve'] -= 1
+        if SubmissionStatus.is_accepted(status):
+            d['upsolve'] = abs(d['upsolve'])
+
+    if contest.contest_type == 0 and submission.contest_time is None:
+        d['upsolve_enable'] = True
+        return
+
+    if contest.last_counts or not \
+            (d['solved'] or (contest.scoring_method != 'oi' and d['score'] > 0 and d['score'] >= score)):
+        # every submission has to be calculated in OI
+        # We have to tell whether this is the best
+
+        if not contest.last_counts:
+            d['score'] = max(d['score'], score)
+        else:
+            d['score'] = score
+        d['attempt'] += 1
+        d.update(solved=SubmissionStatus.is_accepted(status), time=time, pass_time=pass_time)
+
+
+def finish_problem_detail(d: dict):
+    if 'upsolve_enable' not in d:
+        d['upsolve'] = 0
+    else:
+        d.pop('upsolve_enable', None)
+
+
+def summarize_detail(contest: Contest, detail: dict):
+    """
+    :return: (score, penalty) of a participant with `detail`
+    """
+    if contest.start_time is None:
+        penalty = 0
+    elif contest.scoring_method == 'oi':
+        penalty = sum(map(lambda x: max(x['attempt'], 0) * contest.penalty_counts + x['time'],
+                          detail.values()))
+    else:
+        penalty = sum(map(lambda x: max(x['attempt'] - 1, 0) * contest.penalty_counts + x['time'],
+                          filter(lambda x: x['solved'], detail.values())))
+    return sum(map(lambda x: x['score'], detail.values())), penalty
+
+
+def participant_details(contest: Contest, user_ids: list, submissions):
+    """
+    :param submissions: submissions of these users, in the order of `get_submission_filter`
+    :return: refer to `calculate_participants`
+    """
+    ans = {author_id: dict(detail=dict(), is_confirmed=False) for author_id in user_ids}
+
+    for submission in submissions:
+        detail = ans[submission.author_id]['detail']
+        ans[submission.author_id]['is_confirmed'] = True
+        apply_submission_to_detail(contest, detail.setdefault(submission.problem_id, new_problem_detail()),
+                                   submission)
+
+    for v in ans.values():
+        for d in v['detail'].values():
+            finish_problem_detail(d)
+        score, penalty = summarize_detail(contest, v['detail'])
+        v.update(penalty=penalty, score=score)
+    return ans
+
+
 def calculate_participants(contest: Contest, participants: list, snapshot: timedelta=None):
     """
     :param contest
@@ -117,92 +267,20 @@ def calculate_participants(contest: Contest, participants: list, snapshot: timed
     1) The total percent will decrease from contest beginning to contest end from 100% to 50%.
     2) Every failed submission will induce a 50-point loss to the score
     3) The final score, once accepted will not be lower than 30% of the total score.
-    """
 
-    user_ids = list(map(lambda p: p.user_id, participants))
-    ans = {author_id: dict(detail=dict(), is_confirmed=False) for author_id in user_ids}
-    contest_length = contest.length
-    if contest_length is not None:
-        contest_length = contest_length.total_seconds()
+    Detail of each problem only depends on submissions of the participant on that problem,
+    which is what `contest.incremental` relies on.
 
-    for submission in get_submission_filter(contest, snapshot, author_id__in=user_ids):
-        status = submission.status
-        detail = ans[submission.author_id]['detail']
-
-        author_id = submission.author_id
-        ans[author_id]['is_confirmed'] = True
-
-        detail.setdefault(submission.problem_id,
-                          {'solved': False, 'attempt': 0, 'score': 0, 'time': 0,
-                           'waiting': False, 'pass_time': '', 'partial': False, 'upsolve': 0})
-        d = detail[submission.problem_id]
-        if not SubmissionStatus.is_judged(submission.status):
-            d['waiting'] = True
-            continue
-        if SubmissionStatus.is_scored(submission.status):
-            d['partial'] = True
-
-        if not SubmissionStatus.is_penalty(status):
-            continue  # This is probably CE or SE ...
-        contest_problem = contest.get_contest_problem(submission.problem_id)
-        if not contest_problem:  # This problem has been probably deleted
-            continue
-
-        pass_time = str(submission.create_time.strftime('%Y-%m-%d %H:%M:%S'))
-        time = int(submission.contest_time.total_seconds()) if submission.contest_time is not None else 0
-        score = 0
-        EPS = 1E-2
-        if contest.scoring_method == 'oi' or contest.scoring_method == "subtask":
-            submission.contest_problem = contest_problem
-            score = submission.status_score
-        elif contest.scoring_method == 'acm' and SubmissionStatus.is_accepted(status):
-            score = 1
-        elif contest.scoring_method == 'cf' and SubmissionStatus.is_accepted(status):
-            score = int(max(contest_problem.weight * 0.3,
-                            contest_problem.weight * (1 - 0.5 * time / contest_length) - d['attempt'] * 50) + EPS)
-        elif contest.scoring_method == 'tcmtime' and SubmissionStatus.is_accepted(status):
-            score = contest_problem.weight
-
-        # upsolve submission
-        if d['partial']:
-            d['upsolve'] = max(d['upsolve'], score)
-        elif d['upsolve'] <= 0:
-            d['upsolve'] -= 1
-            if SubmissionStatus.is_accepted(status):
-                d['upsolve'] = abs(d['upsolve'])
-
-        if contest.contest_type == 0 and submission.contest_time is None:
-            d['upsolve_enable'] = True
-            continue
-
-        if contest.last_counts or not \
-                (d['solved'] or (contest.scoring_method != 'oi' and d['score'] > 0 and d['score'] >= score)):
-            # every submission has to be calculated in OI
-            # We have to tell whether this is the best
-
-            if not contest.last_counts:
-                d['score'] = max(d['score'], score)
-            else:
-                d['score'] = score
-            d['attempt'] += 1
-            d.update(solved=SubmissionStatus.is_accepted(status), time=time, pass_time=pass_time)
+    With `snapshot`, details are rebuilt from the nearest checkpoint, refer to `contest.timeline`.
+    """
 
-    for v in ans.values():
-        for p in v['detail']:
-            d = v['detail'][p]
-            if 'upsolve_enable' not in d:
-                d['upsolve'] = 0
-            else:
-                d.pop('upsolve_enable', None)
-        if contest.start_time is None:
-            penalty = 0
-        elif contest.scoring_method == 'oi':
-            penalty = sum(map(lambda x: max(x['attempt'], 0) * contest.penalty_counts + x['time'],
-                              v['detail'].values()))
-        else:
-            penalty = sum(map(lambda x: max(x['attempt'] - 1, 0) * contest.penalty_counts + x['time'],
-                              filter(lambda x: x['solved'], v['detail'].values())))
-        v.update(penalty=penalty, score=sum(map(lambda x: x['score'], v['detail'].values())))
+    user_ids = list(map(lambda p: p.user_id, participants))
+    if snapshot is not None:
+        from .timeline import get_timeline
+        ans = get_timeline(contest).state_at(snapshot).participant_details(user_ids)
+    else:
+        ans = participant_details(contest, user_ids, get_submission_filter(contest, snapshot,
+                                                                           author_id__in=user_ids))
 
     for p in participants:
         p.detail = ans[p.user_id]["detail"]
@@ -222,16 +300,24 @@ def participants_with_rank(contest: Contest, snapshot: timedelta=None):
 
     actual_rank is the rank considering starred participants
     """
+    items = contest.contestparticipant_set.all()
+    if snapshot is not None:
+        calculate_participants(contest, items, snapshot)
+        items = sorted(list(items), key=lambda i: (not i.is_confirmed, -i.score, i.penalty, not i.star))
+    return assign_rank(contest, items)
+
+
+def assign_rank(contest: Contest, items):
+    """
+    :param items: participants in the order of standings
+    :return: items, with `rank` and `actual_rank` assigned, refer to `participants_with_rank`
+    """
     def find_key(t):
         if contest.penalty_counts:
             return t.score, -t.penalty
         else:
             return t.score
 
-    items = contest.contestparticipant_set.all()
-    if snapshot is not None:
-        calculate_participants(contest, items, snapshot)
-        items = sorted(list(items), key=lambda i: (not i.is_confirmed, -i.score, i.penalty, not i.star))
     last_item = None
     last_actual_item, last_actual_rank = None, 0
 
@@ -277,16 +363,145 @@ def get_contest_rank(contest: Contest, snapshot: timedelta=None):
     return list(map(RANK_AS_DICT, participants_with_rank(contest, snapshot)))
 
 
+def _get_standings_index(contest: Contest):
+    index = StandingsIndex(contest)
+    if not index.ready:
+        index.rebuild()
+    return index
+
+
+STANDINGS_SNAPSHOT_TIMEOUT = 3600
+
+
+class StandingsSnapshot(object):
+    """
+    A compact, picklable copy of standings: rows of (user_id, rank, actual_rank, score, penalty, detail_raw).
+
+    It behaves like the list returned by `get_contest_rank`, but `detail` is only decoded for the rows
+    being sliced, so a page can be served without touching the other rows.
+    """
+
+    def __init__(self, rows, problems=None):
+        self.rows = rows
+        # statistics of contest problems for frozen standings, {<problem_id>: {<field>: value}}
+        self.problems = problems
+
+    @staticmethod
+    def as_dict(row):
+        user_id, rank, actual_rank, score, penalty, detail_raw = row
+        detail = {int(k): v for k, v in json.loads(detail_raw).items()} if detail_raw else {}
+        return {
+            "actual_rank": actual_rank,
+            "rank": rank,
+            "user": user_id,
+            "penalty": penalty,
+            "score": score,
+            "detail": detail
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(map(self.as_dict, self.rows[item]))
+        return self.as_dict(self.rows[item])
+
+    def apply_problem_statistics(self, problems: list):
+        if self.problems is None:
+            return
+        for p in problems:
+            for field, value in self.problems.get(p.problem_id, {}).items():
+                setattr(p, field, value)
+
+
+def _build_standings_snapshot(contest: Contest, frozen: bool):
+    if frozen:
+        snapshot = contest.freeze_time - contest.start_time
+        items = participants_with_rank(contest, snapshot)
+        problems = list(contest.contestproblem_set.all())
+        calculate_problems(contest, problems, snapshot)
+        problem_statistics = {p.problem_id: {field: getattr(p, field) for field in CONTEST_PROBLEM_STATISTICS_FIELDS}
+                              for p in problems}
+    else:
+        items = assign_rank(contest, contest.contestparticipant_set.only("user_id", "score", "penalty", "star",
+                                                                         "is_confirmed", "detail_raw"))
+        problem_statistics = None
+    return StandingsSnapshot([(p.user_id, p.rank, p.actual_rank, p.score, p.penalty, p.detail_raw) for p in items],
+                             problem_statistics)
+
+
+def get_contest_rank_snapshot(contest: Contest, frozen=False):
+    """
+    Cached `get_contest_rank`, as a `StandingsSnapshot`.
+
+    :param frozen: standings as of `contest.freeze_time`, cached separately from the public one
+
+    Snapshots are keyed by standings version, so they are rebuilt once after participants or problems change,
+    rather than on each view. Frozen ones are only rebuilt when submissions before freeze change. While one worker is rebuilding, others keep serving the last snapshot.
+    """
+    variant = "frozen" if frozen else "public"
+    version = get_standings_version(contest.pk, frozen)
+    latest_key = "STANDINGS_SNAPSHOT:%d:%s" % (contest.pk, variant)
+    latest = cache.get(latest_key)
+    if latest is not None and latest[0] == version:
+        return latest[1]
+    if latest is not None and not cache.add(latest_key + ":BUILDING", 1, 30):
+        return latest[1]
+    try:
+        standings = _build_standings_snapshot(contest, frozen)
+        cache.set(latest_key, (version, standings), STANDINGS_SNAPSHOT_TIMEOUT)
+    finally:
+        cache.delete(latest_key + ":BUILDING")
+    return standings
+
+
 def get_participant_rank(contest: Contest, user_id):
     """
     Get rank in public standings
 
     Precondition: the contest should be ended FOR THE PARTICIPANT
     """
-    for participant in participants_with_rank(contest):
-        if participant.user_id == user_id:
-            return participant.actual_rank
-    return 0
+    rank = _get_standings_index(contest).get_rank(user_id)
+    if rank is None:
+        return 0
+    return rank[1]
+
+
+def save_final_ranks(contest: Contest):
+    """
+    Save actual ranks in public standings of an ended contest to `ContestParticipant.final_rank`, so that they
+    are read without calculating standings (e.g. on profiles). They are cleared whenever standings change,
+    refer to `contest.incremental.clear_final_ranks`.
+
+    :return: {<user_id>: actual_rank}, None if the contest is not ended
+    """
+    if contest.end_time is None or contest.end_time > datetime.now():
+        return None
+    items = assign_rank(contest, contest.contestparticipant_set.only("user_id", "score", "penalty", "star",
+                                                                     "is_confirmed", "final_rank"))
+    changed = []
+    for p in items:
+        if p.final_rank != p.actual_rank:
+            p.final_rank = p.actual_rank
+            changed.append(p)
+    # bulk updates send no signals, so ranks are not cleared again
+    ContestParticipant.objects.bulk_update(changed, ["final_rank"], batch_size=500)
+    return {p.user_id: p.actual_rank for p in items}
+
+
+def get_final_rank(participant: ContestParticipant):
+    """
+    Same as `get_participant_rank`, saving ranks of the whole contest when they are not saved
+
+    Precondition: the contest should be ended FOR THE PARTICIPANT
+    """
+    if participant.final_rank is not None:
+        return participant.final_rank
+    ranks = save_final_ranks(participant.contest)
+    if ranks is None:
+        return get_participant_rank(participant.contest, participant.user_id)
+    return ranks.get(participant.user_id, 0)
 
 
 def get_participant_score(contest: Contest, user_id, snapshot: timedelta=None):
@@ -305,6 +520,13 @@ def get_participant_score(contest: Contest, user_id, snapshot: timedelta=None):
             detail: ...
         }
     """
+    if snapshot is None:
+        participant = contest.contestparticipant_set.filter(user_id=user_id).first()
+        rank = _get_standings_index(contest).get_rank(user_id)
+        if participant is None or rank is None:
+            return {}
+        participant.rank, participant.actual_rank = rank
+        return RANK_AS_DICT(participant)
     for participant in participants_with_rank(contest, snapshot):
         if participant.user_id == user_id:
             return RANK_AS_DICT(participant)
@@ -333,11 +555,23 @@ def invalidate_contest_participant(contest: Contest, users=None):
     else:
         raise ValueError
 
+    participants = list(participants)
+    standings = {p.pk: (p.is_confirmed, p.score, p.penalty) for p in participants}
     calculate_participants(contest, participants)
+    changed = {p.pk for p in participants if (p.is_confirmed, p.score, p.penalty) != standings[p.pk]}
 
+    if changed:
+        # saved ranks are kept unless the rank order may change (e.g. rejudged without a different verdict)
+        clear_final_ranks(contest.pk)
     with transaction.atomic():
         for p in participants:
-            p.save(update_fields=["detail_raw", "score", "penalty", "is_confirmed"])
+            p.save(update_fields=["detail_raw", "score", "penalty", "is_confirmed"] if p.pk in changed else
+                   ["detail_raw"])
+    if users is None:
+        StandingsIndex(contest).rebuild([(p.user_id, p.is_confirmed, p.score, p.penalty, p.star)
+                                         for p in participants])
+    if changed:
+        save_final_ranks(contest)
 
 
 def invalidate_contest_problem(contest: Contest, problems=None):
@@ -362,15 +596,63 @@ def invalidate_contest_problem(contest: Contest, problems=None):
     else:
         raise ValueError
 
-    calculate_problems(contest, contest_problems)
+    contributions = calculate_problems(contest, contest_problems)
 
     with transaction.atomic():
         for p in contest_problems:
-            p.save(update_fields=["ac_user_count", "total_user_count", "ac_count", "total_count",
-                                  "first_yes_time", "first_yes_by", "max_score", "avg_score"])
+            p.save(update_fields=CONTEST_PROBLEM_STATISTICS_FIELDS)
+    for problem_id, c in contributions.items():
+        index = ProblemContributionIndex(contest, problem_id)
+        with index.lock():
+            index.rebuild(c)
+
+
+def apply_submission_to_standings(contest: Contest, submission):
+    """
+    Refresh standings after `submission` is judged (or rejudged), touching only the row of its author and
+    the statistics of its problem. Results are the same as `invalidate_contest_participant` and
+    `invalidate_contest_problem` on them, since both only depend on the submissions of this author on this
+    problem (refer to `calculate_participants` and `problem_contributions`).
+    """
+    user_id, problem_id = submission.author_id, submission.problem_id
+
+    with transaction.atomic():
+        participant = contest.contestparticipant_set.select_for_update().filter(user_id=user_id).first()
+        if participant is not None:
+            _get_standings_index(contest)
+            detail = participant.detail
+            d = None
+            for s in get_submission_filter(contest, None, author_id=user_id, problem_id=problem_id):
+                if d is None:
+                    d = new_problem_detail()
+                apply_submission_to_detail(contest, d, s)
+            if d is not None:
+                finish_problem_detail(d)
+                detail[problem_id] = d
+            else:
+                detail.pop(problem_id, None)
+            participant.detail = detail
+            participant.score, participant.penalty = summarize_detail(contest, detail)
+            participant.is_confirmed = len(detail) > 0
+            participant.save(update_fields=["detail_raw", "score", "penalty", "is_confirmed"])
+
+    contest_problem = contest.contestproblem_set.filter(problem_id=problem_id).first()
+    if contest_problem is None:
+        return
+    index = ProblemContributionIndex(contest, problem_id)
+    if not index.ready:
+        invalidate_contest_problem(contest, problem_id)
+        return
+    with index.lock():
+        contribution = problem_contributions(contest, get_submission_filter(contest, None, author_id=user_id,
+                                                                            problem_id=problem_id))
+        index.replace(user_id, contribution.get((problem_id, user_id)))
+        index.aggregate(contest_problem)
+        contest_problem.save(update_fields=CONTEST_PROBLEM_STATISTICS_FIELDS)
 
 
 def invalidate_contest(contest: Contest):
+    TimelineIndex(contest.pk).truncate(0)
     invalidate_contest_participant(contest)
     invalidate_contest_problem(contest)
     for problem in contest.contest_problem_list:
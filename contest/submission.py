@@ -164,7 +164,8 @@ class ContestSubmissionView(BaseContestMixin, TemplateView):
                                                          show_percent=data['show_percent'])
             if permission == 2 or (self.request.user == submission.author and submission.report_paid) or \
                     (self.participate_contest_status > 0 and self.request.user.has_coach_access()) or self.contest.case_public >= 2:
-                data['report_block'] = render_submission_report(submission.pk)
+                data['report_block'] = render_submission_report(submission.pk,
+                                                                self.request.GET.get('report_page', 1))
             else:
                 data['report_block'] = ''
         else:
@@ -6,14 +6,13 @@ from problem.tasks import judge_submission_on_problem
 from submission.models import Submission
 from submission.util import SubmissionStatus
 from .models import Contest, ContestParticipant
-from .statistics import invalidate_contest, invalidate_contest_participant, invalidate_contest_problem
+from .statistics import invalidate_contest, apply_submission_to_standings
 
 
 def judge_submission_on_contest(submission: Submission, callback=None, **kwargs):
 
     def _callback():
-        invalidate_contest_participant(contest, submission.author_id)
-        invalidate_contest_problem(contest, submission.problem_id)
+        apply_submission_to_standings(contest, submission)
         if callback:
             callback()
 
@@ -31,7 +30,8 @@ def judge_submission_on_contest(submission: Submission, callback=None, **kwargs)
     if cases != 'none':
         judge_submission_on_problem(submission, callback=_callback, case=cases,
                                     run_until_complete=run_until_complete,
-                                    status_for_pretest=cases != 'all', sync=sync)
+                                    status_for_pretest=cases != 'all', sync=sync,
+                                    low_priority=kwargs.get('low_priority', False))
     else:
         submission.status = SubmissionStatus.SUBMITTED
         submission.save(update_fields=['status'])
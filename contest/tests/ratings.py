@@ -0,0 +1,87 @@
+import random
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase, TestCase
+
+from account.models import User
+from contest.management.commands.benchmark_ratings import synthetic_contestants
+from contest.models import Contest, ContestParticipant, ContestUserRating
+from contest.ratings import _process, _process_naive, _validate_deltas, calculate_rating_changes, \
+    recalculate_rating_changes
+
+
+def random_contestants(rand, count):
+    # every rating twice, for ties
+    ratings = [rand.randint(800, 3000) for _ in range(rand.randint(1, count))]
+    return synthetic_contestants(rand, rand.sample(ratings, len(ratings)) + ratings, noise=500, point_size=100)
+
+
+class RatingTest(SimpleTestCase):
+
+    def test_same_deltas(self):
+        for seed in range(30):
+            rand = random.Random(seed)
+            contestants = random_contestants(rand, rand.choice([2, 10, 100, 300]))
+            expected = deepcopy(contestants)
+            try:
+                _process_naive(expected)
+            except ValueError:
+                # deltas are not checked in this case
+                with self.assertRaises(ValueError):
+                    _process(contestants)
+                continue
+            _process(contestants)
+            self.assertEqual({c.user: c.delta for c in expected}, {c.user: c.delta for c in contestants},
+                             msg="seed %d" % seed)
+
+    def test_validate_deltas(self):
+        def validate_naive(contestants):
+            for i in range(len(contestants)):
+                for j in range(i + 1, len(contestants)):
+                    a, b = contestants[i], contestants[j]
+                    if a.rating > b.rating and a.rating + a.delta < b.rating + b.delta:
+                        return False
+                    if a.rating < b.rating and a.delta < b.delta:
+                        return False
+            return True
+
+        for seed in range(300):
+            rand = random.Random(seed)
+            contestants = random_contestants(rand, 8)
+            for c in contestants:
+                c.delta = rand.randint(-30, 30)
+            contestants.sort(key=lambda c: c.points, reverse=True)
+            try:
+                _validate_deltas(contestants)
+                valid = True
+            except ValueError:
+                valid = False
+            self.assertEqual(validate_naive(contestants), valid, msg="seed %d" % seed)
+
+
+class RecalculateRatingTest(TestCase):
+
+    def setUp(self):
+        rand = random.Random(0)
+        users = [User.objects.create(username="user%d" % i, email="user%d@example.com" % i) for i in range(20)]
+        self.contests = []
+        for day in range(3):
+            start_time = datetime(2018, 1, 1 + day, 12)
+            contest = Contest.objects.create(title="contest%d" % day, start_time=start_time,
+                                             end_time=start_time + timedelta(hours=5))
+            for user in rand.sample(users, 12):
+                ContestParticipant.objects.create(contest=contest, user=user, is_confirmed=True,
+                                                  score=rand.randint(0, 5))
+            self.contests.append(contest)
+
+    def ratings(self):
+        return sorted(ContestUserRating.objects.values_list("contest_id", "user_id", "rating", "rank", "solved"))
+
+    def test_same_as_one_by_one(self):
+        for contest in self.contests:
+            calculate_rating_changes(contest)
+        expected = self.ratings()
+        ContestUserRating.objects.filter(contest=self.contests[0]).update(rating=1000)
+        recalculate_rating_changes(self.contests[::-1])
+        self.assertEqual(expected, self.ratings())
@@ -0,0 +1,351 @@
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from account.models import User
+
+from contest.incremental import StandingsIndex, ProblemContributionIndex, get_standings_version
+from contest.models import Contest, ContestProblem, ContestParticipant
+from contest.statistics import participant_details, problem_contributions, aggregate_problem, assign_rank, \
+    new_problem_detail, apply_submission_to_detail, finish_problem_detail, summarize_detail, get_contest_rank, \
+    get_contest_rank_snapshot, get_submission_filter, save_final_ranks, get_final_rank, \
+    invalidate_contest_participant
+from contest.timeline import ContestTimeline
+from problem.models import Problem
+from submission.models import Submission
+from submission.util import SubmissionStatus
+
+VERDICTS = [SubmissionStatus.ACCEPTED, SubmissionStatus.WRONG_ANSWER, SubmissionStatus.TIME_LIMIT_EXCEEDED,
+            SubmissionStatus.COMPILE_ERROR, SubmissionStatus.SYSTEM_ERROR, SubmissionStatus.SCORED,
+            SubmissionStatus.PRETEST_PASSED]
+SCORING_METHODS = ['acm', 'oi', 'cf', 'tcmtime', 'subtask']
+TEST_CONTEST_PK = 2 ** 30
+
+
+def random_contest(rand):
+    start_time = datetime(2018, 1, 1, 12)
+    contest = Contest(pk=TEST_CONTEST_PK, start_time=start_time, end_time=start_time + timedelta(hours=5),
+                      scoring_method=rand.choice(SCORING_METHODS), last_counts=rand.random() < 0.3,
+                      contest_type=rand.choice([0, 1]), penalty_counts=rand.choice([0, 1200]))
+    contest._contest_problem_list = [ContestProblem(problem_id=problem_id, identifier=chr(64 + problem_id),
+                                                    weight=rand.choice([100, 500, 1000]))
+                                     for problem_id in range(1, 5)]
+    return contest
+
+
+def random_submissions(rand, contest, count):
+    submissions = []
+    create_time = contest.start_time - timedelta(minutes=10)
+    for pk in range(1, count + 1):
+        create_time += timedelta(seconds=rand.randint(1, 600))
+        contest_time = create_time - contest.start_time
+        if create_time > contest.end_time or rand.random() < 0.1:
+            contest_time = None
+        submissions.append(Submission(pk=pk, author_id=rand.randint(1, 8), problem_id=rand.randint(1, 5),
+                                      status=SubmissionStatus.WAITING, status_percent=0,
+                                      create_time=create_time, contest_time=contest_time))
+    return submissions
+
+
+def judge(rand, submission):
+    submission.status = rand.choice(VERDICTS)
+    submission.status_percent = 100 if SubmissionStatus.is_accepted(submission.status) else \
+        rand.choice([0, 100 / 3, 50, 99.5])
+
+
+class IncrementalStandingsTest(SimpleTestCase):
+    """
+    Applying verdicts one at a time (including rejudges, in any order) must give the same standings
+    as a full recomputation.
+    """
+
+    def tearDown(self):
+        client = StandingsIndex(Contest(pk=TEST_CONTEST_PK)).client
+        for key in client.scan_iter("STANDINGS:%d:*" % TEST_CONTEST_PK):
+            client.delete(key)
+
+    def test_participant_detail(self):
+        for seed in range(200):
+            rand = random.Random(seed)
+            contest = random_contest(rand)
+            submissions = random_submissions(rand, contest, rand.randint(1, 60))
+            user_ids = list(range(1, 9))
+            incremental = {user_id: v["detail"] for user_id, v in
+                           participant_details(contest, user_ids, submissions).items()}
+            for step in range(len(submissions) * 2):
+                submission = rand.choice(submissions)
+                judge(rand, submission)
+                # what `apply_submission_to_standings` does
+                d = new_problem_detail()
+                for s in submissions:
+                    if s.author_id == submission.author_id and s.problem_id == submission.problem_id:
+                        apply_submission_to_detail(contest, d, s)
+                finish_problem_detail(d)
+                incremental[submission.author_id][submission.problem_id] = d
+
+                full = participant_details(contest, user_ids, submissions)
+                for user_id in user_ids:
+                    self.assertEqual(full[user_id]["detail"], incremental[user_id], msg="seed %d" % seed)
+                    self.assertEqual((full[user_id]["score"], full[user_id]["penalty"]),
+                                     summarize_detail(contest, incremental[user_id]))
+
+    def test_problem_statistics(self):
+        for seed in range(50):
+            rand = random.Random(seed)
+            contest = random_contest(rand)
+            submissions = [s for s in random_submissions(rand, contest, rand.randint(1, 60)) if s.problem_id == 1]
+            index = ProblemContributionIndex(contest, 1)
+            index.rebuild({user_id: c for (_, user_id), c in problem_contributions(contest, submissions).items()})
+            for step in range(len(submissions) * 2):
+                submission = rand.choice(submissions)
+                judge(rand, submission)
+                contribution = problem_contributions(contest, [s for s in submissions
+                                                               if s.author_id == submission.author_id])
+                index.replace(submission.author_id, contribution.get((1, submission.author_id)))
+
+                expected, actual = ContestProblem(), ContestProblem()
+                aggregate_problem(expected, list(problem_contributions(contest, submissions).values()))
+                index.aggregate(actual)
+                for field in ["ac_user_count", "total_user_count", "ac_count", "total_count",
+                              "first_yes_time", "first_yes_by", "max_score", "avg_score"]:
+                    self.assertEqual(getattr(expected, field), getattr(actual, field),
+                                     msg="seed %d, field %s" % (seed, field))
+
+    def test_rank(self):
+        for seed in range(50):
+            rand = random.Random(seed)
+            contest = random_contest(rand)
+            rows = {}
+            for user_id in range(1, rand.randint(2, 40)):
+                is_confirmed = rand.random() < 0.8
+                rows[user_id] = (user_id, is_confirmed, rand.randint(0, 3) if is_confirmed else 0,
+                                 rand.choice([0, 1200, 2400]) if is_confirmed else 0, rand.random() < 0.2)
+            index = StandingsIndex(contest)
+            index.rebuild(rows.values())
+            for step in range(20):
+                user_id = rand.choice(list(rows.keys()))
+                rows[user_id] = (user_id, True, rand.randint(0, 3), rand.choice([0, 1200]), rows[user_id][4])
+                index.update(*rows[user_id])
+
+                participants = [ContestParticipant(user_id=user_id, is_confirmed=is_confirmed, score=score,
+                                                   penalty=penalty, star=star)
+                                for user_id, is_confirmed, score, penalty, star in rows.values()]
+                participants.sort(key=lambda p: (not p.is_confirmed, -p.score, p.penalty, p.star))
+                for p in assign_rank(contest, participants):
+                    self.assertEqual((p.rank, p.actual_rank), index.get_rank(p.user_id), msg="seed %d" % seed)
+
+
+class StandingsSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.contest = Contest.objects.create(title="snapshot", penalty_counts=1200)
+        rand = random.Random(0)
+        for user_id in range(30):
+            user = User.objects.create(username="user%d" % user_id, email="user%d@example.com" % user_id)
+            ContestParticipant.objects.create(contest=self.contest, user=user, is_confirmed=rand.random() < 0.8,
+                                              score=rand.randint(0, 3), penalty=rand.choice([0, 1200]),
+                                              star=rand.random() < 0.2,
+                                              detail_raw=json.dumps({rand.randint(1, 5): {"score": 1}}))
+
+    def test_same_as_full_rank(self):
+        snapshot = get_contest_rank_snapshot(self.contest)
+        self.assertEqual(get_contest_rank(self.contest), snapshot[:])
+        self.assertEqual(get_contest_rank(self.contest)[10:20], snapshot[10:20])
+
+    def test_invalidated_on_change(self):
+        get_contest_rank_snapshot(self.contest)
+        participant = self.contest.contestparticipant_set.last()
+        participant.score = 100
+        participant.save(update_fields=["score"])
+        self.assertEqual(get_contest_rank(self.contest), get_contest_rank_snapshot(self.contest)[:])
+
+    def test_frozen_version(self):
+        start_time = datetime(2018, 1, 1, 12)
+        self.contest.start_time, self.contest.end_time = start_time, start_time + timedelta(hours=5)
+        self.contest.freeze, self.contest.freeze_time = True, start_time + timedelta(hours=4)
+        self.contest.save()
+        participant = self.contest.contestparticipant_set.last()
+        problem = Problem.objects.create(title="problem")
+
+        def submit(contest_time):
+            Submission.objects.create(author=participant.user, problem=problem, contest=self.contest,
+                                      contest_time=contest_time, status=SubmissionStatus.ACCEPTED)
+
+        version, frozen = get_standings_version(self.contest.pk), get_standings_version(self.contest.pk, True)
+        # verdicts after freeze
+        submit(timedelta(hours=4, minutes=30))
+        participant.score = 100
+        participant.save(update_fields=["score"])
+        self.assertNotEqual(version, get_standings_version(self.contest.pk))
+        self.assertEqual(frozen, get_standings_version(self.contest.pk, True))
+        submit(timedelta(hours=1))
+        self.assertNotEqual(frozen, get_standings_version(self.contest.pk, True))
+        frozen = get_standings_version(self.contest.pk, True)
+        participant.star = not participant.star
+        participant.save(update_fields=["star"])
+        self.assertNotEqual(frozen, get_standings_version(self.contest.pk, True))
+
+
+class FinalRankTest(TestCase):
+
+    def setUp(self):
+        start_time = datetime(2018, 1, 1, 12)
+        self.contest = Contest.objects.create(title="final", penalty_counts=1200, start_time=start_time,
+                                              end_time=start_time + timedelta(hours=5))
+        rand = random.Random(0)
+        for user_id in range(30):
+            user = User.objects.create(username="user%d" % user_id, email="user%d@example.com" % user_id)
+            ContestParticipant.objects.create(contest=self.contest, user=user, is_confirmed=rand.random() < 0.8,
+                                              score=rand.randint(0, 3), penalty=rand.choice([0, 1200]),
+                                              star=rand.random() < 0.2)
+
+    def expected(self):
+        return {row["user"]: row["actual_rank"] for row in get_contest_rank(self.contest)}
+
+    def saved(self):
+        return dict(self.contest.contestparticipant_set.values_list("user_id", "final_rank"))
+
+    def test_saved(self):
+        self.assertEqual(self.expected(), save_final_ranks(self.contest))
+        self.assertEqual(self.expected(), self.saved())
+        expected = self.expected()
+        participants = list(self.contest.contestparticipant_set.select_related("contest"))
+        with self.assertNumQueries(0):
+            self.assertEqual(expected, {p.user_id: get_final_rank(p) for p in participants})
+
+    def test_cleared_on_change(self):
+        save_final_ranks(self.contest)
+        participant = self.contest.contestparticipant_set.last()
+        participant.score = 100
+        participant.save(update_fields=["score"])
+        self.assertEqual({None}, set(self.saved().values()))
+        participant = self.contest.contestparticipant_set.select_related("contest").first()
+        self.assertEqual(self.expected()[participant.user_id], get_final_rank(participant))
+        self.assertEqual(self.expected(), self.saved())
+        participant.comment = "kept"
+        participant.save(update_fields=["comment"])
+        self.assertEqual(self.expected(), self.saved())
+
+    def test_invalidate(self):
+        # scores set above are not those of submissions
+        invalidate_contest_participant(self.contest)
+        self.assertEqual(self.expected(), self.saved())
+        participant = self.contest.contestparticipant_set.first()
+        invalidate_contest_participant(self.contest, participant.user_id)
+        self.assertEqual(self.expected(), self.saved())
+
+    def test_not_ended(self):
+        self.contest.end_time = datetime.now() + timedelta(hours=1)
+        self.contest.save()
+        self.assertIsNone(save_final_ranks(self.contest))
+        participant = self.contest.contestparticipant_set.select_related("contest").first()
+        self.assertEqual(self.expected()[participant.user_id], get_final_rank(participant))
+        self.assertEqual({None}, set(self.saved().values()))
+
+    def test_command(self):
+        call_command("save_final_ranks", stdout=StringIO())
+        self.assertEqual(self.expected(), self.saved())
+
+
+@override_settings(STANDINGS_CHECKPOINT_INTERVAL=7)
+class TimelineTest(TestCase):
+    """
+    Standings rebuilt from checkpoints must be the same as those calculated from submissions before snapshot.
+    """
+
+    def setUp(self):
+        self.rand = random.Random(0)
+        start_time = datetime(2018, 1, 1, 12)
+        self.contest = Contest.objects.create(title="timeline", start_time=start_time,
+                                              end_time=start_time + timedelta(hours=2), penalty_counts=1200)
+        for problem_id in range(1, 4):
+            problem = Problem.objects.create(title="problem%d" % problem_id)
+            ContestProblem.objects.create(contest=self.contest, problem=problem, identifier=chr(64 + problem_id))
+        self.problem_ids = list(self.contest.contestproblem_set.values_list("problem_id", flat=True))
+        self.users = []
+        for user_id in range(8):
+            user = User.objects.create(username="user%d" % user_id, email="user%d@example.com" % user_id)
+            ContestParticipant.objects.create(contest=self.contest, user=user)
+            self.users.append(user)
+        for _ in range(80):
+            self.submit()
+
+    def tearDown(self):
+        client = StandingsIndex(self.contest).client
+        for key in client.scan_iter("STANDINGS:%d:*" % self.contest.pk):
+            client.delete(key)
+
+    def submit(self, contest_time=None):
+        if contest_time is None:
+            contest_time = timedelta(seconds=self.rand.randint(-300, 7200))
+        submission = Submission(contest=self.contest, author=self.rand.choice(self.users),
+                                problem_id=self.rand.choice(self.problem_ids), contest_time=contest_time)
+        judge(self.rand, submission)
+        submission.save()
+        Submission.objects.filter(pk=submission.pk).update(create_time=self.contest.start_time + contest_time)
+
+    def assertSameAsDirect(self, snapshot):
+        contest = Contest.objects.get(pk=self.contest.pk)
+        user_ids = [user.pk for user in self.users]
+        state = ContestTimeline(contest).state_at(snapshot)
+        self.assertEqual(participant_details(contest, user_ids, get_submission_filter(
+            contest, snapshot, author_id__in=user_ids).order_by("contest_time", "pk")),
+            state.participant_details(user_ids), msg=str(snapshot))
+        expected = problem_contributions(contest, get_submission_filter(contest, snapshot).
+                                         order_by("contest_time", "pk"), snapshot)
+        self.assertEqual({problem_id: {user_id: c for (p, user_id), c in expected.items() if p == problem_id}
+                          for problem_id in self.problem_ids}, state.problem_contributions(self.problem_ids))
+
+    def test_state_at(self):
+        for minutes in [0, 1, 7, 30, 63, 119, 120]:
+            self.assertSameAsDirect(timedelta(minutes=minutes, seconds=self.rand.randint(0, 59)))
+
+    def test_invalidated_on_submission(self):
+        self.assertSameAsDirect(timedelta(minutes=100))
+        self.submit(timedelta(minutes=50))
+        self.assertSameAsDirect(timedelta(minutes=100))
+        self.assertSameAsDirect(timedelta(minutes=49))
+        submission = self.contest.submission_set.order_by("contest_time").first()
+        submission.status = SubmissionStatus.ACCEPTED
+        submission.save(update_fields=["status"])
+        self.assertSameAsDirect(timedelta(minutes=100))
+
+    def test_replay(self):
+        contest = Contest.objects.get(pk=self.contest.pk)
+        frames = 0
+        for t, items in ContestTimeline(contest).replay(contest.contestparticipant_set.all(), timedelta(minutes=10),
+                                                        timedelta(minutes=60), timedelta(minutes=5)):
+            expected = get_contest_rank(Contest.objects.get(pk=self.contest.pk), t)
+            self.assertEqual({x["user"]: (x["rank"], x["actual_rank"], x["score"], x["penalty"], x["detail"])
+                              for x in expected},
+                             {p.user_id: (p.rank, p.actual_rank, p.score, p.penalty, p.detail_at["detail"])
+                              for p in items}, msg=str(t))
+            frames += 1
+        self.assertEqual(11, frames)
+
+
+class ReceiverTest(SimpleTestCase):
+
+    def test_connected_on_setup(self):
+        # in a fresh process (e.g. a worker) that imports no contest module by itself
+        code = "\n".join([
+            "import django",
+            "django.setup()",
+            "from django.db.models.signals import post_save",
+            "from submission.models import Submission",
+            "from contest.models import ContestParticipant",
+            "print(sorted(r.__module__ + '.' + r.__name__ for model in (Submission, ContestParticipant)",
+            "             for r in post_save._live_receivers(model) if r.__module__ == 'contest.incremental'))",
+        ])
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=settings.BASE_DIR,
+                                         env=dict(os.environ, DJANGO_SETTINGS_MODULE="eoj3.settings"), stderr=subprocess.DEVNULL)
+        self.assertIn("contest.incremental.submission_changed", output.decode())
+        self.assertIn("contest.incremental.update_participant_in_index", output.decode())
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from account.models import User
+from contest.models import Contest, ContestProblem
+from contest.warmup import warm_up_upcoming_contests, get_readiness, WARMUP_KEY, _redis
+from dispatcher.models import Server
+from dispatcher.tests.sync import FakeSession
+from problem.models import Problem
+
+
+class WarmUpTest(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.contest = Contest.objects.create(title="upcoming", start_time=datetime.now() + timedelta(minutes=30),
+                                              end_time=datetime.now() + timedelta(hours=3))
+        for i in range(3):
+            problem = Problem.objects.create(title="problem%d" % i, cases="c%d,shared" % i, pretests="c%d" % i)
+            ContestProblem.objects.create(contest=self.contest, problem=problem, identifier=str(i))
+        for case in ["c0", "c1", "c2", "shared"]:
+            for suffix in ("in", "out"):
+                with open(os.path.join(self.data_dir, case + "." + suffix), "w") as f:
+                    f.write(case)
+        self.servers = [Server.objects.create(name="server%d" % i, ip="127.0.0.1", port=5000 + i, token="token",
+                                              enabled=True) for i in range(2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+        _redis().delete(WARMUP_KEY % self.contest.pk)
+
+    def test_warm_up(self):
+        sessions = {server.pk: FakeSession({}) for server in self.servers}
+        with override_settings(TESTDATA_DIR=self.data_dir), \
+                mock.patch('dispatcher.manage.server_session', side_effect=lambda server: sessions[server.pk]), \
+                mock.patch('contest.warmup.upload_problem_to_judge_server'):
+            warm_up_upcoming_contests()
+        readiness = get_readiness(self.contest)
+        for server in self.servers:
+            self.assertTrue(readiness[server.pk]["ready"], msg=readiness[server.pk]["error"])
+            self.assertEqual({"c0", "c1", "c2", "shared"}, set(sessions[server.pk].cases))
+
+        admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin)
+        response = self.client.get(reverse('backstage:server'))
+        self.assertContains(response, "upcoming")
+        self.assertContains(response, "Ready", count=2)
@@ -0,0 +1,203 @@
+"""
+Standings at any moment of a contest, for virtual participants and scoreboard replays.
+
+Submissions of a contest form an event log ordered by contest time. The state of standings (details of each
+(user, problem) and contributions to problem statistics, refer to `contest.statistics`) is checkpointed every
+`settings.STANDINGS_CHECKPOINT_INTERVAL` minutes in `contest.incremental.TimelineIndex`, so the standings at
+contest time T are the nearest checkpoint before T, plus a replay of at most one interval of submissions.
+"""
+
+import pickle
+from datetime import timedelta
+
+from submission.models import Submission
+from .incremental import TimelineIndex
+from .models import Contest
+from .statistics import new_problem_detail, apply_submission_to_detail, apply_submission_to_contributions, \
+    finish_problem_detail, summarize_detail, assign_rank
+
+EVENT_FIELDS = ("id", "author_id", "problem_id", "status", "status_percent", "create_time", "contest_time")
+
+
+def _event_submission(event):
+    return Submission(**dict(zip(EVENT_FIELDS, event)))
+
+
+def _event_time(event):
+    return event[6]
+
+
+class StandingsState(object):
+    """
+    Details and contributions after applying a prefix of the event log.
+    Details are kept unfinished (refer to `finish_problem_detail`), so that more events can be applied.
+    """
+
+    def __init__(self, contest: Contest, details=None, contributions=None):
+        self.contest = contest
+        self.details = details if details is not None else {}  # {<user_id>: {<problem_id>: detail}}
+        self.contributions = contributions if contributions is not None else {}  # {(<problem_id>, <user_id>): c}
+        self.touched = set()  # users whose details changed since last `participants_with_rank`
+
+    @classmethod
+    def loads(cls, contest: Contest, checkpoint):
+        return cls(contest, *pickle.loads(checkpoint))
+
+    def dumps(self):
+        return pickle.dumps((self.details, self.contributions), pickle.HIGHEST_PROTOCOL)
+
+    def apply(self, event):
+        submission = _event_submission(event)
+        apply_submission_to_detail(self.contest, self.details.setdefault(submission.author_id, {}).
+                                   setdefault(submission.problem_id, new_problem_detail()), submission)
+        apply_submission_to_contributions(self.contributions, submission, True)
+        self.touched.add(submission.author_id)
+
+    def participant_detail(self, user_id):
+        """
+        :return: refer to `calculate_participants`
+        """
+        detail = {}
+        for problem_id, d in self.details.get(user_id, {}).items():
+            detail[problem_id] = d = dict(d)
+            finish_problem_detail(d)
+        score, penalty = summarize_detail(self.contest, detail)
+        return dict(detail=detail, is_confirmed=user_id in self.details, score=score, penalty=penalty)
+
+    def participant_details(self, user_ids):
+        return {user_id: self.participant_detail(user_id) for user_id in user_ids}
+
+    def problem_contributions(self, problem_ids):
+        """
+        :return: refer to `calculate_problems`
+        """
+        ans = {problem_id: dict() for problem_id in problem_ids}
+        for (problem_id, user_id), c in self.contributions.items():
+            if problem_id in ans:
+                ans[problem_id][user_id] = c
+        return ans
+
+    def participants_with_rank(self, participants):
+        """
+        :param participants: ContestParticipants, those ranked by an earlier call are only recalculated
+        if touched since then
+        :return: refer to `contest.statistics.participants_with_rank`, with `detail_at` in place of `detail`
+        (refer to `participant_detail`), leaving `detail_raw` as is
+        """
+        for p in participants:
+            if not hasattr(p, "detail_at") or p.user_id in self.touched:
+                p.detail_at = self.participant_detail(p.user_id)
+                p.score, p.penalty = p.detail_at["score"], p.detail_at["penalty"]
+                p.is_confirmed = p.detail_at["is_confirmed"]
+        self.touched = set()
+        return assign_rank(self.contest, sorted(participants,
+                                                key=lambda i: (not i.is_confirmed, -i.score, i.penalty, not i.star)))
+
+
+class ContestTimeline(object):
+
+    def __init__(self, contest: Contest):
+        self.contest = contest
+        self.index = TimelineIndex(contest.pk)
+        self.last_state = None
+
+    def events(self, after: timedelta=None, until: timedelta=None):
+        """
+        Submissions with contest time in (after, until], ordered by contest time
+        """
+        submissions = self.contest.submission_set.filter(contest_time__isnull=False)
+        if after is not None:
+            submissions = submissions.filter(contest_time__gt=after)
+        if until is not None:
+            submissions = submissions.filter(contest_time__lte=until)
+        return submissions.order_by("contest_time", "pk").values_list(*EVENT_FIELDS)
+
+    def build(self, valid, epoch, until):
+        """
+        Rebuild pairs from the last valid checkpoint (refer to `TimelineIndex`), to cover all submissions
+        and checkpoint `until`.
+
+        :return: {<k>: pair} of the rebuilt pairs
+        """
+        start = max(valid - 1, 0)
+        pair = self.index.load(start) if valid > 0 else None
+        if pair is not None:
+            checkpoint, state = pair[0], StandingsState.loads(self.contest, pair[0])
+            events = self.events(after=start * self.index.interval)
+        else:
+            start, checkpoint, state = 0, None, StandingsState(self.contest)
+            events = self.events()
+
+        pairs = []
+        k, chunk = start, []
+        for event in events.iterator():
+            if checkpoint is None and _event_time(event) <= timedelta():
+                state.apply(event)  # checkpoint 0 is the state at the beginning
+                continue
+            if checkpoint is None:
+                checkpoint = state.dumps()
+            while _event_time(event) > (k + 1) * self.index.interval:
+                pairs.append((checkpoint, chunk))
+                k, checkpoint, chunk = k + 1, state.dumps(), []
+            state.apply(event)
+            chunk.append(event)
+        if checkpoint is None:
+            checkpoint = state.dumps()
+        pairs.append((checkpoint, chunk))
+        while k < until:
+            k, checkpoint = k + 1, state.dumps()
+            pairs.append((checkpoint, []))
+
+        if self.index.acquire_build():
+            try:
+                self.index.commit(epoch, start, pairs)
+            finally:
+                self.index.release_build()
+        return dict(enumerate(pairs, start=start))
+
+    def state_at(self, snapshot: timedelta):
+        """
+        :return: StandingsState after submissions in the first `snapshot` of contest, refer to `get_submission_filter`
+        """
+        if self.last_state is not None and self.last_state[0] == snapshot:
+            return self.last_state[1]
+        k = self.index.index_of(snapshot)
+        valid, epoch = self.index.state()
+        pair = self.index.load(k) if k < valid else None
+        if pair is None:
+            # a missing pair within valid ones has expired, then rebuild from the beginning
+            pair = self.build(valid if k >= valid else 0, epoch, k)[k]
+        state = StandingsState.loads(self.contest, pair[0])
+        for event in pair[1]:
+            if _event_time(event) > snapshot:
+                break
+            state.apply(event)
+        self.last_state = (snapshot, state)
+        return state
+
+    def replay(self, participants, start: timedelta, end: timedelta, step: timedelta):
+        """
+        Standings every `step` from `start` to `end`, starting from the state at `start`, then replaying
+        submissions once in order.
+
+        :return: iterator of (contest time, participants with rank)
+        """
+        state = self.state_at(start)
+        self.last_state = None  # since it is going to be changed
+        participants = list(participants)
+        t = start
+        yield t, state.participants_with_rank(participants)
+        for event in self.events(after=start, until=end).iterator():
+            while _event_time(event) > t + step and t + step <= end:
+                t += step
+                yield t, state.participants_with_rank(participants)
+            state.apply(event)
+        while t + step <= end:
+            t += step
+            yield t, state.participants_with_rank(participants)
+
+
+def get_timeline(contest: Contest):
+    if not hasattr(contest, '_timeline'):
+        contest._timeline = ContestTimeline(contest)
+    return contest._timeline
@@ -6,7 +6,7 @@ from .submission import ContestMyPastSubmissions, ContestStatus, ContestSubmit,
     ContestSubmissionView, ContestMyStatus, ContestSubmissionAPI, ContestPenaltyDetail, ContestSubmissionClaim, \
     ContestStatusForAll, ContestBalloonClaim, ContestBalloonCancel
 from .standings import ContestStandings, ContestUpdateStandings, ContestDownloadStandings, ContestDownloadCode, \
-    ContestStandingsTestSys
+    ContestStandingsTestSys, ContestStandingsReplay
 from .clarification import ContestClarificationView, ContestClarificationAnswer
 from .activity import ActivityList, ActivityAddView, ActivityUpdateView, ActivityRegisterView, ActivityQuitView, \
     ActivityParticipantList, ActivityAdminAddUserView, ActivityAdminUpdateUserView, ActivityAddSchoolView, \
@@ -35,6 +35,7 @@ urlpatterns = [
     url(r'^(?P<cid>\d+)/standings/penalty/$', ContestPenaltyDetail.as_view(), name='penalty_detail'),
     url(r'^(?P<cid>\d+)/standings/update/$', ContestUpdateStandings.as_view(), name='update_standings'),
     url(r'^(?P<cid>\d+)/standings/download/$', ContestDownloadStandings.as_view(), name='download_standings'),
+    url(r'^(?P<cid>\d+)/standings/replay/$', ContestStandingsReplay.as_view(), name='standings_replay'),
     url(r'^(?P<cid>\d+)/balloon/$', ContestBalloon.as_view(), name='balloon'),
     url(r'^(?P<cid>\d+)/balloon/(?P<pk>\d+)/$', ContestBalloonClaim.as_view(), name='balloon_claim'),
     url(r'^(?P<cid>\d+)/balloon/(?P<pk>\d+)/cancel/$', ContestBalloonCancel.as_view(), name='balloon_cancel'),
@@ -0,0 +1,114 @@
+"""
+Test data of a contest is pushed to all enabled judge servers `settings.CONTEST_WARMUP_AHEAD` minutes before
+the contest starts, so that first submissions do not hit servers missing cases.
+
+`warm_up_upcoming_contests` is scheduled with django-q (refer to command `warm_up_contests`). Readiness of each
+server, verified with the exist endpoint after uploading, is kept in redis and shown on the backstage server list.
+"""
+
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from dispatcher.health import record_affinity
+from dispatcher.manage import upload_cases, find_missing_cases
+from dispatcher.models import Server, ServerProblemStatus
+from problem.models import Problem
+from problem.tasks import upload_problem_to_judge_server
+from .models import Contest
+
+WARMUP_KEY = 'CONTEST_WARMUP:%d'  # {<server_id>: readiness}
+WARMUP_LOCK = 'CONTEST_WARMUP_LOCK:%d'
+
+
+def _redis():
+    return get_redis_connection("judge")
+
+
+def _warm_up_server(server, problems, cases):
+    """
+    :return: readiness, {ready: bool, missing: number of cases missing, error: str, time: str}
+    """
+    readiness = dict(time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), missing=0, error='')
+    try:
+        unavailable = upload_cases(server, cases)
+        for problem in problems:
+            upload_problem_to_judge_server(problem, server, with_cases=False)
+        missing = find_missing_cases(server, set(cases) - set(unavailable))
+        readiness.update(missing=len(missing) + len(unavailable))
+        if unavailable:
+            readiness.update(error="Data of cases %s cannot be found" % ", ".join(unavailable))
+    except:
+        readiness.update(error=traceback.format_exc())
+    readiness.update(ready=not readiness["missing"] and not readiness["error"])
+    return readiness
+
+
+def warm_up_contest(contest: Contest):
+    """
+    Push cases, checkers, validators and interactors of problems in contest to all enabled servers, then check
+    that the servers have all the cases.
+
+    :return: {<server_id>: readiness}, refer to `_warm_up_server`
+    """
+    client = _redis()
+    if not client.set(WARMUP_LOCK % contest.pk, 1, nx=True, ex=1800):
+        return get_readiness(contest)
+    try:
+        problems = list(Problem.objects.filter(pk__in=[p.problem_id for p in contest.contest_problem_list]))
+        cases = set()
+        for problem in problems:
+            cases.update(problem.pretest_list + problem.sample_list + problem.case_list)
+        servers = list(Server.objects.filter(enabled=True))
+        if not servers:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+            readiness = dict(zip([server.pk for server in servers],
+                                 executor.map(lambda server: _warm_up_server(server, problems, list(cases)), servers)))
+        for server in servers:
+            if readiness[server.pk]["ready"]:
+                for problem in problems:
+                    ServerProblemStatus.objects.update_or_create(server=server, problem=problem,
+                                                                 defaults={"last_status": ""})
+                record_affinity(server.pk, [str(problem.pk) for problem in problems], client=client)
+        key = WARMUP_KEY % contest.pk
+        with client.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.hmset(key, {server_id: json.dumps(r) for server_id, r in readiness.items()})
+            pipe.expire(key, 86400 * 2)
+            pipe.execute()
+        return readiness
+    finally:
+        client.delete(WARMUP_LOCK % contest.pk)
+
+
+def get_upcoming_contests(ahead=None):
+    """
+    Contests starting in `ahead` minutes (`settings.CONTEST_WARMUP_AHEAD` by default)
+    """
+    now = datetime.now()
+    if ahead is None:
+        ahead = settings.CONTEST_WARMUP_AHEAD
+    return Contest.objects.filter(start_time__gt=now, start_time__lte=now + timedelta(minutes=ahead))
+
+
+def warm_up_upcoming_contests():
+    """
+    Run every few minutes, servers missing nothing cost one request each
+    """
+    for contest in get_upcoming_contests():
+        try:
+            warm_up_contest(contest)
+        except:
+            traceback.print_exc()
+
+
+def get_readiness(contest: Contest):
+    """
+    :return: {<server_id>: readiness}, servers not warmed up yet are left out
+    """
+    return {int(server_id): json.loads(r) for server_id, r in _redis().hgetall(WARMUP_KEY % contest.pk).items()}
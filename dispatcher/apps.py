@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DispatcherConfig(AppConfig):
     name = 'dispatcher'
+
+    def ready(self):
+        # receivers saving runtime multiplier and concurrency of servers for routing
+        from . import health
@@ -0,0 +1,111 @@
+"""
+Pooled, keep-alive HTTP clients for all traffic to judge servers.
+
+Sessions are cached per process and per (address, auth), so that polling, uploading and pinging the same
+server reuse connections instead of paying TCP setup on every request. The number of sockets to a single
+server is bounded by `settings.JUDGE_HTTP_POOL_SIZE`; callers beyond that wait for a free connection.
+
+The async client (`run_on_servers`) is only for fanning out short requests over many servers at once (pings of
+the museum page and health probes). Everything else, including dispatching, case synchronization (threads over
+one session, refer to `dispatcher.manage.upload_cases`) and the polygon judge, goes through the sync sessions.
+"""
+
+import asyncio
+import os
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+DEFAULT_USERNAME = 'ejudge'
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class JudgeSession(requests.Session):
+    """
+    A session with default timeout, since requests does not support one.
+    """
+
+    def __init__(self, base_url, auth=None, timeout=None):
+        super().__init__()
+        self.base_url = base_url
+        self.auth = auth
+        self.timeout = timeout or settings.JUDGE_HTTP_TIMEOUT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.JUDGE_HTTP_POOL_SIZE, pool_block=True)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if url.startswith('/'):
+            url = self.base_url + url
+        return super().request(method, url, *args, **kwargs)
+
+
+def get_session(base_url, auth=None):
+    """
+    :param base_url: e.g. http://127.0.0.1:5000, paths starting with '/' are resolved against it
+    :param auth: tuple of (username, password) or None
+    """
+    # sessions are not shared across processes (django-q workers and multiprocessing pools fork)
+    key = (os.getpid(), base_url, auth)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = JudgeSession(base_url, auth)
+    return session
+
+
+def server_session(server):
+    """
+    :type server: dispatcher.models.Server
+    """
+    return get_session(server.http_address, (DEFAULT_USERNAME, server.token))
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def async_server_client(server, **kwargs):
+    """
+    An asyncio counterpart of `server_session`, to be used as `async with async_server_client(server) as client`.
+    Connections are kept alive within the block; concurrency is bounded the same way as the sync sessions.
+    """
+    import httpx
+
+    return httpx.AsyncClient(base_url=server.http_address,
+                             auth=(DEFAULT_USERNAME, server.token),
+                             timeout=httpx.Timeout(settings.JUDGE_HTTP_TIMEOUT[1],
+                                                   connect=settings.JUDGE_HTTP_TIMEOUT[0]),
+                             limits=httpx.Limits(max_connections=settings.JUDGE_HTTP_POOL_SIZE,
+                                                 max_keepalive_connections=settings.JUDGE_HTTP_POOL_SIZE),
+                             **kwargs)
+
+
+def run_on_servers(coroutine_func, servers):
+    """
+    Run `coroutine_func(server, client)` on all servers concurrently, and return the results in order.
+    Exceptions are returned in place of results.
+    """
+
+    async def run_one(server):
+        async with async_server_client(server) as client:
+            return await coroutine_func(server, client)
+
+    async def run_all():
+        return await asyncio.gather(*[run_one(server) for server in servers], return_exceptions=True)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run_all())
+    finally:
+        loop.close()
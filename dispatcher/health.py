@@ -0,0 +1,151 @@
+"""
+Health of judge servers, used by `dispatcher.semaphore.Semaphore` to route submissions.
+
+Each server has a hash `<namespace>:HEALTH:<server_id>` of:
+  success     moving average of results (1 for success, 0 for failure) of sending submissions and pings
+  latency     moving average of latency in milliseconds
+  failures    consecutive failures
+  dead_until  the server is drained (gets no submission) until then, refer to `settings.JUDGE_DRAIN_SECONDS`
+  multiplier  runtime multiplier, slower servers are less preferred (saved along with the server)
+  concurrency
+and a sorted set `<namespace>:AFFINITY:<server_id>` of affinity keys (e.g. problems) recently judged there,
+whose data the server is known to have.
+
+Results are recorded by dispatchers (`record_result`), and by background pings (`probe_servers`, scheduled with
+command `probe_judge_servers`), which also bring drained servers back.
+"""
+
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from .client import run_on_servers
+from .models import Server
+
+DEFAULT_NAMESPACE = 'SEMAPHORE'
+
+RECORD_SCRIPT = """
+redis.replicate_commands()
+local now = tonumber(redis.call('time')[1])
+local alpha = tonumber(ARGV[3])
+local h = redis.call('hmget', KEYS[1], 'success', 'latency')
+redis.call('hset', KEYS[1], 'success', (tonumber(h[1]) or 1) * (1 - alpha) + tonumber(ARGV[1]) * alpha)
+if ARGV[2] ~= '' then
+    local latency = tonumber(h[2])
+    if latency then
+        latency = latency * (1 - alpha) + tonumber(ARGV[2]) * alpha
+    else
+        latency = tonumber(ARGV[2])
+    end
+    redis.call('hset', KEYS[1], 'latency', latency)
+end
+if ARGV[1] == '1' then
+    local revived = tonumber(redis.call('hget', KEYS[1], 'dead_until') or 0) > now
+    redis.call('hmset', KEYS[1], 'failures', 0, 'dead_until', 0)
+    if ARGV[6] ~= '' then
+        redis.call('zadd', KEYS[2], now, ARGV[6])
+        redis.call('zremrangebyrank', KEYS[2], 0, -tonumber(ARGV[7]) - 1)
+    end
+    return revived and 1 or 0
+end
+if redis.call('hincrby', KEYS[1], 'failures', 1) >= tonumber(ARGV[4]) then
+    redis.call('hset', KEYS[1], 'dead_until', now + tonumber(ARGV[5]))
+end
+return 0
+"""
+
+
+def _redis():
+    return get_redis_connection("judge")
+
+
+def health_key(server_id, namespace=DEFAULT_NAMESPACE):
+    return '%s:HEALTH:%s' % (namespace, server_id)
+
+
+def affinity_key(server_id, namespace=DEFAULT_NAMESPACE):
+    return '%s:AFFINITY:%s' % (namespace, server_id)
+
+
+def record_result(server_id, success, latency=None, affinity=None, client=None, namespace=DEFAULT_NAMESPACE):
+    """
+    :param latency: in seconds, None if unknown
+    :param affinity: recorded for the server on success, refer to `Semaphore.acquire`
+    """
+    client = client or _redis()
+    revived = client.eval(RECORD_SCRIPT, 2, health_key(server_id, namespace), affinity_key(server_id, namespace),
+                          1 if success else 0, '' if latency is None else latency * 1000,
+                          settings.JUDGE_HEALTH_ALPHA, settings.JUDGE_HEALTH_MAX_FAILURES,
+                          settings.JUDGE_DRAIN_SECONDS, affinity or '', settings.JUDGE_AFFINITY_SIZE)
+    if revived:
+        # free slots of the server can be taken again
+        from .semaphore import Semaphore
+        Semaphore(client, namespace=namespace).wake()
+
+
+def record_affinity(server_id, affinities, client=None, namespace=DEFAULT_NAMESPACE):
+    """
+    Mark data of affinity keys (e.g. problems just uploaded) as present on the server
+    """
+    affinities = list(affinities)
+    if not affinities:
+        return
+    client = client or _redis()
+    now = int(time.time())
+    key = affinity_key(server_id, namespace)
+    with client.pipeline() as pipe:
+        pipe.zadd(key, {affinity: now for affinity in affinities})
+        pipe.zremrangebyrank(key, 0, -settings.JUDGE_AFFINITY_SIZE - 1)
+        pipe.execute()
+
+
+def update_server(server, client=None, namespace=DEFAULT_NAMESPACE):
+    """
+    Save runtime multiplier and concurrency of the server, they are part of its score
+
+    :param client: redis client or pipeline
+    """
+    client = client or _redis()
+    client.hmset(health_key(server.id, namespace),
+                 {'multiplier': server.runtime_multiplier, 'concurrency': server.concurrency})
+
+
+def get_health(server_id, client=None, namespace=DEFAULT_NAMESPACE):
+    """
+    :return: {success, latency (ms), failures, drained (bool)}
+    """
+    client = client or _redis()
+    health = {k.decode(): float(v) for k, v in client.hgetall(health_key(server_id, namespace)).items()}
+    return dict(success=health.get("success", 1), latency=health.get("latency"),
+                failures=int(health.get("failures", 0)), drained=health.get("dead_until", 0) > time.time())
+
+
+async def _timed_ping(server, client):
+    start_time = time.time()
+    try:
+        ok = (await client.get('/ping', timeout=settings.JUDGE_PING_TIMEOUT)).text == "pong"
+    except:
+        ok = False
+    return ok, time.time() - start_time
+
+
+def probe_servers(servers=None, client=None, namespace=DEFAULT_NAMESPACE):
+    """
+    Ping servers (all enabled ones by default) at the same time, and record the results
+    """
+    if servers is None:
+        servers = list(Server.objects.filter(enabled=True))
+    for server, result in zip(servers, run_on_servers(_timed_ping, servers)):
+        ok, latency = result if isinstance(result, tuple) else (False, None)
+        record_result(server.pk, ok, latency if ok else None, client=client, namespace=namespace)
+
+
+@receiver(post_save, sender=Server)
+def server_saved(sender, instance, **kwargs):
+    try:
+        update_server(instance)
+    except:
+        pass
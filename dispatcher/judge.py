@@ -1,21 +1,22 @@
+import json
+import threading
 import time
 import traceback
 from datetime import datetime
-from random import randint
 
-import requests
 from django.conf import settings
-from django.core.cache import cache
 from django.core.mail import send_mail
+from django.db import close_old_connections
 from django_redis import get_redis_connection
 
-# from dispatcher.semaphore import Semaphore
+from dispatcher.health import record_result
 from dispatcher.models import Server
 from dispatcher.semaphore import Semaphore
+from submission.report import save_report
 from utils import random_string
-from utils.detail_formatter import response_fail_with_timestamp, add_timestamp_to_reply
+from utils.detail_formatter import add_timestamp_to_reply
 from utils.site_settings import nonstop_judge
-from .manage import DEFAULT_USERNAME
+from .client import server_session
 
 
 def process_runtime(server, data):
@@ -28,57 +29,224 @@ def process_runtime(server, data):
         pass
 
 
+def get_result_channel(fingerprint):
+    return "JUDGE_RESULT:%s" % fingerprint
+
+
+def publish_judge_result(fingerprint, data):
+    """
+    Forward a result pushed by judge server (or any local stand-in) to the dispatcher watching `fingerprint`.
+    Returns the number of watchers that received the message.
+    """
+    return get_redis_connection("judge").publish(get_result_channel(fingerprint), json.dumps(data))
+
+
+def notify_admin_of_failure():
+    msg = "Time: %s\n%s" % (datetime.now(), traceback.format_exc())
+    send_mail(subject="Submit fail notice", message=msg, from_email=None,
+              recipient_list=settings.ADMIN_EMAIL_LIST,
+              fail_silently=True)
+    print(msg)
+
+
+class JudgeWatch(object):
+    """
+    State of one submission that has been sent to a judge server and is waiting for results.
+
+    Results arrive either pushed through redis channel `get_result_channel(fingerprint)`, or, when nothing
+    is pushed, by polling `/query` with exponential backoff.
+    """
+
+    def __init__(self, server, data, callback, timeout, report_instance=None, affinity=None):
+        self.server = server
+        self.affinity = affinity
+        self.data = data
+        self.fingerprint = data['fingerprint']
+        self.callback = callback
+        self.timeout = timeout
+        self.report_instance = report_instance
+        self.interval = settings.JUDGE_POLL_INTERVAL
+        self.next_poll_time = time.time() + self.interval
+        self.deadline = time.time() + timeout
+        self.finished = False
+
+    @property
+    def session(self):
+        return server_session(self.server)
+
+    def send(self):
+        self.data.update(hold=False)
+        if settings.JUDGE_CALLBACK_BASE_URL:
+            self.data.update(callback=settings.JUDGE_CALLBACK_BASE_URL.rstrip('/') +
+                                      '/api/judge/report/%d/' % self.server.pk)
+        start_time = time.time()
+        try:
+            response = self.session.post('/judge', json=self.data, timeout=self.timeout).json()
+        except:
+            record_result(self.server.pk, False)
+            raise
+        record_result(self.server.pk, True, time.time() - start_time, self.affinity)
+        if response.get('status') != 'received':
+            self.handle(response)
+
+    def poll(self):
+        response = self.session.get('/query', json={'fingerprint': self.fingerprint}, timeout=self.timeout).json()
+        self.interval = min(self.interval * settings.JUDGE_POLL_BACKOFF, settings.JUDGE_POLL_MAX_INTERVAL)
+        self.next_poll_time = time.time() + self.interval
+        return self.handle(response)
+
+    def handle(self, response):
+        """
+        Feed a response (pushed or polled) to the callback. Returns True when judge has finished.
+        """
+        if self.finished:
+            return True
+        response = add_timestamp_to_reply(response)
+        process_runtime(self.server, response)
+        self.deadline = time.time() + self.timeout
+        if self.callback(response):
+            self.finished = True
+            if response.get('status') == 'received' and self.report_instance is not None:
+                # written to files case by case, never kept as a whole
+                with self.session.get('/query/report', json={'fingerprint': self.fingerprint}, timeout=self.timeout,
+                                      stream=True) as report:
+                    save_report(self.report_instance, report.iter_lines())
+        return self.finished
+
+    def handle_message(self, message):
+        if message and message.get('type') == 'message':
+            return self.handle(json.loads(message['data']))
+        return False
+
+    @property
+    def timed_out(self):
+        return time.time() > self.deadline
+
+    @property
+    def seconds_to_next_poll(self):
+        return max(self.next_poll_time - time.time(), 0)
+
+
+class JudgeTracker(threading.Thread):
+    """
+    Tracks many in-flight submissions within one worker process: results pushed to redis are dispatched as
+    soon as they arrive, silent submissions are polled with backoff. Each semaphore token is released when
+    its submission finishes, so the worker itself is free right after sending.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__(name="judge-tracker")
+        self.pubsub = get_redis_connection("judge").pubsub(ignore_subscribe_messages=True)
+        # pattern subscription is done once here, since pubsub connections are not thread-safe
+        self.pubsub.psubscribe(get_result_channel("*"))
+        self.watches = {}
+
+    @classmethod
+    def track(cls, watch, semaphore, token):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.watches[watch.fingerprint] = (watch, semaphore, token)
+                cls._instance.start()
+            else:
+                cls._instance.watches[watch.fingerprint] = (watch, semaphore, token)
+
+    def _step(self, watch, func, *args):
+        try:
+            if watch.timed_out:
+                raise RuntimeError("Judge timed out.")
+            finished = func(*args)
+        except:
+            notify_admin_of_failure()
+            watch.finished = finished = True
+        if finished:
+            with self._lock:
+                _, semaphore, token = self.watches.pop(watch.fingerprint)
+            semaphore.signal(token)
+
+    def run(self):
+        while True:
+            with self._lock:
+                if not self.watches:
+                    # leave when idle; a new tracker is started by next `track`
+                    JudgeTracker._instance = None
+                    break
+                watches = [w for w, _, _ in self.watches.values()]
+            close_old_connections()
+            message = self.pubsub.get_message(timeout=min(w.seconds_to_next_poll for w in watches))
+            if message and message.get('type') == 'pmessage':
+                fingerprint = message['channel'].decode().split(":", 1)[1]
+                for watch in watches:
+                    if watch.fingerprint == fingerprint:
+                        self._step(watch, watch.handle, json.loads(message['data']))
+            for watch in watches:
+                if not watch.finished and watch.seconds_to_next_poll <= 0:
+                    self._step(watch, watch.poll)
+        self.pubsub.close()
+        close_old_connections()
+
+
 def send_judge_through_watch(code, lang, max_time, max_memory, run_until_complete, cases, checker,
-                             interactor, group_config, callback, timeout=900, report_instance=None):
+                             interactor, group_config, callback, timeout=900, report_instance=None,
+                             low_priority=False, affinity=None):
     """
     :param interactor: None or '' if there is no interactor
     :param callback: function, to call when something is returned (possibly preliminary results)
                      callback should return True when it thinks the result is final result, return False otherwise
                      callback will receive exactly one param, which is the data returned by judge server as a dict
     :param timeout: will fail if it has not heard from judge server for `timeout` seconds
+    :param low_priority: wait for judge servers behind others, e.g. for rejudges (refer to `Semaphore`)
+    :param affinity: e.g. the problem, servers that judged it recently (and have its data) are preferred
+
+    When `settings.JUDGE_DISPATCH_BLOCKING` is False, this returns as soon as the submission is sent, and the
+    callback is later called from a `JudgeTracker` thread of this process.
     """
 
     redis_server = get_redis_connection("judge")
 
-    with Semaphore(redis_server, stale_client_timeout=60) as (sem, token):
+    if not settings.JUDGE_DISPATCH_BLOCKING:
+        sem = Semaphore(redis_server, stale_client_timeout=60, low_priority=low_priority, affinity=affinity)
+        token = sem.acquire()
+        try:
+            server = Server.objects.get(pk=int(token.decode().split(":")[0]))
+            data = _prepare_judge_json_data(server, code, lang, max_time, max_memory, run_until_complete, cases,
+                                            checker, interactor, group_config)
+            watch = JudgeWatch(server, data, callback, timeout, report_instance, affinity)
+            watch.send()
+        except:
+            notify_admin_of_failure()
+            sem.signal(token)
+            return
+        if not watch.finished:
+            JudgeTracker.track(watch, sem, token)
+        else:
+            sem.signal(token)
+        return
+
+    with Semaphore(redis_server, stale_client_timeout=60, low_priority=low_priority,
+                   affinity=affinity) as (sem, token):
+        pubsub = redis_server.pubsub(ignore_subscribe_messages=True)
         try:
             server = Server.objects.get(pk=int(token.decode().split(":")[0]))
 
             data = _prepare_judge_json_data(server, code, lang, max_time, max_memory, run_until_complete, cases,
                                             checker, interactor, group_config)
-            data.update(hold=False)
-            judge_url = server.http_address + '/judge'
-            watch_url = server.http_address + '/query'
-            watch_report = server.http_address + '/query/report'
-            timeout_count = 0
-
-            response = add_timestamp_to_reply(requests.post(judge_url, json=data, auth=(DEFAULT_USERNAME, server.token),
-                                                            timeout=timeout).json())
-            process_runtime(server, response)
-            if response.get('status') != 'received':
-                callback(response)
-            while timeout_count < timeout:
-                interval = 0.5
-                time.sleep(interval)
-                response = add_timestamp_to_reply(requests.get(watch_url, json={'fingerprint': data['fingerprint']},
-                                                               auth=(DEFAULT_USERNAME, server.token),
-                                                               timeout=timeout).json())
-                process_runtime(server, response)
-                if callback(response):
-                    report_instance.content = requests.get(watch_report, json={'fingerprint': data['fingerprint']},
-                                                           auth=(DEFAULT_USERNAME, server.token), timeout=timeout).text
-                    report_instance.save()
-                    break
-                timeout_count += interval
-                interval += 0.1
-            if timeout_count >= timeout:
-                raise RuntimeError("Send judge through socketio timed out.")
+            watch = JudgeWatch(server, data, callback, timeout, report_instance, affinity)
+            pubsub.subscribe(get_result_channel(watch.fingerprint))
+            watch.send()
+            while not watch.finished:
+                if watch.timed_out:
+                    raise RuntimeError("Send judge through watch timed out.")
+                if not watch.handle_message(pubsub.get_message(timeout=watch.seconds_to_next_poll)) and \
+                        watch.seconds_to_next_poll <= 0:
+                    watch.poll()
         except:
-            msg = "Time: %s\n%s" % (datetime.now(), traceback.format_exc())
-            send_mail(subject="Submit fail notice", message=msg, from_email=None,
-                      recipient_list=settings.ADMIN_EMAIL_LIST,
-                      fail_silently=True)
-            print(msg)
+            notify_admin_of_failure()
+        finally:
+            pubsub.close()
 
 
 def _prepare_judge_json_data(server, code, lang, max_time, max_memory, run_until_complete, cases, checker, interactor,
@@ -1,33 +1,41 @@
+from .client import DEFAULT_USERNAME, server_session
 from .models import Server
 from .utils import is_success_response
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from os import path
+import os
+import tarfile
+import time
 import traceback
-
-DEFAULT_USERNAME = 'ejudge'
+import zlib
 
 
 # TODO: missing exception handling
 
 
 def ping(server):
-    url = server.http_address + '/ping'
     try:
-        if requests.get(url).text == "pong":
+        if server_session(server).get('/ping', timeout=settings.JUDGE_PING_TIMEOUT).text == "pong":
             return True
         return False
     except:
         return False
 
 
+async def async_ping(server, client):
+    try:
+        return (await client.get('/ping', timeout=settings.JUDGE_PING_TIMEOUT)).text == "pong"
+    except:
+        return False
+
+
 def update_token(server, new_password):
     """
     :type server: Server
     :return:
     """
-    url = server.http_address + '/config/token'
-    res = requests.post(url, json={'token': new_password}, auth=(DEFAULT_USERNAME, server.token)).json()
+    res = server_session(server).post('/config/token', json={'token': new_password}).json()
     if is_success_response(res):
         server.token = new_password
         server.save(update_fields=['token'])
@@ -35,44 +43,180 @@ def update_token(server, new_password):
     return False
 
 
+def _case_path(case, suffix):
+    return path.join(settings.TESTDATA_DIR, case + '.' + suffix)
+
+
 def upload_case(server, case):
-    url_check_exist = server.http_address + '/exist/case/%s' % case
-    url_input = server.http_address + '/upload/case/%s/input' % case
-    url_output = server.http_address + '/upload/case/%s/output' % case
-    if requests.get(url_check_exist).json().get('exist'):
+    session = server_session(server)
+    if session.get('/exist/case/%s' % case).json().get('exist'):
         return True
-    with open(path.join(settings.TESTDATA_DIR, case + '.in'), 'rb') as inf,\
-            open(path.join(settings.TESTDATA_DIR, case + '.out'), 'rb') as ouf:
-        res1 = requests.post(url_input, data=inf.read(), auth=(DEFAULT_USERNAME, server.token)).json()
-        res2 = requests.post(url_output, data=ouf.read(), auth=(DEFAULT_USERNAME, server.token)).json()
-    if not is_success_response(res1) and is_success_response(res2):
+    with open(_case_path(case, 'in'), 'rb') as inf, open(_case_path(case, 'out'), 'rb') as ouf:
+        # file objects are streamed
+        res1 = session.post('/upload/case/%s/input' % case, data=inf).json()
+        res2 = session.post('/upload/case/%s/output' % case, data=ouf).json()
+    if not (is_success_response(res1) and is_success_response(res2)):
         raise ValueError("%s; %s" % (res1, res2))
 
 
+class ManifestNotSupported(Exception):
+    pass
+
+
+def missing_cases(server, cases):
+    """
+    Ask the server which cases it does not have, `settings.JUDGE_SYNC_MANIFEST_SIZE` cases in one request:
+
+    POST /exist/cases {"cases": [<fingerprint>, ...]} -> {"status": "received", "missing": [<fingerprint>, ...]}
+
+    :raises ManifestNotSupported: when the server is too old to understand it
+    """
+    session = server_session(server)
+    missing = []
+    for i in range(0, len(cases), settings.JUDGE_SYNC_MANIFEST_SIZE):
+        res = session.post('/exist/cases', json={'cases': cases[i:i + settings.JUDGE_SYNC_MANIFEST_SIZE]})
+        if res.status_code == 404:
+            raise ManifestNotSupported
+        res = res.json()
+        if not is_success_response(res):
+            raise ValueError(str(res))
+        missing.extend(res['missing'])
+    return missing
+
+
+def find_missing_cases(server, cases):
+    """
+    :return: cases the server does not have, asked with manifests, or case by case if the server is too old
+    """
+    cases = sorted(set(cases))
+    try:
+        return missing_cases(server, cases)
+    except ManifestNotSupported:
+        session = server_session(server)
+        return [case for case in cases if not session.get('/exist/case/%s' % case).json().get('exist')]
+
+
+def bundle_stream(cases, compress=False, chunk_size=1 << 20):
+    """
+    A tar archive of `<fingerprint>.in` and `<fingerprint>.out` of cases (gzipped if compress), generated chunk by
+    chunk, so that no file is read into memory as a whole.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # gzip
+
+    def archive():
+        for case in cases:
+            for suffix in ('in', 'out'):
+                file_path = _case_path(case, suffix)
+                info = tarfile.TarInfo(case + '.' + suffix)
+                info.size = os.path.getsize(file_path)
+                info.mtime = int(time.time())
+                yield info.tobuf(format=tarfile.GNU_FORMAT)
+                with open(file_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b''):
+                        yield chunk
+                yield b'\0' * (-info.size % tarfile.BLOCKSIZE)
+        yield b'\0' * (tarfile.BLOCKSIZE * 2)
+
+    for chunk in archive():
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:  # an empty chunk ends a chunked request
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def upload_bundle(server, cases, compress=False):
+    """
+    POST /upload/cases with a tar archive of cases (refer to `bundle_stream`) -> {"status": "received"}
+    """
+    headers = {'Content-Type': 'application/x-tar'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    res = server_session(server).post('/upload/cases', data=bundle_stream(cases, compress), headers=headers).json()
+    if not is_success_response(res):
+        raise ValueError(str(res))
+
+
+def _case_size(case):
+    return path.getsize(_case_path(case, 'in')) + path.getsize(_case_path(case, 'out'))
+
+
+def upload_cases(server, cases, progress=None):
+    """
+    Upload cases the server does not have: ask with a manifest of fingerprints (refer to `missing_cases`), then upload
+    the missing ones in bundles of about `settings.JUDGE_SYNC_BUNDLE_SIZE` bytes, at most `server.concurrency`
+    bundles at the same time. Interrupted uploads are resumed by calling again, since only missing cases are sent.
+
+    Servers not understanding manifests are uploaded case by case.
+
+    :param progress: called with (number of cases, bytes) every time some cases are uploaded
+    :return: cases whose data files cannot be found, not uploaded
+    """
+    cases, sizes, unavailable = sorted(set(cases)), {}, []
+    for case in cases:
+        try:
+            sizes[case] = _case_size(case)
+        except OSError:
+            unavailable.append(case)
+    cases = [case for case in cases if case in sizes]
+    workers = max(min(server.concurrency, settings.JUDGE_HTTP_POOL_SIZE), 1)
+
+    try:
+        missing = missing_cases(server, cases) if cases else []
+    except ManifestNotSupported:
+        def upload_one(case):
+            upload_case(server, case)
+            if progress:
+                progress(1, sizes[case])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(upload_one, cases))
+        return unavailable
+
+    bundles, bundle, bundle_size = [], [], 0
+    for case in missing:
+        if case not in sizes:
+            continue
+        if bundle and bundle_size + sizes[case] > settings.JUDGE_SYNC_BUNDLE_SIZE:
+            bundles.append(bundle)
+            bundle, bundle_size = [], 0
+        bundle.append(case)
+        bundle_size += sizes[case]
+    if bundle:
+        bundles.append(bundle)
+
+    def upload_one_bundle(bundle):
+        upload_bundle(server, bundle, settings.JUDGE_SYNC_COMPRESS)
+        if progress:
+            progress(len(bundle), sum(sizes[case] for case in bundle))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(upload_one_bundle, bundles))
+    return unavailable
+
+
 def _upload_special_program(server, url, sp):
-    return requests.post(url, json={
+    return server_session(server).post(url, json={
         'fingerprint': sp.fingerprint,
         'lang': sp.lang,
         'code': sp.code
-    }, auth=(DEFAULT_USERNAME, server.token)).json()
+    }).json()
 
 
 def upload_checker(server, checker):
-    url = server.http_address + '/upload/checker'
-    res = _upload_special_program(server, url, checker)
+    res = _upload_special_program(server, '/upload/checker', checker)
     if not is_success_response(res):
         raise ValueError(str(res))
 
 
 def upload_validator(server, validator):
-    url = server.http_address + '/upload/validator'
-    res = _upload_special_program(server, url, validator)
+    res = _upload_special_program(server, '/upload/validator', validator)
     if not is_success_response(res):
         raise ValueError(str(res))
 
 
 def upload_interactor(server, interactor):
-    url = server.http_address + '/upload/interactor'
-    res = _upload_special_program(server, url, interactor)
+    res = _upload_special_program(server, '/upload/interactor', interactor)
     if not is_success_response(res):
         raise ValueError(str(res))
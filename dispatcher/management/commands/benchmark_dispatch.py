@@ -0,0 +1,240 @@
+import copy
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, close_old_connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django_redis import get_redis_connection
+
+from account.models import User
+from contest.models import Contest, ContestProblem
+from contest.tasks import judge_submission_on_contest
+from dispatcher.judge import JudgeTracker
+from dispatcher.models import Server
+from dispatcher.simulator import FakeJudgeServer
+from problem.models import Problem
+from problem.tasks import create_submission
+
+
+class QueryCounter(object):
+    """
+    Counts queries of all connections, installed on every connection created (one per thread)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.count += 1
+                self.time += time.time() - start
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def _redis_caches(db):
+    caches = copy.deepcopy(settings.CACHES)
+    for cache in caches.values():
+        if isinstance(cache.get("LOCATION"), str) and cache["LOCATION"].startswith("redis"):
+            cache["LOCATION"] = re.sub(r"(/\d+)?$", "/%d" % db, cache["LOCATION"], count=1)
+    return caches
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Replay a contest submission stream (recorded or synthetic) through the dispatcher against fake judge " \
+           "servers, in a throwaway database, and report verdict latency, queries per submission and utilization " \
+           "of workers. Redis database --redis-db is flushed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replay', type=int, help="id of a contest whose submissions are replayed")
+        parser.add_argument('--speed', type=float, default=10, help="replay this many times faster")
+        parser.add_argument('--submissions', type=int, default=300, help="size of the synthetic stream")
+        parser.add_argument('--rate', type=float, default=20, help="submissions per second of the synthetic stream")
+        parser.add_argument('--problems', type=int, default=10)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--cases', type=int, default=20, help="cases of each synthetic problem")
+        parser.add_argument('--servers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=4, help="slots of each judge server")
+        parser.add_argument('--compile-time', type=float, default=0.2)
+        parser.add_argument('--case-time', type=float, default=0.02)
+        parser.add_argument('--latency', type=float, default=0.002, help="seconds a judge server takes to answer")
+        parser.add_argument('--push', action='store_true', help="judge servers push results instead of being polled")
+        parser.add_argument('--workers', type=int, default=8, help="django-q workers")
+        parser.add_argument('--non-blocking', action='store_true', help="refer to settings.JUDGE_DISPATCH_BLOCKING")
+        parser.add_argument('--redis-db', type=int, default=15)
+        parser.add_argument('--timeout', type=float, default=600)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def load_stream(self, options):
+        """
+        :return: problems [{cases, pretests, points}], contest options, stream [(offset in seconds, problem index,
+                 user index, lang, code)]
+        """
+        rand = random.Random(options['seed'])
+        if options['replay'] is None:
+            problems = [dict(cases=",".join("bench%dc%d" % (p, i) for i in range(options['cases'])))
+                        for p in range(options['problems'])]
+            stream, offset = [], 0.
+            for i in range(options['submissions']):
+                offset += rand.expovariate(options['rate'])
+                stream.append((offset, rand.randrange(options['problems']), rand.randrange(options['users']), 'cpp',
+                               "int main() { return 0; } // %d" % i))
+            return problems, {}, stream
+
+        contest = Contest.objects.get(pk=options['replay'])
+        submissions = list(contest.submission_set.order_by("create_time").
+                           values_list("create_time", "problem_id", "author_id", "lang", "code"))
+        problem_ids = sorted(set(s[1] for s in submissions))
+        author_ids = sorted(set(s[2] for s in submissions))
+        problems = {p.pk: dict(cases=p.cases, pretests=p.pretests, points=p.points, group_config=p.group_config)
+                    for p in Problem.objects.filter(pk__in=problem_ids)}
+        start_time = submissions[0][0] if submissions else datetime.now()
+        stream = [((create_time - start_time).total_seconds() / options['speed'], problem_ids.index(problem_id),
+                   author_ids.index(author_id), lang, code)
+                  for create_time, problem_id, author_id, lang, code in submissions]
+        options['users'] = len(author_ids)
+        return [problems[pk] for pk in problem_ids], dict(scoring_method=contest.scoring_method,
+                                                          run_tests_during_contest=contest.run_tests_during_contest,
+                                                          allowed_lang=contest.allowed_lang), stream
+
+    def handle(self, *args, **options):
+        problems, contest_options, stream = self.load_stream(options)
+        if not stream:
+            self.stdout.write("Nothing to replay")
+            return
+
+        old_name = connection.settings_dict['NAME']
+        test_db_file = None
+        if connection.vendor == 'sqlite':
+            # in-memory databases cannot be written by many threads
+            fd, test_db_file = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = test_db_file
+            self.stdout.write("SQLite fails concurrent writes in transactions (as failures), "
+                              "numbers are only meaningful with the database engine used in production")
+        self.stdout.write("Creating a throwaway database...")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        judges = [FakeJudgeServer(latency=options['latency'], compile_time=options['compile_time'],
+                                  case_time=options['case_time'], push=options['push'],
+                                  seed=options['seed'] + i).start() for i in range(options['servers'])]
+        try:
+            with override_settings(CACHES=_redis_caches(options['redis_db']), SUBMISSION_INTERVAL_LIMIT=0,
+                                   JUDGE_DISPATCH_BLOCKING=not options['non_blocking'],
+                                   JUDGE_CALLBACK_BASE_URL=None, ADMIN_EMAIL_LIST=[]):
+                get_redis_connection("judge").flushdb()
+                try:
+                    result = self.run(judges, problems, contest_options, stream, options)
+                finally:
+                    get_redis_connection("judge").flushdb()
+        finally:
+            for judge in judges:
+                judge.stop()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if test_db_file and os.path.exists(test_db_file):
+                os.remove(test_db_file)
+        self.report(result, judges, options)
+
+    def run(self, judges, problems, contest_options, stream, options):
+        users = [User.objects.create(username="bench%d" % i, email="bench%d@example.com" % i)
+                 for i in range(options['users'])]
+        contest = Contest.objects.create(title="benchmark", start_time=datetime.now() - timedelta(minutes=1),
+                                         end_time=datetime.now() + timedelta(days=1), **contest_options)
+        problem_objects = []
+        for i, problem in enumerate(problems):
+            problem_objects.append(Problem.objects.create(title="benchmark %d" % i, **problem))
+            ContestProblem.objects.create(contest=contest, problem=problem_objects[-1], identifier=str(i + 1))
+        for i, judge in enumerate(judges):
+            Server.objects.create(name="fake%d" % i, ip=judge.ip, port=judge.port, token=judge.token, enabled=True,
+                                  concurrency=options['concurrency'])
+
+        counter = QueryCounter()
+        counter.install(connection=connection)
+        connection_created.connect(counter.install)
+        tasks = queue.Queue()
+        created, finished, busy = {}, {}, Counter()
+
+        def worker(name):
+            while True:
+                submission = tasks.get()
+                if submission is None:
+                    break
+                start_time = time.time()
+                try:
+                    # what django-q runs for `ContestSubmit`
+                    judge_submission_on_contest(submission, contest=contest,
+                                                callback=lambda pk=submission.pk: finished.setdefault(pk, time.time()))
+                except:
+                    pass
+                busy[name] += time.time() - start_time
+                close_old_connections()
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(options['workers'])]
+        for t in threads:
+            t.start()
+        start_time = time.time()
+        try:
+            for offset, problem, user, lang, code in stream:
+                time.sleep(max(start_time + offset - time.time(), 0))
+                # what `ContestSubmit` does
+                submission = create_submission(problem_objects[problem], users[user], code, lang, contest=contest)
+                contest.contestparticipant_set.get_or_create(user=users[user])
+                submission.contest_time = submission.create_time - contest.start_time
+                submission.save(update_fields=["contest_time"])
+                created[submission.pk] = time.time()
+                tasks.put(submission)
+            for _ in threads:
+                tasks.put(None)
+            for t in threads:
+                t.join()
+            # results of non-blocking dispatches are still coming, the tracker leaves when idle
+            deadline = time.time() + options['timeout']
+            while JudgeTracker._instance is not None and time.time() < deadline:
+                time.sleep(0.1)
+            elapsed = time.time() - start_time
+        finally:
+            connection_created.disconnect(counter.install)
+        return dict(submissions=len(created), judged=len(finished), elapsed=elapsed,
+                    latencies=[finished[pk] - created[pk] for pk in finished],
+                    queries=counter.count, db_time=counter.time, busy=sum(busy.values()))
+
+    def report(self, result, judges, options):
+        submissions = result["submissions"]
+        requests = Counter()
+        for judge in judges:
+            requests.update(judge.requests)
+        self.stdout.write("submissions:                %d (%d failed)" % (submissions,
+                                                                        submissions - result["judged"]))
+        self.stdout.write("throughput:                 %.1f submissions/s" % (submissions / result["elapsed"]))
+        self.stdout.write("verdict latency:            p50 %.0f ms, p99 %.0f ms" % (
+            _percentile(result["latencies"], 0.5) * 1000, _percentile(result["latencies"], 0.99) * 1000))
+        self.stdout.write("queries per submission:     %.1f (%.1f ms)" % (
+            result["queries"] / submissions, result["db_time"] / submissions * 1000))
+        self.stdout.write("worker utilization:         %.1f%%" % (
+            result["busy"] / (options['workers'] * result["elapsed"]) * 100))
+        self.stdout.write("judge requests/submission:  %s" % ", ".join(
+            "%s %.1f" % (path, count / submissions) for path, count in sorted(requests.items())))
@@ -0,0 +1,99 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from dispatcher.client import get_session, close_sessions, DEFAULT_USERNAME
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with _CountingHandler.lock:
+            _CountingHandler.connections += 1
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        body = json.dumps({"status": "received", "verdict": -1}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Compare latency and sockets opened per judged submission, with and without pooled sessions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=200)
+        parser.add_argument('--polls', type=int, default=10, help="number of /query requests per submission")
+        parser.add_argument('--threads', type=int, default=8)
+
+    def run(self, base_url, get, post, submissions, polls, threads):
+        latencies = []
+        lock = threading.Lock()
+
+        def judge_one():
+            local = []
+            for method, path in [(post, '/judge')] + [(get, '/query')] * polls + [(get, '/query/report')]:
+                start = time.time()
+                method(base_url + path, json={'fingerprint': 'benchmark'}, auth=(DEFAULT_USERNAME, 'token')).json()
+                local.append(time.time() - start)
+            with lock:
+                latencies.extend(local)
+
+        def worker(count):
+            for _ in range(count):
+                judge_one()
+
+        _CountingHandler.connections = 0
+        workers = [threading.Thread(target=worker, args=(submissions // threads,)) for _ in range(threads)]
+        start = time.time()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.time() - start
+        latencies.sort()
+        judged = submissions // threads * threads
+        return {
+            "p50": latencies[len(latencies) // 2] * 1000,
+            "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+            "sockets": _CountingHandler.connections / judged,
+            "throughput": judged / elapsed,
+        }
+
+    def handle(self, *args, **options):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base_url = "http://127.0.0.1:%d" % httpd.server_port
+        run_args = (options['submissions'], options['polls'], options['threads'])
+        try:
+            before = self.run(base_url, requests.get, requests.post, *run_args)
+            session = get_session(base_url)
+            after = self.run("", session.get, session.post, *run_args)
+        finally:
+            httpd.shutdown()
+            close_sessions()
+        self.stdout.write("%-8s %10s %10s %18s %18s" % ("", "p50 (ms)", "p99 (ms)", "sockets/submission",
+                                                        "submissions/s"))
+        for name, result in (("before", before), ("after", after)):
+            self.stdout.write("%-8s %10.2f %10.2f %18.2f %18.1f" % (name, result["p50"], result["p99"],
+                                                                    result["sockets"], result["throughput"]))
@@ -0,0 +1,166 @@
+import json
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from dispatcher.client import server_session, close_sessions
+from dispatcher.health import record_result, probe_servers
+from dispatcher.models import Server
+from dispatcher.semaphore import Semaphore
+
+NAMESPACE = 'SEMAPHORE_BENCHMARK'
+
+
+def _fake_judge_handler(latency):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            if self.path == '/ping':
+                body = b"pong"
+            else:
+                time.sleep(latency)
+                body = json.dumps({"status": "received"}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = _reply
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = "Load test of judge server scheduling against fake local judge servers, with and without health"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', type=int, default=4)
+        parser.add_argument('--dead', type=int, default=1, help="number of servers not listening")
+        parser.add_argument('--slow', type=int, default=1, help="number of servers 3 times slower")
+        parser.add_argument('--concurrency', type=int, default=4, help="slots of each server")
+        parser.add_argument('--submissions', type=int, default=400)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--judge-time', type=float, default=0.05, help="seconds to judge on a normal server")
+        parser.add_argument('--problems', type=int, default=20)
+
+    def run(self, servers, health, options):
+        client = get_redis_connection("judge")
+        for key in client.scan_iter(NAMESPACE + ":*"):
+            client.delete(key)
+        Semaphore(client, namespace=NAMESPACE).exists_or_init(servers)
+        by_id = {server.pk: server for server in servers}
+        waits, used, errors = [], Counter(), Counter()
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def prober():
+            while not stop.wait(1):
+                probe_servers(servers, client=client, namespace=NAMESPACE)
+
+        def judge_one():
+            rand = random.Random()
+            affinity = str(rand.randint(1, options['problems']))
+            start = time.time()
+            sem = Semaphore(client, stale_client_timeout=60, namespace=NAMESPACE,
+                            affinity=affinity if health else None)
+            token = sem.acquire()
+            wait = time.time() - start
+            server = by_id[int(token.decode().split(":")[0])]
+            ok = True
+            try:
+                send_start = time.time()
+                server_session(server).post('/judge', json={}, timeout=(0.5, 5)).json()
+                if health:
+                    record_result(server.pk, True, time.time() - send_start, affinity, client=client,
+                                  namespace=NAMESPACE)
+                time.sleep(options['judge_time'] * server.runtime_multiplier)
+            except:
+                ok = False
+                if health:
+                    record_result(server.pk, False, client=client, namespace=NAMESPACE)
+            finally:
+                sem.signal(token)
+            with lock:
+                waits.append(wait)
+                used[server.name] += 1
+                if not ok:
+                    errors[server.name] += 1
+            return ok
+
+        def worker(count):
+            for _ in range(count):
+                while not judge_one():
+                    pass  # a failed submission is sent again
+
+        if health:
+            probe_servers(servers, client=client, namespace=NAMESPACE)
+            threading.Thread(target=prober, daemon=True).start()
+        per_worker = options['submissions'] // options['workers']
+        threads = [threading.Thread(target=worker, args=(per_worker,)) for _ in range(options['workers'])]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+        stop.set()
+        for key in client.scan_iter(NAMESPACE + ":*"):
+            client.delete(key)
+        waits.sort()
+        return {
+            "throughput": per_worker * options['workers'] / elapsed,
+            "p50": waits[len(waits) // 2] * 1000,
+            "p99": waits[int(len(waits) * 0.99)] * 1000,
+            "errors": sum(errors.values()),
+            "used": used,
+        }
+
+    def handle(self, *args, **options):
+        servers, httpds = [], []
+        for i in range(options['servers']):
+            dead = i < options['dead']
+            slow = options['dead'] <= i < options['dead'] + options['slow']
+            multiplier = 3 if slow else 1
+            if dead:
+                port = _closed_port()
+            else:
+                httpd = ThreadingHTTPServer(("127.0.0.1", 0), _fake_judge_handler(0.005 * multiplier))
+                threading.Thread(target=httpd.serve_forever, daemon=True).start()
+                httpds.append(httpd)
+                port = httpd.server_port
+            servers.append(Server(id=i + 1, name="%s%d" % ("dead" if dead else "slow" if slow else "judge", i + 1),
+                                  ip="127.0.0.1", port=port, token="token", concurrency=options['concurrency'],
+                                  runtime_multiplier=multiplier))
+        try:
+            results = [("no health", self.run(servers, False, options)), ("health", self.run(servers, True, options))]
+        finally:
+            for httpd in httpds:
+                httpd.shutdown()
+            close_sessions()
+
+        self.stdout.write("%-10s %14s %14s %14s %8s  %s" % ("", "submissions/s", "wait p50 (ms)", "wait p99 (ms)",
+                                                         "errors", "submissions per server"))
+        for name, result in results:
+            self.stdout.write("%-10s %14.1f %14.2f %14.2f %8d  %s" % (
+                name, result["throughput"], result["p50"], result["p99"], result["errors"],
+                ", ".join("%s: %d" % (server.name, result["used"][server.name]) for server in servers)))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+from django_q.tasks import schedule
+
+from dispatcher.health import probe_servers, get_health
+from dispatcher.models import Server
+
+PROBE_TASK = "dispatcher.health.probe_servers"
+
+
+class Command(BaseCommand):
+    help = "Ping enabled judge servers and record their health, refer to dispatcher.health"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedule', action='store_true',
+                            help="probe every minute with django-q, instead of now")
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            if not Schedule.objects.filter(func=PROBE_TASK).exists():
+                schedule(PROBE_TASK, name="probe judge servers", schedule_type=Schedule.MINUTES, minutes=1)
+            self.stdout.write("Scheduled every minute.")
+            return
+        servers = list(Server.objects.filter(enabled=True))
+        probe_servers(servers)
+        for server in servers:
+            health = get_health(server.pk)
+            self.stdout.write("%s: success %.2f, latency %s, %s" % (
+                server.name, health["success"],
+                "%.1f ms" % health["latency"] if health["latency"] is not None else "unknown",
+                "drained" if health["drained"] else "healthy"))
@@ -1,8 +1,11 @@
 from redis import StrictRedis
 import time
-import sys
 
+from django.conf import settings
+
+from dispatcher.health import DEFAULT_NAMESPACE, update_server
 from dispatcher.models import Server
+from utils import random_string
 
 
 class NotAvailable(Exception):
@@ -12,61 +15,235 @@ class NotAvailable(Exception):
 
 class Semaphore(object):
     """
-    Modified from: https://github.com/bluele/redis-semaphore/blob/master/redis_semaphore/__init__.py
+    Slots of judge servers, as tokens "<server_id>:<slot>". Originally modified from:
+    https://github.com/bluele/redis-semaphore/blob/master/redis_semaphore/__init__.py
+
+    A token is taken with one script (refer to `ACQUIRE_SCRIPT`), from the server with the best score:
+    success rate, latency and speed (refer to `dispatcher.health`), share of free slots, with a bonus when the server
+    is known to have the data (affinity). Drained servers get nothing, unless all servers are drained.
+
+    Acquirers waiting in blocking mode are woken up by released tokens through a list. Low priority tokens are only
+    taken while no normal acquirer is waiting, and while fewer than a share of all tokens are held in low priority.
+    """
+
+    # layout of the keys, changed along with it so that semaphores of the old layout are initialized again
+    exists_val = 'set'
+
+    ACQUIRE_SCRIPT = """
+    redis.replicate_commands()
+    if redis.call('get', KEYS[1]) ~= ARGV[9] then
+        return -1
+    end
+    local time = redis.call('time')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local prefix = ARGV[1]
+
+    -- release stale tokens, at most once every 10 seconds
+    local stale = tonumber(ARGV[2])
+    if stale >= 0 and redis.call('set', KEYS[6], 1, 'NX', 'EX', 10) then
+        local grabbed = redis.call('hgetall', KEYS[3])
+        for i = 1, #grabbed, 2 do
+            if tonumber(grabbed[i + 1]) + stale < now then
+                redis.call('hdel', KEYS[3], grabbed[i])
+                redis.call('srem', KEYS[4], grabbed[i])
+                redis.call('sadd', KEYS[2], grabbed[i])
+            end
+        end
+        redis.call('zremrangebyscore', KEYS[5], '-inf', now)
+    end
+
+    local low_priority = ARGV[3] == '1'
+    if low_priority then
+        local capacity = redis.call('scard', KEYS[2]) + redis.call('hlen', KEYS[3])
+        if redis.call('zcount', KEYS[5], now, '+inf') > 0 or
+                redis.call('scard', KEYS[4]) >= math.max(math.floor(capacity * tonumber(ARGV[4])), 1) then
+            return false
+        end
+    end
+
+    local free, servers = {}, {}
+    for _, token in ipairs(redis.call('smembers', KEYS[2])) do
+        local server = string.match(token, '^(%d+):')
+        if free[server] == nil then
+            free[server] = {}
+            table.insert(servers, server)
+        end
+        table.insert(free[server], token)
+    end
+
+    local best, best_score, best_drained = nil, -1, nil
+    for _, server in ipairs(servers) do
+        local h = redis.call('hmget', prefix .. 'HEALTH:' .. server,
+                             'success', 'latency', 'multiplier', 'concurrency', 'dead_until')
+        local score = (tonumber(h[1]) or 1) / (1 + (tonumber(h[2]) or 0) / 1000) /
+                      math.max(tonumber(h[3]) or 1, 0.01) * #free[server] / math.max(tonumber(h[4]) or 1, 1)
+        if ARGV[5] ~= '' and redis.call('zscore', prefix .. 'AFFINITY:' .. server, ARGV[5]) then
+            score = score * tonumber(ARGV[6])
+        end
+        if (tonumber(h[5]) or 0) > now then
+            if best_drained == nil then
+                best_drained = server
+            end
+        elseif score > best_score then
+            best, best_score = server, score
+        end
+    end
+
+    if best == nil and best_drained ~= nil then
+        -- all servers with free slots are drained: wait for the others, or take it if all servers are drained
+        for _, server in ipairs(redis.call('smembers', KEYS[7])) do
+            if tonumber(redis.call('hget', prefix .. 'HEALTH:' .. server, 'dead_until') or 0) <= now then
+                best_drained = nil
+                break
+            end
+        end
+        best = best_drained
+    end
+    if best == nil then
+        if not low_priority and ARGV[7] ~= '' then
+            redis.call('zadd', KEYS[5], now + tonumber(ARGV[8]), ARGV[7])
+        end
+        return false
+    end
+
+    local token = free[best][1]
+    redis.call('srem', KEYS[2], token)
+    redis.call('hset', KEYS[3], token, now)
+    if low_priority then
+        redis.call('sadd', KEYS[4], token)
+    elseif ARGV[7] ~= '' then
+        redis.call('zrem', KEYS[5], ARGV[7])
+    end
+    return token
     """
 
-    exists_val = 'ok'
+    # tokens not grabbed (e.g. released twice, or taken before a reset) are not put back
+    SIGNAL_SCRIPT = """
+    if redis.call('hdel', KEYS[1], ARGV[1]) == 0 then
+        return 0
+    end
+    redis.call('srem', KEYS[2], ARGV[1])
+    redis.call('sadd', KEYS[3], ARGV[1])
+    redis.call('lpush', KEYS[4], ARGV[1])
+    redis.call('ltrim', KEYS[4], 0, redis.call('scard', KEYS[3]) - 1)
+    return 1
+    """
 
-    def __init__(self, client, stale_client_timeout=None, blocking=True):
+    def __init__(self, client, stale_client_timeout=None, blocking=True, low_priority=False, affinity=None,
+                 namespace=DEFAULT_NAMESPACE):
+        """
+        :param low_priority: for batch jobs (e.g. rejudge), refer to `ACQUIRE_SCRIPT`
+        :param affinity: e.g. the problem, servers recently judging it are preferred
+        """
         self.client = client or StrictRedis()
-        self.namespace = 'SEMAPHORE'
+        self.namespace = namespace
         self.stale_client_timeout = stale_client_timeout
         self.is_use_local_time = False
         self.blocking = blocking
+        self.low_priority = low_priority
+        self.affinity = affinity
         self._local_tokens = list()
 
-    def exists_or_init(self):
+    def exists_or_init(self, servers=None):
         old_key = self.client.getset(self.check_exists_key, self.exists_val)
-        if old_key:
+        if old_key == self.exists_val.encode():
             return False
-        return self._init()
+        return self._init(servers)
 
-    def _init(self):
+    def _init(self, servers=None):
+        """
+        :param servers: enabled servers by default
+        """
         self.client.expire(self.check_exists_key, 10)
+        if servers is None:
+            servers = Server.objects.filter(enabled=True)
         keys = []
-        for server in Server.objects.filter(enabled=True):
-            keys += list(map(lambda x: "%d:%d" % (server.id, x), range(server.concurrency)))
-        if not keys:
-            keys = ['0:0']  # this will raise no server error
-
         with self.client.pipeline() as pipe:
             pipe.multi()
-            pipe.delete(self.grabbed_key, self.available_key)
-            pipe.rpush(self.available_key, *keys)
+            # list of free tokens in the old layout
+            pipe.delete(self.get_namespaced_key('AVAILABLE'))
+            pipe.delete(self.grabbed_key, self.available_key, self.low_priority_key, self.servers_key)
+            for server in servers:
+                keys += list(map(lambda x: "%d:%d" % (server.id, x), range(server.concurrency)))
+                pipe.sadd(self.servers_key, server.id)
+                update_server(server, pipe, self.namespace)
+            if not keys:
+                keys = ['0:0']  # this will raise no server error
+            pipe.sadd(self.available_key, *keys)
             pipe.execute()
         self.client.persist(self.check_exists_key)
+        self.wake(len(keys))
+        return True
+
+    def wake(self, count=None):
+        """
+        Wake up acquirers waiting, e.g. when drained servers are back
+        """
+        if count is None:
+            count = self.available_count
+        if count:
+            with self.client.pipeline() as pipe:
+                pipe.lpush(self.wakeup_key, *(['wake'] * count))
+                pipe.ltrim(self.wakeup_key, 0, count - 1)
+                pipe.execute()
 
     @property
     def available_count(self):
-        return self.client.llen(self.available_key)
+        return self.client.scard(self.available_key)
+
+    @property
+    def available_tokens(self):
+        return sorted(token.decode() for token in self.client.smembers(self.available_key))
+
+    @property
+    def capacity(self):
+        return self.available_count + self.client.hlen(self.grabbed_key)
+
+    @property
+    def low_priority_count(self):
+        return self.client.scard(self.low_priority_key)
+
+    @property
+    def low_priority_limit(self):
+        return max(int(self.capacity * settings.REJUDGE_CAPACITY_SHARE), 1)
+
+    def _try_acquire(self, waiter=None, wait=0):
+        while True:
+            token = self.client.eval(self.ACQUIRE_SCRIPT, 7, self.check_exists_key, self.available_key,
+                                     self.grabbed_key, self.low_priority_key, self.waiting_key,
+                                     self.check_release_locks_key, self.servers_key,
+                                     self.get_namespaced_key(''),
+                                     -1 if self.stale_client_timeout is None else self.stale_client_timeout,
+                                     1 if self.low_priority else 0, settings.REJUDGE_CAPACITY_SHARE,
+                                     self.affinity or '', settings.JUDGE_AFFINITY_BONUS, waiter or '', wait + 1,
+                                     self.exists_val)
+            if token != -1:
+                return token
+            if not self.exists_or_init():
+                time.sleep(0.1)  # initialized by someone else right now
 
     def acquire(self, timeout=0, target=None):
-        self.exists_or_init()
-        if self.stale_client_timeout is not None:
-            self.release_stale_locks()
-
-        if self.blocking:
-            pair = self.client.blpop(self.available_key, timeout)
-            if pair is None:
-                raise NotAvailable
-            token = pair[1]
-        else:
-            token = self.client.lpop(self.available_key)
-            if token is None:
-                raise NotAvailable
+        deadline = time.time() + timeout
+        waiter = random_string() if self.blocking and not self.low_priority else None
+        try:
+            while True:
+                wait = 1 if not timeout else min(max(deadline - time.time(), 0), 1)
+                token = self._try_acquire(waiter, wait)
+                if token is not None:
+                    break
+                if not self.blocking or (timeout and time.time() >= deadline):
+                    raise NotAvailable
+                if self.low_priority:
+                    # do not take wakeups from normal acquirers
+                    time.sleep(0.2)
+                else:
+                    self.client.blpop(self.wakeup_key, max(int(wait), 1))
+        except NotAvailable:
+            if waiter is not None:
+                self.client.zrem(self.waiting_key, waiter)
+            raise
 
         self._local_tokens.append(token)
-        self.client.hset(self.grabbed_key, token, self.current_time)
         if target is not None:
             try:
                 target(token)
@@ -74,19 +251,6 @@ class Semaphore(object):
                 self.signal(token)
         return token
 
-    def release_stale_locks(self, expires=10):
-        token = self.client.getset(self.check_release_locks_key, self.exists_val)
-        if token:
-            return False
-        self.client.expire(self.check_release_locks_key, expires)
-        try:
-            for token, looked_at in self.client.hgetall(self.grabbed_key).items():
-                timed_out_at = float(looked_at) + self.stale_client_timeout
-                if timed_out_at < self.current_time:
-                    self.signal(token)
-        finally:
-            self.client.delete(self.check_release_locks_key)
-
     def _is_locked(self, token):
         return self.client.hexists(self.grabbed_key, token)
 
@@ -107,12 +271,9 @@ class Semaphore(object):
     def signal(self, token):
         if token is None:
             return None
-        with self.client.pipeline() as pipe:
-            pipe.multi()
-            pipe.hdel(self.grabbed_key, token)
-            pipe.lpush(self.available_key, token)
-            pipe.execute()
-            return token
+        self.client.eval(self.SIGNAL_SCRIPT, 4, self.grabbed_key, self.low_priority_key, self.available_key,
+                         self.wakeup_key, token)
+        return token
 
     def get_namespaced_key(self, suffix):
         return '{0}:{1}'.format(self.namespace, suffix)
@@ -123,12 +284,28 @@ class Semaphore(object):
 
     @property
     def available_key(self):
-        return self._get_and_set_key('_available_key', 'AVAILABLE')
+        return self._get_and_set_key('_available_key', 'AVAILABLE_SET')
 
     @property
     def grabbed_key(self):
         return self._get_and_set_key('_grabbed_key', 'GRABBED')
 
+    @property
+    def low_priority_key(self):
+        return self._get_and_set_key('_low_priority_key', 'LOW_PRIORITY')
+
+    @property
+    def waiting_key(self):
+        return self._get_and_set_key('_waiting_key', 'WAITING')
+
+    @property
+    def wakeup_key(self):
+        return self._get_and_set_key('_wakeup_key', 'WAKEUP')
+
+    @property
+    def servers_key(self):
+        return self._get_and_set_key('_servers_key', 'SERVERS')
+
     @property
     def check_release_locks_key(self):
         return self._get_and_set_key('_release_locks_ley', 'RELEASE_LOCKS')
@@ -150,4 +327,4 @@ class Semaphore(object):
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.release()
-        return True if exc_type is None else False
\ No newline at end of file
+        return True if exc_type is None else False
@@ -0,0 +1,240 @@
+"""
+A fake judge server, speaking the protocol the dispatcher speaks to real judge servers, without judging anything.
+Verdicts are drawn from a distribution and results take a configurable time to come out, case by case.
+
+Used by benchmarks (refer to command `benchmark_dispatch`) and tests:
+
+    with FakeJudgeServer(verdicts={SubmissionStatus.ACCEPTED: 1}) as judge:
+        server = Server.objects.create(name="fake", ip=judge.ip, port=judge.port, token=judge.token, enabled=True)
+        ...
+
+Endpoints: /judge, /query, /query/report, /exist/case/<fp>, /exist/cases, /upload/case/<fp>/<input|output>,
+/upload/cases, /upload/<checker|validator|interactor>, /config/token and /ping.
+"""
+
+import base64
+import gzip
+import io
+import json
+import random
+import tarfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from submission.util import SubmissionStatus
+from .client import DEFAULT_USERNAME
+
+DEFAULT_VERDICTS = {
+    SubmissionStatus.ACCEPTED: 0.5,
+    SubmissionStatus.WRONG_ANSWER: 0.3,
+    SubmissionStatus.TIME_LIMIT_EXCEEDED: 0.1,
+    SubmissionStatus.RUNTIME_ERROR: 0.05,
+    SubmissionStatus.COMPILE_ERROR: 0.05,
+}
+
+
+class FakeJudge(object):
+    """
+    State of one submission on the fake server
+    """
+
+    def __init__(self, data, verdict, start_time, compile_time, case_time, rand):
+        self.fingerprint = data['fingerprint']
+        self.callback = data.get('callback')
+        self.verdict = verdict
+        cases = len(data.get('cases') or [])
+        if verdict == SubmissionStatus.COMPILE_ERROR or not cases:
+            self.details = []
+        elif verdict == SubmissionStatus.ACCEPTED:
+            self.details = [SubmissionStatus.ACCEPTED] * cases
+        else:
+            # the first failed case, the ones after it run only if asked to
+            failed = rand.randrange(cases)
+            self.details = [SubmissionStatus.ACCEPTED] * failed + [verdict]
+            if data.get('run_until_complete'):
+                self.details += [rand.choice([SubmissionStatus.ACCEPTED, verdict])
+                                 for _ in range(cases - failed - 1)]
+        self.case_finish_times = [start_time + compile_time + case_time * (i + 1) for i in range(len(self.details))]
+        self.finish_time = start_time + compile_time + case_time * len(self.details)
+
+    def result(self, now=None):
+        if now is None:
+            now = time.time()
+        finished = now >= self.finish_time
+        if finished and self.verdict == SubmissionStatus.COMPILE_ERROR:
+            return {"status": "received", "verdict": self.verdict, "message": "fake compile error",
+                    "fingerprint": self.fingerprint}
+        detail = [{"verdict": verdict, "time": 0.01, "memory": 1024}
+                  for verdict, finish_time in zip(self.details, self.case_finish_times) if finish_time <= now]
+        return {"status": "received", "verdict": self.verdict if finished else SubmissionStatus.JUDGING, "detail": detail,
+                "fingerprint": self.fingerprint}
+
+    def report(self):
+        # meta|input|output|answer|checker, texts in base64, refer to `submission.report`
+        def b64(text):
+            return base64.b64encode(text.encode()).decode()
+
+        return "\n".join("|".join(["verdict %d" % verdict, b64("input %d\n" % i), b64("output %d\n" % i),
+                                    b64("answer %d\n" % i), b64("ok" if verdict == SubmissionStatus.ACCEPTED else "")])
+                         for i, verdict in enumerate(self.details, start=1))
+
+
+class FakeJudgeServer(object):
+
+    def __init__(self, ip='127.0.0.1', port=0, token='token', latency=0.0, compile_time=0.1, case_time=0.02,
+                 verdicts=None, jitter=0.5, push=False, seed=None):
+        """
+        :param latency: seconds taken to answer any request
+        :param compile_time: seconds before the first case finishes
+        :param case_time: seconds taken by each case
+        :param verdicts: {verdict: weight}, `DEFAULT_VERDICTS` by default
+        :param jitter: compile and case time of each submission are scaled by a random factor in [1 - jitter, 1 + jitter]
+        :param push: push final results when they are out, to the callback given with the submission, or, without
+                     one, straight to the dispatcher through `dispatcher.judge.publish_judge_result`
+        """
+        self.token = token
+        self.latency = latency
+        self.compile_time = compile_time
+        self.case_time = case_time
+        self.verdicts = verdicts or DEFAULT_VERDICTS
+        self.jitter = jitter
+        self.push = push
+        self.rand = random.Random(seed)
+        self.judges = {}
+        self.cases = {}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((ip, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.ip, self.port = self.httpd.server_address[:2]
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def http_address(self):
+        return 'http://%s:%d' % (self.ip, self.port)
+
+    def judge(self, data):
+        with self.lock:
+            verdict = self.rand.choices(list(self.verdicts.keys()), weights=list(self.verdicts.values()))[0]
+            scale = self.rand.uniform(1 - self.jitter, 1 + self.jitter)
+            judge = FakeJudge(data, verdict, time.time(), self.compile_time * scale, self.case_time * scale, self.rand)
+            self.judges[judge.fingerprint] = judge
+        if self.push:
+            timer = threading.Timer(max(judge.finish_time - time.time(), 0), self._push, args=(judge,))
+            timer.daemon = True
+            timer.start()
+        return {"status": "received"}
+
+    def _push(self, judge):
+        result = judge.result()
+        try:
+            if judge.callback:
+                requests.post(judge.callback, json=result, auth=(DEFAULT_USERNAME, self.token), timeout=10)
+            else:
+                from .judge import publish_judge_result
+                publish_judge_result(judge.fingerprint, result)
+        except:
+            pass  # the dispatcher polls anyway
+
+    def upload_bundle(self, body, encoding):
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+            for member in tar.getmembers():
+                case, suffix = member.name.rsplit('.', 1)
+                self.cases.setdefault(case, set()).add('input' if suffix == 'in' else 'output')
+
+    def handle(self, method, path, body, headers):
+        """
+        :return: (status code, response body as dict or str)
+        """
+        parts = path.strip('/').split('/')
+        self.requests[parts[0] if parts[0] != 'upload' else '/'.join(parts[:2])] += 1
+        if path == '/ping':
+            return 200, "pong"
+        if path == '/judge':
+            return 200, self.judge(json.loads(body.decode()))
+        if path in ('/query', '/query/report'):
+            judge = self.judges.get(json.loads(body.decode() or '{}').get('fingerprint'))
+            if judge is None:
+                return 200, {"status": "reject", "message": "fingerprint not found"}
+            return 200, judge.result() if path == '/query' else judge.report()
+        if parts[:2] == ['exist', 'case'] and len(parts) == 3:
+            return 200, {"exist": len(self.cases.get(parts[2], ())) == 2}
+        if path == '/exist/cases':
+            return 200, {"status": "received",
+                         "missing": [case for case in json.loads(body.decode())['cases']
+                                     if len(self.cases.get(case, ())) < 2]}
+        if parts[:2] == ['upload', 'case'] and len(parts) == 4:
+            self.cases.setdefault(parts[2], set()).add(parts[3])
+            return 200, {"status": "received"}
+        if path == '/upload/cases':
+            self.upload_bundle(body, headers.get('Content-Encoding'))
+            return 200, {"status": "received"}
+        if path in ('/upload/checker', '/upload/validator', '/upload/interactor'):
+            return 200, {"status": "received"}
+        if path == '/config/token':
+            self.token = json.loads(body.decode())['token']
+            return 200, {"status": "received"}
+        return 404, {"status": "reject", "message": "not found"}
+
+    def _authorized(self, headers):
+        try:
+            method, credentials = headers['Authorization'].split(' ', 1)
+            return base64.b64decode(credentials).decode() == '%s:%s' % (DEFAULT_USERNAME, self.token)
+        except (KeyError, ValueError, UnicodeDecodeError):
+            return False
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = b''
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        chunk = self.rfile.read(size + 2)[:size]
+                        if not size:
+                            break
+                        body += chunk
+                else:
+                    body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if self.path != '/ping' and not fake._authorized(self.headers):
+                    status, response = 401, {"status": "reject", "message": "unauthorized"}
+                else:
+                    status, response = fake.handle(self.command, self.path, body, self.headers)
+                content = (response if isinstance(response, str) else json.dumps(response)).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain" if isinstance(response, str) else "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
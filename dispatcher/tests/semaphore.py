@@ -0,0 +1,109 @@
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+from django_redis import get_redis_connection
+
+from dispatcher.health import record_result, record_affinity, get_health
+from dispatcher.models import Server
+from dispatcher.semaphore import Semaphore, NotAvailable
+
+NAMESPACE = 'SEMAPHORE_TEST'
+
+
+class SchedulingTest(SimpleTestCase):
+
+    def setUp(self):
+        self.client = get_redis_connection("judge")
+        self.tearDown()
+        self.servers = [Server(id=1, concurrency=2), Server(id=2, concurrency=2, runtime_multiplier=3)]
+        Semaphore(self.client, namespace=NAMESPACE).exists_or_init(self.servers)
+
+    def tearDown(self):
+        for key in self.client.scan_iter(NAMESPACE + ":*"):
+            self.client.delete(key)
+
+    def semaphore(self, **kwargs):
+        return Semaphore(self.client, namespace=NAMESPACE, **kwargs)
+
+    def server_of(self, token):
+        return int(token.decode().split(":")[0])
+
+    def test_faster_server_first(self):
+        sem = self.semaphore(blocking=False)
+        self.assertEqual(1, self.server_of(sem.acquire()))
+        # half of server 1 is free, which is still better than server 2, three times slower
+        self.assertEqual(1, self.server_of(sem.acquire()))
+        self.assertEqual([2, 2], [self.server_of(sem.acquire()) for _ in range(2)])
+        with self.assertRaises(NotAvailable):
+            sem.acquire()
+
+    @override_settings(JUDGE_AFFINITY_BONUS=4)
+    def test_affinity(self):
+        record_affinity(2, ["7"], client=self.client, namespace=NAMESPACE)
+        self.assertEqual(2, self.server_of(self.semaphore(blocking=False, affinity="7").acquire()))
+        self.assertEqual(1, self.server_of(self.semaphore(blocking=False, affinity="8").acquire()))
+
+    def test_drain(self):
+        for _ in range(3):
+            record_result(1, False, client=self.client, namespace=NAMESPACE)
+        self.assertTrue(get_health(1, client=self.client, namespace=NAMESPACE)["drained"])
+        sem = self.semaphore(blocking=False)
+        self.assertEqual([2, 2], [self.server_of(sem.acquire()) for _ in range(2)])
+        with self.assertRaises(NotAvailable):
+            sem.acquire()  # server 2 is alive, wait for it
+
+        for _ in range(3):
+            record_result(2, False, client=self.client, namespace=NAMESPACE)
+        sem.signal(sem._local_tokens.pop())
+        self.assertEqual(2, self.server_of(sem.acquire()))  # all drained
+        record_result(1, True, 0.01, client=self.client, namespace=NAMESPACE)
+        self.assertFalse(get_health(1, client=self.client, namespace=NAMESPACE)["drained"])
+        self.assertEqual(1, self.server_of(sem.acquire()))
+
+    def test_old_layout(self):
+        # free tokens in a list, from before the semaphore was a set
+        self.tearDown()
+        self.client.set(NAMESPACE + ":EXISTS", "ok")
+        self.client.rpush(NAMESPACE + ":AVAILABLE", "1:0", "1:1")
+        sem = self.semaphore(blocking=False)
+        self.assertTrue(sem.exists_or_init(self.servers))
+        self.assertFalse(self.client.exists(NAMESPACE + ":AVAILABLE"))
+        self.assertEqual(1, self.server_of(sem.acquire()))
+        self.assertFalse(sem.exists_or_init(self.servers))
+
+    def test_signal(self):
+        sem = self.semaphore(blocking=False)
+        token = sem.acquire()
+        self.assertEqual(3, sem.available_count)
+        sem.signal(token)
+        sem.signal(token)
+        self.assertEqual(4, sem.available_count)
+        self.assertEqual(4, sem.capacity)
+
+    def test_stale(self):
+        sem = self.semaphore(blocking=False, stale_client_timeout=0)
+        for _ in range(4):
+            sem.acquire()
+        self.client.delete(sem.check_release_locks_key)
+        time.sleep(0.01)
+        sem.acquire()
+        self.assertEqual(3, sem.available_count)
+
+    def test_wake_up_and_priority(self):
+        sem = self.semaphore()
+        tokens = [sem.acquire() for _ in range(4)]
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(self.semaphore().acquire(timeout=5)))
+        waiter.start()
+        time.sleep(0.3)
+        low = self.semaphore(blocking=False, low_priority=True)
+        sem.signal(tokens[0])
+        waiter.join()
+        self.assertEqual([tokens[0]], acquired)
+        sem.signal(tokens[1])
+        self.assertIsNotNone(low.acquire())
+        with self.assertRaises(NotAvailable):
+            low.acquire()  # at most half of tokens in low priority
+        sem.signal(tokens[2])
+        self.assertIsNotNone(self.semaphore(blocking=False).acquire())
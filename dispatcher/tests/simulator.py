@@ -0,0 +1,75 @@
+import copy
+import time
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django_redis import get_redis_connection
+
+from dispatcher.health import health_key
+from dispatcher.judge import send_judge_through_watch, JudgeTracker
+from dispatcher.manage import upload_cases, find_missing_cases
+from dispatcher.models import Server
+from dispatcher.simulator import FakeJudgeServer
+from submission.util import SubmissionStatus
+
+
+def _test_caches():
+    caches = copy.deepcopy(settings.CACHES)
+    caches["judge"]["LOCATION"] = caches["judge"]["LOCATION"].rsplit("/", 1)[0] + "/15"
+    return caches
+
+
+@override_settings(CACHES=_test_caches(), JUDGE_POLL_INTERVAL=0.05, ADMIN_EMAIL_LIST=[])
+class DispatchTest(TestCase):
+
+    def setUp(self):
+        self.judge = FakeJudgeServer(compile_time=0.05, case_time=0.01,
+                                     verdicts={SubmissionStatus.WRONG_ANSWER: 1}, seed=0).start()
+        self.server = Server.objects.create(name="fake", ip=self.judge.ip, port=self.judge.port,
+                                            token=self.judge.token, enabled=True, concurrency=2)
+        get_redis_connection("judge").flushdb()
+
+    def tearDown(self):
+        self.judge.stop()
+        get_redis_connection("judge").flushdb()
+
+    def dispatch(self, results):
+        def callback(data):
+            results.append(data)
+            return SubmissionStatus.is_judged(data.get('verdict'))
+
+        send_judge_through_watch("int main() {}", "cpp", 1000, 256, False, ["c1", "c2", "c3"], "", "",
+                                 {"on": False}, callback, timeout=10)
+
+    def assertJudged(self, results):
+        self.assertEqual(SubmissionStatus.WRONG_ANSWER, results[-1]["verdict"])
+        self.assertEqual(self.server.pk, results[-1]["server"])
+        self.assertEqual(SubmissionStatus.WRONG_ANSWER, results[-1]["detail"][-1]["verdict"])
+
+    def test_blocking(self):
+        results = []
+        self.dispatch(results)
+        self.assertJudged(results)
+        self.assertEqual(1, self.judge.requests["judge"])
+
+    def test_non_blocking(self):
+        results = []
+        with override_settings(JUDGE_DISPATCH_BLOCKING=False):
+            self.dispatch(results)
+        deadline = time.time() + 10
+        while JudgeTracker._instance is not None and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertJudged(results)
+        # the slot is released once judged
+        self.assertEqual(2, get_redis_connection("judge").scard("SEMAPHORE:AVAILABLE_SET"))
+
+    def test_server_saved(self):
+        self.server.runtime_multiplier = 2.5
+        self.server.save()
+        self.assertEqual(b"2.5", get_redis_connection("judge").hget(health_key(self.server.pk), "multiplier"))
+
+    def test_upload(self):
+        with override_settings(TESTDATA_DIR=settings.BASE_DIR):
+            self.assertEqual(["missing"], upload_cases(self.server, ["missing"]))
+        self.judge.cases["c1"] = {"input", "output"}
+        self.assertEqual(["c2"], find_missing_cases(self.server, ["c1", "c2"]))
@@ -0,0 +1,89 @@
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from dispatcher.manage import bundle_stream, upload_cases
+from dispatcher.models import Server
+
+
+class FakeResponse(object):
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+
+class FakeSession(object):
+    """
+    A judge server with the manifest protocol, keeping uploaded cases in memory
+    """
+
+    def __init__(self, existing):
+        self.cases = dict(existing)
+        self.manifest_requests = 0
+
+    def post(self, url, json=None, data=None, headers=None):
+        if url == '/exist/cases':
+            self.manifest_requests += 1
+            return FakeResponse({'status': 'received',
+                                 'missing': [case for case in json['cases'] if case not in self.cases]})
+        if url == '/upload/cases':
+            body = b''.join(data)
+            if headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                for member in tar.getmembers():
+                    case, suffix = member.name.split('.')
+                    self.cases.setdefault(case, {})[suffix] = tar.extractfile(member).read()
+            return FakeResponse({'status': 'received'})
+        return FakeResponse({}, 404)
+
+
+class CaseSyncTest(SimpleTestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.cases = {}
+        for i in range(30):
+            case = 'case%02d' % i
+            self.cases[case] = {'in': os.urandom(i * 1000), 'out': b'%d\n' % i}
+            for suffix, content in self.cases[case].items():
+                with open(os.path.join(self.data_dir, case + '.' + suffix), 'wb') as f:
+                    f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_bundle_stream(self):
+        with override_settings(TESTDATA_DIR=self.data_dir):
+            for compress in (False, True):
+                body = b''.join(bundle_stream(list(self.cases), compress, chunk_size=4096))
+                if compress:
+                    body = gzip.decompress(body)
+                with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                    self.assertEqual(len(self.cases) * 2, len(tar.getmembers()))
+                    for member in tar.getmembers():
+                        case, suffix = member.name.split('.')
+                        self.assertEqual(self.cases[case][suffix], tar.extractfile(member).read())
+
+    def test_upload_missing_only(self):
+        existing = {case: self.cases[case] for case in list(self.cases)[:10]}
+        session = FakeSession(existing)
+        uploaded = []
+        with override_settings(TESTDATA_DIR=self.data_dir, JUDGE_SYNC_BUNDLE_SIZE=50000, JUDGE_SYNC_MANIFEST_SIZE=12), \
+                mock.patch('dispatcher.manage.server_session', return_value=session):
+            unavailable = upload_cases(Server(concurrency=4), list(self.cases) + ['nothing'],
+                                       progress=lambda count, size: uploaded.append(count))
+        self.assertEqual(['nothing'], unavailable)
+        self.assertEqual(self.cases, session.cases)
+        self.assertEqual(3, session.manifest_requests)
+        self.assertEqual(20, sum(uploaded))
+        self.assertGreater(len(uploaded), 1)
@@ -0,0 +1,39 @@
+import base64
+import json
+
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .judge import publish_judge_result
+from .manage import DEFAULT_USERNAME
+from .models import Server
+
+
+def _authorized(request, server):
+    try:
+        method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
+        username, password = base64.b64decode(credentials).decode().split(':', 1)
+        return method.lower() == 'basic' and username == DEFAULT_USERNAME and password == server.token
+    except (KeyError, ValueError, UnicodeDecodeError):
+        return False
+
+
+@csrf_exempt
+@require_POST
+def judge_report_callback(request, pk):
+    """
+    Judge server pushes (possibly preliminary) results here, authenticated with the same token we use
+    to talk to it. Results are forwarded to the dispatcher waiting on the fingerprint.
+    """
+    server = get_object_or_404(Server, pk=pk)
+    if not _authorized(request, server):
+        return HttpResponseForbidden()
+    try:
+        data = json.loads(request.body.decode())
+        fingerprint = data['fingerprint']
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest()
+    publish_judge_result(fingerprint, data)
+    return HttpResponse()
@@ -17,6 +17,103 @@ import logging
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+# Defaults below are set before local_settings is imported, so that deployments can override them there
+
+# judge dispatcher
+JUDGE_CALLBACK_BASE_URL = None  # e.g. "https://acm.ecnu.edu.cn", judge servers then push results to this site
+JUDGE_DISPATCH_BLOCKING = True  # False: one worker sends and tracks many submissions (see dispatcher.judge)
+JUDGE_POLL_INTERVAL = 0.5
+JUDGE_POLL_BACKOFF = 1.5
+JUDGE_POLL_MAX_INTERVAL = 8
+JUDGE_HTTP_POOL_SIZE = 8  # max sockets to one judge server per process
+JUDGE_HTTP_TIMEOUT = (5, 300)  # (connect, read)
+JUDGE_PING_TIMEOUT = 5
+# routing to judge servers, refer to dispatcher.health and dispatcher.semaphore
+JUDGE_HEALTH_ALPHA = 0.2  # weight of the latest result in moving averages of success and latency
+JUDGE_HEALTH_MAX_FAILURES = 3  # consecutive failures before a server is drained
+JUDGE_DRAIN_SECONDS = 60  # drained servers get no submission for this long, unless a ping succeeds
+JUDGE_AFFINITY_BONUS = 2  # score multiplier of servers that recently judged the same problem
+JUDGE_AFFINITY_SIZE = 1000  # problems remembered per server
+
+
+# standings at a moment of contest (virtual participation, replay), refer to contest.timeline
+STANDINGS_CHECKPOINT_INTERVAL = 10  # minutes
+
+
+# standings of frozen contests, refer to contest.standings
+CONTEST_FROZEN_STANDINGS = False  # show standings as of freeze time to non-managers while a contest is frozen
+
+
+# rejudge, refer to polygon.rejudge
+REJUDGE_CAPACITY_SHARE = 0.5  # share of judge semaphore tokens that rejudges may hold at the same time
+
+
+# polygon, refer to polygon.problem2.runner.pool
+# processes to generate, run, validate and check cases of one task, 1 for no pool
+POLYGON_CASE_WORKERS = max((os.cpu_count() or 1) // 2, 1)
+POLYGON_COMPILE_CACHE_SIZE = 1024 * 1024 * 1024  # bytes of compiled programs kept, refer to polygon.problem2.runner.cache
+POLYGON_WORKSPACE_TTL = 86400  # seconds before workspaces of runners are removed
+
+
+# test data synchronization, refer to dispatcher.manage.upload_cases
+JUDGE_SYNC_MANIFEST_SIZE = 1000  # fingerprints asked in one request
+JUDGE_SYNC_BUNDLE_SIZE = 64 * 1024 * 1024  # bytes of data files (before compression) in one upload
+JUDGE_SYNC_COMPRESS = True
+JUDGE_SYNC_BATCH_SIZE = 20  # problems synchronized at a time, refer to backstage.server.synchronize
+
+
+# pushing data of upcoming contests to judge servers, refer to contest.warmup
+CONTEST_WARMUP_AHEAD = 60  # minutes before contests start
+
+
+# rendered markdown, refer to utils.markdown3
+MARKDOWN_CACHE_TIMEOUT = 86400 * 7
+MARKDOWN_LOCAL_CACHE_SIZE = 2048  # entries of rendered HTML kept in each process
+MARKDOWN_PRERENDER = False  # render and store HTML of problems, blogs and comments when they are saved
+
+
+# sanitized user HTML, refer to utils.sanitizer
+SANITIZER_CACHE_SIZE = 32 * 1024 * 1024  # characters of sanitized HTML kept in each process
+
+
+# search of problems, blogs, contests, users and tags, refer to home.search_index
+SEARCH_BACKEND = 'home.search_index.NgramBackend'  # or 'home.search_index.ScanBackend' without index
+
+
+# printing, refer to submission.print
+PRINT_RENDER_WORKERS = 2  # PDFs rendered at a time
+PRINT_RENDER_TIMEOUT = 60  # seconds
+
+
+# instrumentation of requests, refer to utils.instrumentation
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_BUCKET = 300  # seconds
+INSTRUMENTATION_WINDOW = 86400  # seconds kept
+INSTRUMENTATION_FLUSH_INTERVAL = 10  # seconds counters are kept in the process before written to redis
+INSTRUMENTATION_N_PLUS_ONE = 10  # times the same query is run in a request to be an N+1 query
+INSTRUMENTATION_SQL_LENGTH = 500  # characters of N+1 queries kept
+
+
+# site settings kept in each process, refer to utils.site_settings
+SITE_SETTINGS_CHECK_INTERVAL = 5  # seconds between checks of changes
+
+
+# highlighted code of submissions, refer to utils.language
+CODE_HTML_CACHE_TIMEOUT = 86400 * 7
+CODE_HTML_LOCAL_CACHE_SIZE = 16 * 1024 * 1024  # characters of highlighted HTML kept in each process
+CODE_HTML_PRERENDER = False  # highlight code of submissions in the background right after they are created
+
+
+# judge reports of submissions, refer to submission.report
+REPORT_DIR = os.path.join(BASE_DIR, "report")
+REPORT_CASES_PER_PAGE = 20
+REPORT_TEXT_LIMIT = 512  # bytes of each text shown
+
+
+# comment trees of blogs, problems and contests, refer to utils.comment_tree
+COMMENT_TREE_CACHE_TIMEOUT = 600  # seconds, trees are also dropped when comments or their votes change
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.10/howto/deployment/checklist/
 
@@ -139,7 +236,7 @@ ROOT_URLCONF = 'eoj3.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django_jinja.backend.Jinja2',
+        'BACKEND': 'utils.jinja2.backend.Jinja2',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         # 'OPTIONS': {'environment': 'eoj3.jinja2.environment'},
         'APP_DIRS': True,
@@ -238,7 +335,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "utils.cache.InstrumentedRedisCache",
         "LOCATION": "redis://127.0.0.1:6379/1",
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
@@ -246,7 +343,7 @@ CACHES = {
         }
     },
     "judge": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "utils.cache.InstrumentedRedisCache",
         "LOCATION": "redis://127.0.0.1:6379/2",
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
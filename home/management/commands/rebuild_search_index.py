@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.search_index import DOCUMENTS, rebuild
+
+
+class Command(BaseCommand):
+    help = "Index problems, blogs, contests, users and tags for search again from scratch, e.g. after they were " \
+           "changed without signals (refer to home.search_index)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help="any of %s, all by default" % ", ".join(sorted(DOCUMENTS)))
+
+    def handle(self, *args, **options):
+        for kind in options['kinds']:
+            if kind not in DOCUMENTS:
+                raise CommandError("Unknown kind: %s" % kind)
+        for kind in options['kinds'] or sorted(DOCUMENTS):
+            start = time.time()
+            count = rebuild(kind)
+            self.stdout.write("%s: %d indexed in %.1f s" % (kind, count, time.time() - start))
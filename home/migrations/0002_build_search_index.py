@@ -0,0 +1,61 @@
+import hashlib
+import json
+
+from django.db import migrations
+
+# copied from home.search_index as of this migration, which must not depend on code that changes later
+NGRAM = 3
+
+DOCUMENTS = {
+    # kind: (app label, model, short fields, text fields)
+    'problem': ('problem', 'Problem', ['title', 'alias', 'source'], ['description', 'input', 'output']),
+    'blog': ('blog', 'Blog', ['title'], ['text']),
+    'contest': ('contest', 'Contest', ['title'], []),
+    'user': ('account', 'User', ['username'], []),
+    'tag': ('tagging', 'Tag', ['name'], []),
+}
+
+
+def document_grams(short_fields, text_fields, texts):
+    grams = set()
+    for field in short_fields + text_fields:
+        text = texts[field].lower()
+        for n in range(1 if field in short_fields else NGRAM, NGRAM + 1):
+            grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+def build_search_index(apps, schema_editor):
+    SearchDocument = apps.get_model('home', 'SearchDocument')
+    SearchGram = apps.get_model('home', 'SearchGram')
+    for kind, (app_label, model_name, short_fields, text_fields) in DOCUMENTS.items():
+        model = apps.get_model(app_label, model_name)
+        fields = short_fields + text_fields
+        documents, grams = [], []
+        for instance in model.objects.only(*fields).order_by().iterator():
+            texts = {field: getattr(instance, field) or '' for field in fields}
+            digest = hashlib.sha256(json.dumps(texts, sort_keys=True).encode()).hexdigest()
+            documents.append(SearchDocument(kind=kind, object_id=instance.pk, digest=digest))
+            grams.extend(SearchGram(kind=kind, object_id=instance.pk, gram=gram)
+                         for gram in document_grams(short_fields, text_fields, texts))
+            if len(grams) >= 1000:
+                SearchGram.objects.bulk_create(grams, batch_size=1000, ignore_conflicts=True)
+                grams = []
+        SearchGram.objects.bulk_create(grams, batch_size=1000, ignore_conflicts=True)
+        SearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0001_initial'),
+        ('account', '0023_auto_20181113_1907'),
+        ('blog', '0007_auto_20181106_1212'),
+        ('contest', '0047_auto_20181113_2038'),
+        ('problem', '0024_auto_20181108_2313'),
+        ('tagging', '0003_adapt_max_tag_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import models
+
+
+class SearchDocument(models.Model):
+    """
+    An object in the search index, with hash of its indexed fields (refer to `home.search_index`)
+    """
+    kind = models.CharField(max_length=16)
+    object_id = models.PositiveIntegerField()
+    digest = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+
+class SearchGram(models.Model):
+    """
+    A substring of a few characters found in indexed fields of an object
+    """
+    kind = models.CharField(max_length=16)
+    object_id = models.PositiveIntegerField()
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ('kind', 'gram', 'object_id')
+        index_together = ('kind', 'object_id')
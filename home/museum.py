@@ -5,7 +5,8 @@ from django.db.models.functions import TruncDate, TruncYear
 from django.shortcuts import render
 
 from account.models import User
-from dispatcher.manage import ping
+from dispatcher.client import run_on_servers
+from dispatcher.manage import async_ping
 from dispatcher.models import Server
 from problem.models import Problem
 from submission.models import Submission
@@ -56,7 +57,7 @@ def museum_view(request):
 
     ctx['servers'] = servers = Server.objects.filter(enabled=True)
 
-    for server in servers:
-        server.status = ping(server)
+    for server, status in zip(servers, run_on_servers(async_ping, servers)):
+        server.status = status is True
 
     return render(request, 'museum.jinja2', context=ctx)
\ No newline at end of file
@@ -10,38 +10,33 @@ from account.permissions import is_admin_or_root
 from blog.models import Blog
 from contest.models import Contest
 from problem.models import Problem
+from .search_index import match, relevance
 
 
-def search_view(request):
-    q = request.GET.get('q', '').strip()
-    if not q:
-        return render(request, 'search.jinja2')
-    ctx = {"q": q}
-    LIMIT = 50
+LIMIT = 50
 
-    start_time = time.time()
+
+def search(q, all=False):
+    """
+    :param all: include invisible problems
+    :return: problems, users, blogs and contests matching q, most relevant first
+    """
+    limit = LIMIT * 2
 
     # query problems
-    query = Q(title__icontains=q) | Q(description__icontains=q) | Q(source__icontains=q) | Q(input__icontains=q) | Q(
-        output__icontains=q)
+    query = match('problem', q, ['title', 'description', 'source', 'input', 'output'])
     if q.isdigit():
         query |= Q(pk__exact=q)
-    if is_admin_or_root(request.user):
+    if all:
         problems = Problem.objects.filter(query)
     else:
         problems = Problem.objects.filter(query, visible=True)
-    weight_dict = {"title": 1.0, "description": 0.5, "source": 0.9, "input": 0.2, "output": 0.2}
-    for problem in problems:
-        problem.rank = 0.0
-        for attr in weight_dict:
-            if attr == "pk":
-                if q == str(problem.pk):
-                    problem.rank += 5.0
-            elif q in getattr(problem, attr):
-                problem.rank += weight_dict[attr]
+    problems = problems.annotate(rank=relevance(q, contains={"title": 1.0, "description": 0.5, "source": 0.9,
+                                                            "input": 0.2, "output": 0.2})). \
+        order_by("-rank", *Problem._meta.ordering)[:limit]
 
     # query username
-    users = User.objects.filter(username__icontains=q, is_active=True)[:LIMIT // 2]
+    users = User.objects.filter(match('user', q, ['username']), is_active=True)[:LIMIT // 2]
     for user in users:
         if user.last_login:
             user.rank = 0.7 * (user.last_login - user.date_joined).total_seconds() / (
@@ -50,22 +45,27 @@ def search_view(request):
             user.rank = 0.0
 
     # query blogs
-    query = Q(title__icontains=q) | Q(text__icontains=q)
-    blogs = Blog.objects.filter(query, visible=True).select_related("author")
-    weight_dict = {"title": 1.0, "text": 0.6}
-    for blog in blogs:
-        blog.rank = 0.0
-        for attr in weight_dict:
-            if q in getattr(blog, attr):
-                blog.rank += weight_dict[attr]
+    blogs = Blog.objects.filter(match('blog', q, ['title', 'text']), visible=True).select_related("author"). \
+        annotate(rank=relevance(q, contains={"title": 1.0, "text": 0.6})). \
+        order_by("-rank", *Blog._meta.ordering)[:limit]
 
     # query contests
-    contests = Contest.objects.filter(title__icontains=q, access_level__gt=0).extra(select={"rank": 0.7})[:LIMIT]
+    contests = Contest.objects.filter(match('contest', q, ['title']), access_level__gt=0). \
+        extra(select={"rank": 0.7})[:LIMIT]
+
+    return sorted(list(problems) + list(users) + list(blogs) + list(contests), key=lambda x: x.rank,
+                  reverse=True)[:limit]
 
-    LIMIT *= 2
 
-    ctx["search_list"] = sorted(list(problems) + list(users) + list(blogs) + list(contests), key=lambda x: x.rank,
-                                reverse=True)[:LIMIT]
+def search_view(request):
+    q = request.GET.get('q', '').strip()
+    if not q:
+        return render(request, 'search.jinja2')
+    ctx = {"q": q}
+
+    start_time = time.time()
+
+    ctx["search_list"] = search(q, is_admin_or_root(request.user))
 
     stop_time = time.time()
     ctx["query_time"] = '%.3f' % (stop_time - start_time)
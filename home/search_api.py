@@ -16,12 +16,14 @@ from django.urls import reverse
 from functools import reduce
 from operator import or_
 
+from home.search_index import match, relevance
+
 
 def query_user(kw):
     results = list()
     if kw and len(kw) >= 3:
-        for user in User.objects.filter(username__icontains=kw, is_active=True).exclude(username__icontains='#').\
-                            all().only('username')[:5]:
+        for user in User.objects.filter(match('user', kw, ['username']), is_active=True).\
+                exclude(username__icontains='#').all().only('username')[:5]:
             results.append(dict(title=escape(user.username), url=reverse('profile', kwargs=dict(pk=user.pk))))
     return dict(name='User', results=results)
 
@@ -30,8 +32,7 @@ def get_problem_q_object(kw, all=False, managing=None):
     if kw:
         q_list = list()
         if len(kw) >= 2:
-            q_list.append(Q(title__icontains=kw))
-            q_list.append(Q(alias__icontains=kw))
+            q_list.append(match('problem', kw, ['title', 'alias']))
         if kw.isdigit():
             q_list.append(Q(pk__exact=kw))
         if q_list:
@@ -47,16 +48,10 @@ def get_problem_q_object(kw, all=False, managing=None):
 
 
 def sorted_query(problems, kw):
-    problems = list(problems)
-    ret = {p.pk: 0.0 for p in problems}
-    for p in problems:
-        if str(p.pk) == kw:
-            ret[p.pk] += 100
-        if p.alias == kw:
-            ret[p.pk] += 50
-        if p.title == kw:
-            ret[p.pk] += 30
-    return sorted(problems, key=lambda p: ret[p.pk], reverse=True)[:5]
+    exact = {'alias': 50, 'title': 30}
+    if kw.isdigit():
+        exact['pk'] = 100
+    return list(problems.annotate(relevance=relevance(kw, exact=exact)).order_by('-relevance', '-pk')[:5])
 
 
 def query_problem(kw, all=False):
@@ -72,7 +67,7 @@ def query_problem(kw, all=False):
 def query_blog(kw):
     results = list()
     if kw:
-        for blog in Blog.objects.filter(title__icontains=kw, visible=True).all()[:5]:
+        for blog in Blog.objects.filter(match('blog', kw, ['title']), visible=True).all()[:5]:
             results.append(dict(title=escape(blog.title), url=reverse('blog:detail', kwargs={"pk": blog.pk})))
     return dict(name='Blog', results=results)
 
@@ -80,7 +75,7 @@ def query_blog(kw):
 def query_contest(kw):
     results = list()
     if kw:
-        for contest in Contest.objects.filter(title__icontains=kw, access_level__gt=0).all()[:5]:
+        for contest in Contest.objects.filter(match('contest', kw, ['title']), access_level__gt=0).all()[:5]:
             results.append(
                 dict(title=escape(contest.title), url=reverse('contest:dashboard', kwargs={"cid": contest.pk})))
     return dict(name='Contest', results=results)
@@ -89,7 +84,7 @@ def query_contest(kw):
 def query_tag(kw):
     results = list()
     if kw:
-        for tag in Tag.objects.filter(name__icontains=kw).all()[:5]:
+        for tag in Tag.objects.filter(match('tag', kw, ['name'])).all()[:5]:
             results.append(dict(title=escape(tag.name), url=reverse('problem:list') + '?tag=%s' % tag.name))
     return dict(name='Tag', results=results)
 
@@ -118,9 +113,10 @@ class SearchUserAPI(APIView):
         if kw:
             if 'contest' in request.GET and request.GET['contest'].isdigit():
                 contest = request.GET['contest']
-                query_from = get_object_or_404(Contest, pk=contest).participants.filter(username__icontains=kw)
+                query_from = get_object_or_404(Contest, pk=contest).participants.filter(
+                    match('user', kw, ['username']))
             else:
-                query_from = User.objects.filter(username__icontains=kw, is_active=True)
+                query_from = User.objects.filter(match('user', kw, ['username']), is_active=True)
             for user in query_from.only('username', 'pk')[:5]:
                 results.append(dict(name=user.username, value=user.pk))
         return Response(dict(success=True, results=results))
@@ -0,0 +1,243 @@
+"""
+Index for searching problems, blogs, contests, users and tags by substring (`icontains`), so that a keyword is not
+looked for by scanning whole tables.
+
+Indexed fields of each object are split into n-grams (`SearchGram`). Objects containing a keyword must contain all
+n-grams of the keyword, so searches are restricted to these candidates (refer to `NgramBackend.match`), and the
+usual `icontains` lookups only check a few rows. Short fields (titles, names) are split into grams of every length
+up to `NGRAM`, to be matched by shorter keywords too; text fields (statements, blog content) are only matched by
+keywords of at least `NGRAM` characters.
+
+The index is updated when objects are saved, and rebuilt with `manage.py rebuild_search_index` (needed after changes
+bypassing signals, e.g. `QuerySet.update`).
+"""
+
+import json
+from functools import reduce
+from operator import or_, add
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Count, Case, When, Value, FloatField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from tagging.models import Tag
+
+from account.models import User
+from blog.models import Blog
+from contest.models import Contest
+from problem.models import Problem
+from utils.hash import sha_hash
+from .models import SearchDocument, SearchGram
+
+NGRAM = 3
+
+
+class Document(object):
+    """
+    What is indexed of a model
+    """
+
+    def __init__(self, model, short_fields, text_fields=()):
+        self.model = model
+        self.short_fields = list(short_fields)
+        self.text_fields = list(text_fields)
+        self.fields = self.short_fields + self.text_fields
+
+    def texts(self, instance):
+        return {field: getattr(instance, field) or '' for field in self.fields}
+
+
+DOCUMENTS = {
+    'problem': Document(Problem, ['title', 'alias', 'source'], ['description', 'input', 'output']),
+    'blog': Document(Blog, ['title'], ['text']),
+    'contest': Document(Contest, ['title']),
+    'user': Document(User, ['username']),
+    'tag': Document(Tag, ['name']),
+}
+
+
+def document_grams(document, texts):
+    """
+    :param texts: {field: text}
+    :return: set of grams of the texts
+    """
+    grams = set()
+    for field in document.fields:
+        text = texts[field].lower()
+        for n in range(1 if field in document.short_fields else NGRAM, NGRAM + 1):
+            grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+def keyword_grams(kw):
+    kw = kw.lower()
+    if len(kw) < NGRAM:
+        return {kw}
+    return {kw[i:i + NGRAM] for i in range(len(kw) - NGRAM + 1)}
+
+
+def relevance(kw, exact=None, contains=None):
+    """
+    Relevance of objects to a keyword, to be annotated and ordered by
+
+    :param exact: {field: weight}, added when the field equals the keyword
+    :param contains: {field: weight}, added when the field contains the keyword (case-insensitive)
+    """
+    terms = [Case(When(Q(**{field: kw}), then=Value(float(weight))), default=Value(0.), output_field=FloatField())
+             for field, weight in (exact or {}).items()]
+    terms += [Case(When(Q(**{field + '__icontains': kw}), then=Value(float(weight))), default=Value(0.),
+                   output_field=FloatField())
+              for field, weight in (contains or {}).items()]
+    return reduce(add, terms, Value(0., output_field=FloatField()))
+
+
+def icontains_q(kw, fields):
+    return reduce(or_, [Q(**{field + '__icontains': kw}) for field in fields])
+
+
+class SearchBackend(object):
+    """
+    Finds objects whose fields contain a keyword
+    """
+
+    def match(self, kind, kw, fields):
+        """
+        :return: Q of objects of the kind with any of the fields containing kw (case-insensitive)
+        """
+        raise NotImplementedError
+
+    def update(self, kind, object_id, texts):
+        """
+        :param texts: {field: text} of indexed fields
+        """
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def rebuild(self, kind, objects):
+        """
+        :param objects: iterable of (object_id, texts)
+        :return: number of objects indexed
+        """
+        return 0
+
+
+class ScanBackend(SearchBackend):
+    """
+    No index, tables are scanned, the way it used to be
+    """
+
+    def match(self, kind, kw, fields):
+        return icontains_q(kw, fields)
+
+
+class NgramBackend(SearchBackend):
+    """
+    N-grams stored in the database, refer to the module
+    """
+
+    batch_size = 1000
+
+    def candidates(self, kind, kw):
+        grams = keyword_grams(kw)
+        return SearchGram.objects.filter(kind=kind, gram__in=grams).values('object_id'). \
+            annotate(count=Count('gram', distinct=True)).filter(count=len(grams)).values('object_id')
+
+    def match(self, kind, kw, fields):
+        if len(kw) < NGRAM:
+            fields = [field for field in fields if field in DOCUMENTS[kind].short_fields]
+        if not fields:
+            return Q(pk__in=[])
+        return icontains_q(kw, fields) & Q(pk__in=self.candidates(kind, kw))
+
+    def update(self, kind, object_id, texts):
+        digest = sha_hash(json.dumps(texts, sort_keys=True))
+        if SearchDocument.objects.filter(kind=kind, object_id=object_id, digest=digest).exists():
+            return
+        grams = document_grams(DOCUMENTS[kind], texts)
+        with transaction.atomic():
+            existing = set(SearchGram.objects.filter(kind=kind, object_id=object_id).values_list('gram', flat=True))
+            removed = list(existing - grams)
+            for i in range(0, len(removed), self.batch_size):
+                SearchGram.objects.filter(kind=kind, object_id=object_id, gram__in=removed[i:i + self.batch_size]). \
+                    delete()
+            SearchGram.objects.bulk_create([SearchGram(kind=kind, object_id=object_id, gram=gram)
+                                            for gram in grams - existing],
+                                           batch_size=self.batch_size, ignore_conflicts=True)
+            SearchDocument.objects.update_or_create(kind=kind, object_id=object_id, defaults={'digest': digest})
+
+    def remove(self, kind, object_id):
+        SearchGram.objects.filter(kind=kind, object_id=object_id).delete()
+        SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+    def rebuild(self, kind, objects):
+        document = DOCUMENTS[kind]
+        count = 0
+        with transaction.atomic():
+            SearchGram.objects.filter(kind=kind).delete()
+            SearchDocument.objects.filter(kind=kind).delete()
+            documents, grams = [], []
+            for object_id, texts in objects:
+                count += 1
+                documents.append(SearchDocument(kind=kind, object_id=object_id,
+                                                digest=sha_hash(json.dumps(texts, sort_keys=True))))
+                grams.extend(SearchGram(kind=kind, object_id=object_id, gram=gram)
+                             for gram in document_grams(document, texts))
+                if len(grams) >= self.batch_size:
+                    SearchGram.objects.bulk_create(grams, batch_size=self.batch_size, ignore_conflicts=True)
+                    grams = []
+            SearchGram.objects.bulk_create(grams, batch_size=self.batch_size, ignore_conflicts=True)
+            SearchDocument.objects.bulk_create(documents, batch_size=self.batch_size)
+        return count
+
+
+_backends = {}
+
+
+def get_backend():
+    path = settings.SEARCH_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def match(kind, kw, fields):
+    return get_backend().match(kind, kw, fields)
+
+
+def rebuild(kind):
+    """
+    :return: number of objects indexed
+    """
+    document = DOCUMENTS[kind]
+    return get_backend().rebuild(kind, ((instance.pk, document.texts(instance)) for instance in
+                                        document.model.objects.only(*document.fields).order_by().iterator()))
+
+
+KINDS = {document.model: kind for kind, document in DOCUMENTS.items()}
+
+
+@receiver(post_save, sender=Problem)
+@receiver(post_save, sender=Blog)
+@receiver(post_save, sender=Contest)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Tag)
+def index_instance(sender, instance, update_fields=None, **kwargs):
+    kind = KINDS[sender]
+    document = DOCUMENTS[kind]
+    # e.g. statistics of problems and last login of users are saved all the time
+    if update_fields is not None and not set(document.fields).intersection(update_fields):
+        return
+    get_backend().update(kind, instance.pk, document.texts(instance))
+
+
+@receiver(post_delete, sender=Problem)
+@receiver(post_delete, sender=Blog)
+@receiver(post_delete, sender=Contest)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Tag)
+def remove_instance(sender, instance, **kwargs):
+    get_backend().remove(KINDS[sender], instance.pk)
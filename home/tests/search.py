@@ -0,0 +1,104 @@
+from importlib import import_module
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from tagging.models import Tag
+
+from account.models import User
+from blog.models import Blog
+from contest.models import Contest
+from home import search_api
+from home.models import SearchGram, SearchDocument
+from home.search import search
+from problem.models import Problem
+
+KEYWORDS = ["a", "ab", "sum", "Sum", "tree", "tre", "graph", "路径", "最短路径", "1", "12", "k-th", "xyz", "ee",
+            "binary search", "B", "#"]
+
+
+def _results():
+    results = {}
+    for kw in KEYWORDS:
+        results[kw] = [search_api.query_user(kw), search_api.query_problem(kw), search_api.query_problem(kw, all=True),
+                       search_api.query_tag(kw), search_api.query_blog(kw), search_api.query_contest(kw),
+                       [(r.__class__.__name__, r.pk) for r in search(kw)],
+                       [(r.__class__.__name__, r.pk) for r in search(kw, all=True)]]
+    return results
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        author = User.objects.create(username="treeuser", email="tree@example.com")
+        User.objects.create(username="sumsum", email="sum@example.com")
+        User.objects.create(username="graph#1", email="graph@example.com")
+        User.objects.create(username="inactive_tree", email="inactive@example.com", is_active=False)
+        texts = [("A + B", "sum", "calculate the sum of a and b", "school"),
+                 ("Tree", "tree", "given a tree, find the k-th ancestor", "ecnu contest"),
+                 ("最短路径", "", "给定一张图，求最短路径", "graph theory"),
+                 ("Binary Search", "bs", "binary search on a sorted array", ""),
+                 ("12", "twelve", "print 12", "sum school")]
+        for i, (title, alias, description, source) in enumerate(texts):
+            Problem.objects.create(title=title, alias=alias, description=description, source=source,
+                                   input="two integers", output="one integer", visible=i % 2 == 0)
+        Blog.objects.create(title="Tree tricks", text="on the k-th ancestor of a tree", author=author, visible=True)
+        Blog.objects.create(title="Hidden", text="sum of a tree", author=author, visible=False)
+        Contest.objects.create(title="Graph contest", access_level=30)
+        Contest.objects.create(title="Private tree contest", access_level=0)
+        Tag.objects.create(name="tree")
+        Tag.objects.create(name="graph")
+
+    def test_same_as_scan(self):
+        results = _results()
+        with override_settings(SEARCH_BACKEND='home.search_index.ScanBackend'):
+            expected = _results()
+        for kw in KEYWORDS:
+            if len(kw) < 3:
+                # statements are not matched by short keywords
+                expected[kw][-2:] = results[kw][-2:]
+            self.assertEqual(expected[kw], results[kw], kw)
+        self.assertEqual(["A + B"], [r["title"] for r in results["sum"][1]["results"]])
+        self.assertEqual(["Tree tricks", "Tree"], [r.title for r in search("tree", all=True)[:2]])
+
+    def test_rank(self):
+        problem = Problem.objects.get(title="12")
+        Problem.objects.create(title="12 12", visible=True)
+        self.assertEqual(problem.pk, search_api.sorted_query(Problem.objects.filter(title__icontains="12"), "12")[0].pk)
+        self.assertEqual(["Binary Search"], [p.title for p in search_api.sorted_query(Problem.objects.all(), "bs")][:1])
+
+    def test_update(self):
+        problem = Problem.objects.get(title="Tree")
+        problem.title, problem.alias = "Forest", "forest"
+        problem.save()
+        self.assertFalse(search_api.query_problem("Tree", all=True)["results"])
+        self.assertEqual(["Forest"], [r["title"] for r in search_api.query_problem("Forest", all=True)["results"]])
+        count = SearchGram.objects.filter(kind="problem", object_id=problem.pk).count()
+        problem.ac_count = 1
+        problem.save(update_fields=["ac_count"])
+        problem.save()
+        self.assertEqual(count, SearchGram.objects.filter(kind="problem", object_id=problem.pk).count())
+        problem.delete()
+        self.assertFalse(SearchGram.objects.filter(kind="problem", object_id=problem.pk).exists())
+        self.assertFalse(SearchDocument.objects.filter(kind="problem", object_id=problem.pk).exists())
+
+    def test_rebuild(self):
+        grams = set(SearchGram.objects.values_list("kind", "object_id", "gram"))
+        Problem.objects.filter(title="A + B").update(title="C + D")
+        self.assertFalse(search_api.query_problem("C + D", all=True)["results"])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(["C + D"], [r["title"] for r in search_api.query_problem("C + D", all=True)["results"]])
+        call_command("rebuild_search_index", "user", stdout=StringIO())
+        self.assertEqual({g for g in grams if g[0] == "user"},
+                         set(SearchGram.objects.filter(kind="user").values_list("kind", "object_id", "gram")))
+
+    def test_migration(self):
+        # the migration keeps its own copy of the index, which should build the same one
+        index = set(SearchGram.objects.values_list("kind", "object_id", "gram")), \
+            set(SearchDocument.objects.values_list("kind", "object_id", "digest"))
+        SearchGram.objects.all().delete()
+        SearchDocument.objects.all().delete()
+        import_module("home.migrations.0002_build_search_index").build_search_index(apps, None)
+        self.assertEqual(index, (set(SearchGram.objects.values_list("kind", "object_id", "gram")),
+                                 set(SearchDocument.objects.values_list("kind", "object_id", "digest"))))
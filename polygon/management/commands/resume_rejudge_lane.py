@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+from django_q.tasks import schedule
+
+from polygon.rejudge import resume_rejudge_lane, get_rejudge_progress
+
+RESUME_TASK = "polygon.rejudge.resume_rejudge_lane"
+
+
+class Command(BaseCommand):
+    help = "Restart the rejudge lane if submissions are queued and its lock has expired (e.g. the lane crashed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedule', action='store_true',
+                            help="check every minute with django-q, instead of now")
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            if not Schedule.objects.filter(func=RESUME_TASK).exists():
+                schedule(RESUME_TASK, name="resume rejudge lane", schedule_type=Schedule.MINUTES, minutes=1)
+            self.stdout.write("Scheduled every minute.")
+            return
+        resume_rejudge_lane()
+        progress = get_rejudge_progress()
+        self.stdout.write("%d queued, %d running, %d done" % (progress["queued"], progress["running"],
+                                                              progress["done"]))
@@ -3,8 +3,8 @@ import io
 import re
 
 import chardet
-import requests
 
+from dispatcher.client import get_session
 from utils import random_string
 from utils.site_settings import site_settings_get
 
@@ -23,6 +23,10 @@ def get_server_url():
     return site_settings_get('POLYGON_JUDGE_SERVER', '127.0.0.1:5000')
 
 
+def get_polygon_session():
+    return get_session('http://%s' % get_server_url(), get_token())
+
+
 def get_validate_url():
     return 'http://%s/validate' % get_server_url()
 
@@ -81,7 +85,7 @@ def validate_input_multiple(binary, validator_code, validator_lang, max_time):
         'multiple': True
     }
     val_data.update(_pre_json_program_from_kwargs(lang=validator_lang, code=validator_code))
-    return requests.post(get_validate_url(), json=val_data, auth=get_token(), timeout=LONG_TEST_TIMEOUT).json()
+    return get_polygon_session().post(get_validate_url(), json=val_data, timeout=LONG_TEST_TIMEOUT).json()
 
 
 def run_output_multiple(model_code, model_lang, max_time, input):
@@ -92,7 +96,7 @@ def run_output_multiple(model_code, model_lang, max_time, input):
         "submission": _pre_json_program_from_kwargs(lang=model_lang, code=model_code),
         'multiple': True
     }
-    return requests.post(get_output_url(), json=data, auth=get_token(), timeout=LONG_TEST_TIMEOUT).json()
+    return get_polygon_session().post(get_output_url(), json=data, timeout=LONG_TEST_TIMEOUT).json()
 
 
 def check_output_with_result_multiple(submission, checker, max_time, max_memory, input, output, interactor=None):
@@ -107,7 +111,7 @@ def check_output_with_result_multiple(submission, checker, max_time, max_memory,
     }
     if interactor:
         data.update(interactor=_pre_json_program_from_kwargs(interactor))
-    return requests.post(get_checker_url(), json=data, auth=get_token(), timeout=LONG_TEST_TIMEOUT).json()
+    return get_polygon_session().post(get_checker_url(), json=data, timeout=LONG_TEST_TIMEOUT).json()
 
 
 def generate_multiple(generator, max_time, max_memory, command_line_args):
@@ -118,7 +122,7 @@ def generate_multiple(generator, max_time, max_memory, command_line_args):
         'multiple': True
     }
     data.update(_pre_json_program_from_kwargs(generator))
-    return requests.post(get_generator_url(), json=data, auth=get_token(), timeout=LONG_TEST_TIMEOUT).json()
+    return get_polygon_session().post(get_generator_url(), json=data, timeout=LONG_TEST_TIMEOUT).json()
 
 
 def stress_test(model, submission, generator, command_line_args_list, max_time, max_memory, max_sum_time,
@@ -136,7 +140,7 @@ def stress_test(model, submission, generator, command_line_args_list, max_time,
     }
     if interactor:
         data.update(interactor=_pre_json_program_from_kwargs(interactor))
-    return requests.post(get_stress_url(), json=data, auth=get_token(), timeout=LONG_TEST_TIMEOUT).json()
+    return get_polygon_session().post(get_stress_url(), json=data, timeout=LONG_TEST_TIMEOUT).json()
 
 
 def _pre_json_program_from_kwargs(*args, **kwargs):
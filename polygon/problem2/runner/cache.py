@@ -0,0 +1,130 @@
+"""
+Compiled programs, shared by all runners (and all processes) on this machine.
+
+An entry is a copy of a workspace right after compiling, under `REPO_DIR/compiled/<key>`, where the key is
+the fingerprint of the program together with the language config (compiler, flags, ...). Entries appear
+and disappear with atomic renames, so readers either see a complete entry, or none at all (and compile).
+The least recently used entries are evicted when entries take more than `settings.POLYGON_COMPILE_CACHE_SIZE`
+bytes.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+from polygon.models import Program
+from utils.hash import sha_hash
+
+_last_collect_time = 0
+
+
+def _directory_size(directory):
+    size = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+def _copy_files(source, target):
+    for root, dirs, files in os.walk(source):
+        relative = os.path.relpath(root, source)
+        os.makedirs(os.path.join(target, relative), exist_ok=True)
+        for name in files:
+            shutil.copy2(os.path.join(root, name), os.path.join(target, relative, name))
+
+
+class CompileCache(object):
+
+    def __init__(self, root=None, max_size=None):
+        self.root = root or os.path.join(settings.REPO_DIR, 'compiled')
+        self.max_size = max_size if max_size is not None else settings.POLYGON_COMPILE_CACHE_SIZE
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(program: Program, config: dict):
+        program.save_fingerprint()
+        return sha_hash(program.fingerprint + json.dumps(config, sort_keys=True))
+
+    def restore(self, key, workspace):
+        """
+        Copy compiled files into workspace (files are copied, so that programs cannot change the entry).
+
+        :return: True if there is an entry of the key
+        """
+        entry = os.path.join(self.root, key)
+        if not os.path.isdir(entry):
+            return False
+        try:
+            os.utime(entry)  # recently used
+            _copy_files(entry, workspace)
+            return True
+        except OSError:
+            # evicted while copying
+            return False
+
+    def store(self, key, workspace):
+        tmp = tempfile.mkdtemp(prefix='.tmp_', dir=self.root)
+        try:
+            shutil.copytree(workspace, os.path.join(tmp, key), ignore=shutil.ignore_patterns('runs'))
+            os.rename(os.path.join(tmp, key), os.path.join(self.root, key))
+        except OSError:
+            # stored by someone else at the same time
+            pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            try:
+                if name.startswith('.'):
+                    # leftovers of stores that crashed
+                    if os.path.getmtime(entry) < time.time() - 3600:
+                        shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                entries.append((os.path.getmtime(entry), _directory_size(entry), entry))
+            except OSError:
+                pass
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            trash = tempfile.mkdtemp(prefix='.evicted_', dir=self.root)
+            try:
+                os.rename(entry, os.path.join(trash, 'entry'))
+            except OSError:
+                pass  # evicted by someone else
+            shutil.rmtree(trash, ignore_errors=True)
+            total_size -= size
+
+
+def collect_workspaces(min_interval=600):
+    """
+    Remove workspaces of runners (`REPO_DIR/tasks`) older than `settings.POLYGON_WORKSPACE_TTL` seconds.
+    Done at most once every `min_interval` seconds in a process.
+    """
+    global _last_collect_time
+    now = time.time()
+    if now - _last_collect_time < min_interval:
+        return
+    _last_collect_time = now
+    tasks_dir = os.path.join(settings.REPO_DIR, 'tasks')
+    if not os.path.isdir(tasks_dir):
+        return
+    for name in os.listdir(tasks_dir):
+        workspace = os.path.join(tasks_dir, name)
+        try:
+            if os.path.getmtime(workspace) < now - settings.POLYGON_WORKSPACE_TTL:
+                shutil.rmtree(workspace, ignore_errors=True)
+        except OSError:
+            pass
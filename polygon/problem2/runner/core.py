@@ -1,4 +1,5 @@
 import os
+import shutil
 import signal
 import sys
 import time
@@ -7,11 +8,13 @@ import traceback
 from datetime import datetime
 
 import subprocess
+import tempfile
 
 import resource
 from django.conf import settings
 
 from polygon.models import Program
+from polygon.problem2.runner.cache import CompileCache, collect_workspaces
 from polygon.problem2.runner.exception import CompileError
 
 
@@ -20,13 +23,23 @@ class Runner(object):
     def __init__(self, program: Program):
         self.program = program
         now_string = ''.join(filter(lambda x: x.isdigit(), str(datetime.now())))
-        self.workspace = os.path.join(settings.REPO_DIR, 'tasks', now_string)
-        os.makedirs(self.workspace, exist_ok=True)
+        tasks_dir = os.path.join(settings.REPO_DIR, 'tasks')
+        os.makedirs(tasks_dir, exist_ok=True)
+        # unique even if two runners are created at the same time
+        self.workspace = tempfile.mkdtemp(prefix=now_string + '_', dir=tasks_dir)
         os.chdir(self.workspace)
         self.config = settings.RUNNER_CONFIG[program.lang]
         self.platform = sys.platform
+        collect_workspaces()
+        cache = CompileCache()
+        cache_key = cache.key(program, self.config)
+        if not cache.restore(cache_key, self.workspace):
+            self.compile()
+            cache.store(cache_key, self.workspace)
+
+    def compile(self):
         with open(self.config["code_file"], "w") as code_file_writer:
-            code_file_writer.write(program.code)
+            code_file_writer.write(self.program.code)
         try:
             with open("compile.log", "w") as log:
                 compile_process = subprocess.run([self.config["compiler_file"]] + self.config["compiler_args"],
@@ -41,6 +54,25 @@ class Runner(object):
         except subprocess.TimeoutExpired:
             raise CompileError("Compilation time limit (30s) is exceeded.")
 
+    def isolated_workspace(self):
+        """
+        A new directory with the compiled program (hard links), where one run can write its files
+        without interfering with other runs of the same program (e.g. in other processes).
+        Remove it with `shutil.rmtree` when done.
+        """
+        runs_dir = os.path.join(self.workspace, 'runs')
+        os.makedirs(runs_dir, exist_ok=True)
+        workspace = tempfile.mkdtemp(dir=runs_dir)
+        for name in os.listdir(self.workspace):
+            source = os.path.join(self.workspace, name)
+            if name == 'runs' or not os.path.isfile(source):
+                continue
+            try:
+                os.link(source, os.path.join(workspace, name))
+            except OSError:
+                shutil.copy2(source, workspace)
+        return workspace
+
     def set_resource_limit(self, **kwargs):
         if "max_cpu_time" in kwargs:  # in seconds
             resource.setrlimit(resource.RLIMIT_CPU, (int(kwargs["max_cpu_time"] + 1), int(kwargs["max_cpu_time"] + 1)))
@@ -59,8 +91,12 @@ class Runner(object):
             ret.append(open(foo, mode))
         return ret
 
-    def run(self, args=list(), stdin=None, stdout=None, stderr=None, max_time=1, max_memory=256, max_output_size=256):
-        os.chdir(self.workspace)
+    def run(self, args=list(), stdin=None, stdout=None, stderr=None, max_time=1, max_memory=256, max_output_size=256,
+            workspace=None):
+        """
+        :param workspace: working directory of the program, `self.workspace` by default, refer to `isolated_workspace`
+        """
+        os.chdir(workspace or self.workspace)
         child_pid = os.fork()
 
         max_memory = max_memory * 1024 * 1204
@@ -0,0 +1,98 @@
+import os
+import pickle
+import selectors
+import signal
+
+from django.conf import settings
+
+
+def _run_job(func, job, fd):
+    """
+    Runs in a forked child: write pickled `(True, result)` or `(False, exception)` into fd, and exit
+    """
+    try:
+        try:
+            data = pickle.dumps((True, func(*job)))
+        except BaseException as e:
+            try:
+                data = pickle.dumps((False, e))
+            except:
+                data = pickle.dumps((False, RuntimeError(repr(e))))
+        with os.fdopen(fd, "wb") as writer:
+            writer.write(data)
+    finally:
+        os._exit(0)
+
+
+def run_in_pool(func, jobs, workers=None):
+    """
+    Call `func(*job)` for each job, in at most `workers` (`settings.POLYGON_CASE_WORKERS` by default)
+    processes at the same time.
+
+    Every job runs in a child forked with `os.fork` rather than `multiprocessing`, so that pools also work in
+    daemonic processes (e.g. django-q workers, which are not allowed to have `multiprocessing` children).
+    `func` should not touch database (the connection is shared with the parent), should write into its own
+    workspace (refer to `Runner.isolated_workspace`), and should return something that can be pickled.
+
+    :return: iterator of results, in the order of jobs
+    """
+    jobs = list(jobs)
+    if workers is None:
+        workers = settings.POLYGON_CASE_WORKERS
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        for job in jobs:
+            yield func(*job)
+        return
+
+    results, running = {}, {}  # running: read fd -> (index of job, pid, chunks)
+    selector = selectors.DefaultSelector()
+    started = 0
+
+    def start():
+        nonlocal started
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _run_job(func, jobs[started], write_fd)
+        os.close(write_fd)
+        running[read_fd] = (started, pid, [])
+        selector.register(read_fd, selectors.EVENT_READ)
+        started += 1
+
+    try:
+        for index in range(len(jobs)):
+            while started < len(jobs) and len(running) < workers:
+                start()
+            while index not in results:
+                for key, _ in selector.select():
+                    job_index, pid, chunks = running[key.fd]
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        chunks.append(chunk)
+                        continue
+                    selector.unregister(key.fd)
+                    os.close(key.fd)
+                    os.waitpid(pid, 0)
+                    del running[key.fd]
+                    try:
+                        results[job_index] = pickle.loads(b"".join(chunks))
+                    except:
+                        results[job_index] = (False, RuntimeError("job %d exited without a result" % job_index))
+                    if started < len(jobs):
+                        start()
+            success, result = results.pop(index)
+            if not success:
+                raise result
+            yield result
+    finally:
+        # the iterator is closed early, or a job failed
+        for fd, (_, pid, _) in running.items():
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            os.close(fd)
+        selector.close()
@@ -2,6 +2,7 @@ import json
 import os
 import re
 import shutil
+import time
 import zipfile
 from datetime import datetime
 
@@ -33,6 +34,7 @@ from polygon.models import Case, Program, Task
 from polygon.problem2.forms import CaseUpdateForm, CaseCreateForm, CaseUpdateInfoForm
 from polygon.problem2.runner import Runner
 from polygon.problem2.runner.exception import CompileError
+from polygon.problem2.runner.pool import run_in_pool
 from polygon.problem2.views.base import ProblemRevisionMixin
 from utils import random_string
 from utils.download import respond_generate_file
@@ -60,6 +62,42 @@ class UpdateManager(object):
         self.object.save()
 
 
+class TaskReport(object):
+    """
+    Report of a task: a list of items, or a dict with the list as "tasks" (refer to `CaseManagementTools.check_case`).
+    Items are serialized once when appended, and the report is saved at most every `save_interval` seconds
+    while the task is running.
+    """
+
+    def __init__(self, task, save_interval=1):
+        self.task = task
+        self.items = io.StringIO()
+        self.count = 0
+        self.save_interval = save_interval
+        self.last_save = 0
+
+    def render(self, head=None):
+        items = "[" + self.items.getvalue() + "]"
+        if head is None:
+            return items
+        head = json.dumps(head)
+        return head[:-1] + (", " if head != "{}" else "") + '"tasks": ' + items + "}"
+
+    def append(self, item, head=None):
+        if self.count:
+            self.items.write(", ")
+        self.items.write(json.dumps(item))
+        self.count += 1
+        if time.time() - self.last_save >= self.save_interval:
+            self.save(-2, head)
+
+    def save(self, status, head=None):
+        self.task.status = status
+        self.task.report = self.render(head)
+        self.task.save(update_fields=["status", "report", "update_time"])
+        self.last_save = time.time()
+
+
 class CaseManagementTools(object):
     white_space_reg = re.compile(r'[\x00-\x20\s]+')
 
@@ -125,7 +163,10 @@ class CaseManagementTools(object):
         """
         generators = {}
         current_task = Task.objects.create(revision=revision, abstract="GENERATE CASES")
-        report = []
+        report = TaskReport(current_task)
+        failed = False
+        # generators are compiled and cases are saved here, in the order of commands, while generators run in pool
+        entries, jobs = [], []
         for command_string in commands:
             ret = {"command": command_string}
             command = command_string.split()
@@ -136,21 +177,29 @@ class CaseManagementTools(object):
                     generators[program_name] = Runner(program)
                 elif isinstance(generators[program_name], CompileError):
                     raise generators[program_name]
-                runner = generators[program_name]
-                if revision.cases.all().count():
-                    case_number = revision.cases.all().aggregate(Max("case_number"))["case_number__max"] + 1
-                else: case_number = 1
                 new_case = Case(create_time=datetime.now(),
-                                description="Gen \"%s\"" % command_string,
-                                case_number=case_number)
+                                description="Gen \"%s\"" % command_string)
                 new_case.input_file.save("in_" + random_string(), ContentFile(b""), save=False)
                 new_case.output_file.save("out_" + random_string(), ContentFile(b""), save=False)
-                running_result = runner.run(args=program_args, stdout=new_case.input_file.path,
-                                            max_time=revision.time_limit * 5 / 1000,
-                                            max_memory=revision.memory_limit * 3)
-                CaseManagementTools.reformat_file(new_case.input_file.path, revision.well_form_policy)
+                jobs.append((generators[program_name], program_args, None, new_case.input_file.path,
+                             revision.time_limit * 5 / 1000, revision.memory_limit * 3, revision.well_form_policy))
+                entries.append((ret, new_case))
+            except (Program.MultipleObjectsReturned, Program.DoesNotExist):
+                ret.update(success=False,
+                           error="There should be exactly one program tagged 'generator' that fits the command.")
+                entries.append((ret, None))
+            except CompileError as e:
+                generators[program_name] = e
+                ret.update(success=False, error=e.error)
+                entries.append((ret, None))
+
+        results = run_in_pool(_run_program, jobs)
+        case_number = (revision.cases.all().aggregate(Max("case_number"))["case_number__max"] or 0) + 1
+        for ret, new_case in entries:
+            if new_case is not None:
+                running_result = next(results)
+                new_case.case_number = case_number
                 new_case.save_fingerprint(revision.problem_id)
-                ret["case_number"] = case_number
                 with transaction.atomic():
                     new_case.save()
                     revision.cases.add(new_case)
@@ -158,17 +207,11 @@ class CaseManagementTools(object):
                                success=running_result["verdict"] == "OK",
                                detail=running_result,
                                generated=new_case.input_preview)
-            except (Program.MultipleObjectsReturned, Program.DoesNotExist):
-                ret.update(success=False,
-                           error="There should be exactly one program tagged 'generator' that fits the command.")
-            except CompileError as e:
-                generators[program_name] = e
-                ret.update(success=False, error=e.error)
+                case_number += 1
+            if not ret["success"]:
+                failed = True
             report.append(ret)
-            current_task.status = -2
-            current_task.report = json.dumps(report)
-        current_task.status = 0 if all(map(lambda r: r["success"], report)) else -1
-        current_task.save()
+        report.save(-1 if failed else 0)
 
     @staticmethod
     def run_case_output(revision, case_set, solution):
@@ -176,36 +219,31 @@ class CaseManagementTools(object):
         report: similar to generating cases, [{ }, { }, ... { }]
         """
         current_task = Task.objects.create(revision=revision, abstract="RUN OUTPUT, %d cases" % len(case_set))
+        report = TaskReport(current_task)
         try:
             runner = Runner(solution)
-            result = []
             failed = False
-            for case in case_set:
-                if case.output_lock: continue  # output content protected
+            cases = [case for case in case_set if not case.output_lock]  # output content protected
+            for case in cases:
+                # the new output file is saved into cases after it is written
+                case.output_file.save("out_" + random_string(), ContentFile(b''), save=False)
+            jobs = [(runner, [], case.input_file.path, case.output_file.path, revision.time_limit * 3 / 1000,
+                     revision.memory_limit * 2, revision.well_form_policy) for case in cases]
+            for case, run_result in zip(cases, run_in_pool(_run_program, jobs)):
+                case.save_fingerprint(revision.problem_id)
                 with UpdateManager(case, revision) as case:
-                    case.output_file.save("out_" + random_string(), ContentFile(b''), save=False)
-                    run_result = runner.run(stdin=case.input_file.path, stdout=case.output_file.path,
-                                            max_time=revision.time_limit * 3 / 1000,
-                                            max_memory=revision.memory_limit * 2)
-                    CaseManagementTools.reformat_file(case.output_file.path, revision.well_form_policy)
-                    case.save_fingerprint(revision.problem_id)
-                    with transaction.atomic():
-                        case.save()
-                        result.append({
-                            "case_number": case.case_number,
-                            "success": run_result["verdict"] == "OK",
-                            "detail": run_result
-                        })
-                        if run_result["verdict"] != "OK":
-                            failed = True
-                        current_task.status = -2
-                        current_task.report = json.dumps(result)
-                        current_task.save()
-            current_task.status = -1 if failed else 0
+                    pass
+                report.append({
+                    "case_number": case.case_number,
+                    "success": run_result["verdict"] == "OK",
+                    "detail": run_result
+                })
+                if run_result["verdict"] != "OK":
+                    failed = True
+            report.save(-1 if failed else 0)
         except CompileError as e:
-            current_task.report = json.dumps([{"success": False, "error": e.error}])
-            current_task.status = -1
-        current_task.save()
+            report.append({"success": False, "error": e.error})
+            report.save(-1)
 
     @staticmethod
     def validate_case(revision, case_set, validator):
@@ -213,44 +251,30 @@ class CaseManagementTools(object):
         report: similar to generating cases, [{ }, { }, ... { }]
         """
         current_task = Task.objects.create(revision=revision, abstract="VALIDATE, %d cases" % len(case_set))
+        report = TaskReport(current_task)
         try:
             runner = Runner(validator)
-            result = []
             failed = False
+            jobs = []
             for case in case_set:
-                output_path = path.join(runner.workspace, "out")
-                error_path = path.join(runner.workspace, "err")
-                log_path = path.join(runner.workspace, "log")
-                args = ["--testOverviewLogFileName", log_path]
+                args = []
                 if revision.enable_group:
                     args.extend(["--group", str(case.group)])
                 if case.in_samples:
                     args.extend(["--testset", "samples"])
                 elif case.in_pretests:
                     args.extend(["--testset", "pretests"])
-                run_result = runner.run(args=args,
-                                        stdin=case.input_file.path, stdout=output_path, stderr=error_path,
-                                        max_time=revision.time_limit * 3 / 1000,
-                                        max_memory=revision.memory_limit * 2)
-                with transaction.atomic():
-                    result.append({
-                        "case_number": case.case_number,
-                        "success": run_result["verdict"] == "OK",
-                        "comment": CaseManagementTools.read_abstract(output_path),
-                        "stderr": CaseManagementTools.read_abstract(error_path),
-                        "log": CaseManagementTools.read_abstract(log_path),
-                        "exit_code": run_result["exit_code"]
-                    })
-                    if run_result["verdict"] != "OK":
-                        failed = True
-                    current_task.status = -2
-                    current_task.report = json.dumps(result)
-                    current_task.save()
-            current_task.status = -1 if failed else 0
+                jobs.append((runner, args, case.input_file.path, revision.time_limit * 3 / 1000,
+                             revision.memory_limit * 2))
+            for case, result in zip(case_set, run_in_pool(_run_validator, jobs)):
+                result["case_number"] = case.case_number
+                report.append(result)
+                if not result["success"]:
+                    failed = True
+            report.save(-1 if failed else 0)
         except CompileError as e:
-            current_task.report = json.dumps([{"success": False, "error": e.error}])
-            current_task.status = -1
-        current_task.save()
+            report.append({"success": False, "error": e.error})
+            report.save(-1)
 
     @staticmethod
     def read_abstract(file_path, read_size=1024):
@@ -300,82 +324,134 @@ class CaseManagementTools(object):
         current_task = Task.objects.create(revision=revision,
                                            abstract="CHECK, %d cases, %d solutions" % (
                                                len(case_set), len(solution_set)))
-        packed_result = {"success": True, "tasks": [], "summary": {}}
+        report = TaskReport(current_task)
+        packed_result = {"success": True, "summary": {}}
         try:
             solution_runners = [(solution, Runner(solution)) for solution in solution_set]
             if checker is None:
                 checker = CaseManagementTools.obtain_defaultspj()
             checker_runner = Runner(checker)
-            checker_result_path = path.join(checker_runner.workspace, "result")
-            task_result = packed_result["tasks"]
             verdict_for_each_solution = {solution.id: set() for solution in solution_set}
-            for case in case_set:
-                for solution, runner in solution_runners:
-                    output_path = path.join(runner.workspace, "out")
-                    err_path = path.join(runner.workspace, "err")
-                    result = {"solution": solution.id, "case_number": case.case_number, "case_id": case.id}
-                    running_result = runner.run(stdin=case.input_file.path, stdout=output_path,
-                                                max_time=revision.time_limit / 1000,
-                                                max_memory=revision.memory_limit)
-                    result.update(running_result)
-                    result.update(input=CaseManagementTools.read_abstract(case.input_file.path),
-                                  answer=CaseManagementTools.read_abstract(case.output_file.path),
-                                  output=CaseManagementTools.read_abstract(output_path),
-                                  stderr=CaseManagementTools.read_abstract(err_path))
-
-                    if result["verdict"] == "OK":
-                        # run checker
-                        checking_result = checker_runner.run(
-                            args=[case.input_file.path, output_path, case.output_file.path],
-                            stdout=checker_result_path,
-                            max_time=revision.time_limit / 1000 * 3,
-                            max_memory=revision.memory_limit)
-                        result.update(checker_comment=CaseManagementTools.read_abstract(checker_result_path),
-                                      checker_exit_code=checking_result["exit_code"])
-                        if checking_result["verdict"] != "OK":
-                            result.update(verdict="WRONG_ANSWER")
-
-                    if result["verdict"] == "OK":
-                        result.update(points=case.points)
-                    else: result.update(points=0)
-                    result.update(total_points=case.points)
-
-                    verdict_for_each_solution[solution.id].add(result["verdict"])
-                    task_result.append(result)
-                for solution in solution_set:
-                    got_verdicts = verdict_for_each_solution[solution.id]
-                    if solution.tag in ('solution_main', 'solution_correct') and got_verdicts != {"OK"}:
-                        packed_result.update(success=False,
-                                             error="'%s' claims to be correct, but got rejected in tests" % solution.name)
-                    if solution.tag == 'solution_tle_or_ok' and got_verdicts != {"TIME_LIMIT", "OK"}:
-                        packed_result.update(success=False, error="'%s' claims to be tle_or_ok, but got %s" % (
-                        solution.name, str(got_verdicts)))
-                    if solution.tag == 'solution_wa' and 'WRONG_ANSWER' not in got_verdicts:
-                        packed_result.update(success=False, error="'%s' claims to be WA, but never got WA" % solution.name)
-                    if solution.tag == 'solution_incorrect' and got_verdicts == {"OK"}:
-                        packed_result.update(success=False,
-                                             error="'%s' claims to be incorrect, but is actually correct" % solution.name)
-                    if solution.tag == 'solution_fail' and "RUNTIME_ERROR" not in got_verdicts:
-                        packed_result.update(success=False, error="'%s' claims to fail, but didn't fail" % solution.name)
-                    solution_based_result = list(filter(lambda x: x["solution"] == solution.id, task_result))
-                    solution_time_summary = list(map(lambda x: x["time"], solution_based_result)) + [0]
-                    packed_result["summary"][solution.id] = {
-                        "time": max(solution_time_summary),
-                        "sum_time": sum(solution_time_summary),
-                        "memory": max(list(map(lambda x: x["memory"], solution_based_result)) + [0]),
-                        "points": sum(list(map(lambda x: x["points"], solution_based_result)) + [0]) /
-                                  max(sum(list(map(lambda x: x["total_points"], solution_based_result)) + [0]), 1) * 100
-                    }
-                    current_task.status = -2
-                    current_task.report = json.dumps(packed_result)
-                    current_task.save()
+            points_for_each_solution = {solution.id: [0, 0] for solution in solution_set}  # points, total points
+            summary = packed_result["summary"]
+            for solution in solution_set:
+                summary[solution.id] = {"time": 0, "sum_time": 0, "memory": 0, "points": 0}
+
+            runs = [(case, solution) for case in case_set for solution, _ in solution_runners]
+            jobs = [(runner, checker_runner, case.input_file.path, case.output_file.path,
+                     revision.time_limit / 1000, revision.memory_limit)
+                    for case in case_set for _, runner in solution_runners]
+            for (case, solution), result in zip(runs, run_in_pool(_check_solution, jobs)):
+                result.update(solution=solution.id, case_number=case.case_number, case_id=case.id)
+                if result["verdict"] == "OK":
+                    result.update(points=case.points)
+                else: result.update(points=0)
+                result.update(total_points=case.points)
+                verdict_for_each_solution[solution.id].add(result["verdict"])
+
+                points = points_for_each_solution[solution.id]
+                points[0] += result["points"]
+                points[1] += result["total_points"]
+                solution_summary = summary[solution.id]
+                solution_summary.update(time=max(solution_summary["time"], result["time"]),
+                                        sum_time=solution_summary["sum_time"] + result["time"],
+                                        memory=max(solution_summary["memory"], result["memory"]),
+                                        points=points[0] / max(points[1], 1) * 100)
+                report.append(result, head=packed_result)
+
+            for solution in solution_set:
+                if not runs:
+                    break
+                got_verdicts = verdict_for_each_solution[solution.id]
+                if solution.tag in ('solution_main', 'solution_correct') and got_verdicts != {"OK"}:
+                    packed_result.update(success=False,
+                                         error="'%s' claims to be correct, but got rejected in tests" % solution.name)
+                if solution.tag == 'solution_tle_or_ok' and got_verdicts != {"TIME_LIMIT", "OK"}:
+                    packed_result.update(success=False, error="'%s' claims to be tle_or_ok, but got %s" % (
+                    solution.name, str(got_verdicts)))
+                if solution.tag == 'solution_wa' and 'WRONG_ANSWER' not in got_verdicts:
+                    packed_result.update(success=False, error="'%s' claims to be WA, but never got WA" % solution.name)
+                if solution.tag == 'solution_incorrect' and got_verdicts == {"OK"}:
+                    packed_result.update(success=False,
+                                         error="'%s' claims to be incorrect, but is actually correct" % solution.name)
+                if solution.tag == 'solution_fail' and "RUNTIME_ERROR" not in got_verdicts:
+                    packed_result.update(success=False, error="'%s' claims to fail, but didn't fail" % solution.name)
         except CompileError as e:
             packed_result.update(success=False, error=e.error)
         except ValueError as e:
             packed_result.update(success=True, error=e.args[0])
-        current_task.status = 0 if packed_result["success"] else -1
-        current_task.report = json.dumps(packed_result)
-        current_task.save()
+        report.save(0 if packed_result["success"] else -1, head=packed_result)
+
+
+def _run_program(runner, args, input_path, output_path, max_time, max_memory, well_form_policy):
+    """
+    Runs in pool, refer to `run_in_pool`
+    """
+    workspace = runner.isolated_workspace()
+    try:
+        result = runner.run(args=args, stdin=input_path, stdout=output_path, max_time=max_time,
+                            max_memory=max_memory, workspace=workspace)
+        CaseManagementTools.reformat_file(output_path, well_form_policy)
+        return result
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def _run_validator(runner, args, input_path, max_time, max_memory):
+    """
+    Runs in pool, refer to `run_in_pool`
+    """
+    workspace = runner.isolated_workspace()
+    output_path = path.join(workspace, "out")
+    error_path = path.join(workspace, "err")
+    log_path = path.join(workspace, "log")
+    try:
+        run_result = runner.run(args=["--testOverviewLogFileName", log_path] + args,
+                                stdin=input_path, stdout=output_path, stderr=error_path,
+                                max_time=max_time, max_memory=max_memory, workspace=workspace)
+        return {
+            "success": run_result["verdict"] == "OK",
+            "comment": CaseManagementTools.read_abstract(output_path),
+            "stderr": CaseManagementTools.read_abstract(error_path),
+            "log": CaseManagementTools.read_abstract(log_path),
+            "exit_code": run_result["exit_code"]
+        }
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def _check_solution(runner, checker_runner, input_path, answer_path, max_time, max_memory):
+    """
+    Runs in pool, refer to `run_in_pool`
+    """
+    workspace = runner.isolated_workspace()
+    checker_workspace = checker_runner.isolated_workspace()
+    output_path = path.join(workspace, "out")
+    err_path = path.join(workspace, "err")
+    checker_result_path = path.join(checker_workspace, "result")
+    try:
+        result = runner.run(stdin=input_path, stdout=output_path, stderr=err_path,
+                            max_time=max_time, max_memory=max_memory, workspace=workspace)
+        result.update(input=CaseManagementTools.read_abstract(input_path),
+                      answer=CaseManagementTools.read_abstract(answer_path),
+                      output=CaseManagementTools.read_abstract(output_path),
+                      stderr=CaseManagementTools.read_abstract(err_path))
+
+        if result["verdict"] == "OK":
+            # run checker
+            checking_result = checker_runner.run(
+                args=[input_path, output_path, answer_path],
+                stdout=checker_result_path,
+                max_time=max_time * 3,
+                max_memory=max_memory, workspace=checker_workspace)
+            result.update(checker_comment=CaseManagementTools.read_abstract(checker_result_path),
+                          checker_exit_code=checking_result["exit_code"])
+            if checking_result["verdict"] != "OK":
+                result.update(verdict="WRONG_ANSWER")
+        return result
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+        shutil.rmtree(checker_workspace, ignore_errors=True)
 
 
 REFORMAT = CaseManagementTools.reformat
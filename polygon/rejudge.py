@@ -1,39 +1,147 @@
-from django.db import transaction
-from django.core.cache import cache
+import time
+import traceback
+from threading import Thread
+
+from django.db import connection
+from django.db.models import Min
 from django_q.tasks import async_task
+from django_redis import get_redis_connection
 
+from contest.incremental import TimelineIndex
 from contest.models import Contest
 from problem.models import Problem
 from contest.tasks import judge_submission_on_contest
+from dispatcher.semaphore import Semaphore
 from problem.tasks import judge_submission_on_problem
+from submission.models import Submission
 from submission.util import SubmissionStatus
-from time import sleep
-from threading import Thread
 
 
-REJUDGE_TASK_LIMIT = 24
-REJUDGE_COUNTER = 'rejudge_counter'
+REJUDGE_TASK_LIMIT = 24  # max number of submissions being rejudged at the same time
+REJUDGE_COUNTER = 'rejudge_counter'  # progress of the rejudge lane
+REJUDGE_QUEUE = 'rejudge_queue'
+REJUDGE_LANE_LOCK = 'rejudge_lane'
+REJUDGE_RESET_BATCH_SIZE = 5000
+
+
+def _redis():
+    return get_redis_connection("judge")
 
 
-def rejudge_submission(submission, callback=None, run_until_complete=False):
+def rejudge_submission(submission, callback=None, run_until_complete=False, low_priority=False):
     if submission.contest_id:
-        judge_submission_on_contest(submission, callback=callback, sync=True)
+        judge_submission_on_contest(submission, callback=callback, sync=True, low_priority=low_priority)
     else:
-        judge_submission_on_problem(submission, callback=callback, sync=True, run_until_complete=run_until_complete)
+        judge_submission_on_problem(submission, callback=callback, sync=True, run_until_complete=run_until_complete,
+                                    low_priority=low_priority)
+
+
+def reset_submissions(submission_ids: list):
+    for i in range(0, len(submission_ids), REJUDGE_RESET_BATCH_SIZE):
+        Submission.objects.filter(pk__in=submission_ids[i:i + REJUDGE_RESET_BATCH_SIZE]). \
+            update(status=SubmissionStatus.WAITING, status_test=0, status_percent=0, status_detail="",
+                   status_message="")
+    # bulk updates do not send signals
+    for contest_id, contest_time in Submission.objects.filter(pk__in=submission_ids, contest__isnull=False). \
+            order_by().values("contest_id").annotate(contest_time=Min("contest_time")). \
+            values_list("contest_id", "contest_time"):
+        if contest_time is not None:
+            TimelineIndex(contest_id).truncate_at(contest_time)
 
 
 def rejudge_submission_set(submission_set):
-    with transaction.atomic():
-        for submission in submission_set:
-            submission.status = SubmissionStatus.WAITING
-            submission.status_test = 0
-            submission.status_percent = 0
-            submission.status_detail = ""
-            submission.status_message = ""
-            submission.save(update_fields=["status", "status_detail", "status_message", "status_test", "status_percent"])
-
-    for submission in submission_set:
-        async_task(rejudge_submission, submission)
+    """
+    Reset submissions and put them into the rejudge lane, where they are judged in order, behind
+    submissions not being rejudged (refer to `dispatcher.semaphore.Semaphore`).
+    """
+    submission_ids = list(submission_set.values_list("pk", flat=True))
+    if not submission_ids:
+        return
+    reset_submissions(submission_ids)
+
+    client = _redis()
+    if not client.exists(REJUDGE_LANE_LOCK) and not client.llen(REJUDGE_QUEUE):
+        # a new batch
+        client.delete(REJUDGE_COUNTER)
+    client.rpush(REJUDGE_QUEUE, *submission_ids)
+    resume_rejudge_lane()
+
+
+def resume_rejudge_lane():
+    """
+    Start the lane if there are submissions queued and no lane is running (e.g. the last one crashed and its lock
+    expired), scheduled with django-q (refer to command `resume_rejudge_lane`)
+    """
+    client = _redis()
+    if client.llen(REJUDGE_QUEUE) and not client.exists(REJUDGE_LANE_LOCK):
+        async_task(run_rejudge_lane)
+
+
+def _rejudge_one(submission_id):
+    client = _redis()
+    start_time = time.time()
+    client.hincrby(REJUDGE_COUNTER, "running", 1)
+    try:
+        rejudge_submission(Submission.objects.get(pk=submission_id), low_priority=True)
+    except:
+        traceback.print_exc()
+    finally:
+        with client.pipeline() as pipe:
+            pipe.hincrby(REJUDGE_COUNTER, "running", -1)
+            pipe.hincrby(REJUDGE_COUNTER, "done", 1)
+            pipe.hincrbyfloat(REJUDGE_COUNTER, "elapsed", time.time() - start_time)
+            pipe.execute()
+        connection.close()
+
+
+def _lane_concurrency():
+    return min(REJUDGE_TASK_LIMIT, Semaphore(_redis(), low_priority=True).low_priority_limit)
+
+
+def run_rejudge_lane():
+    """
+    Rejudge submissions in the queue, with at most `_lane_concurrency()` of them at the same time.
+    Only one lane runs at the same time.
+    """
+    client = _redis()
+    while client.llen(REJUDGE_QUEUE) and client.set(REJUDGE_LANE_LOCK, 1, nx=True, ex=30):
+        running = []
+        try:
+            while True:
+                client.expire(REJUDGE_LANE_LOCK, 30)
+                running = [t for t in running if t.is_alive()]
+                if len(running) >= _lane_concurrency():
+                    time.sleep(0.2)
+                    continue
+                submission_id = client.lpop(REJUDGE_QUEUE)
+                if submission_id is None:
+                    if not running:
+                        break
+                    time.sleep(0.2)
+                    continue
+                t = Thread(target=_rejudge_one, args=(int(submission_id),))
+                t.start()
+                running.append(t)
+        finally:
+            client.delete(REJUDGE_LANE_LOCK)
+        # then submissions queued before the lock is released are not left behind
+
+
+def get_rejudge_progress():
+    """
+    :return: {queued: int, running: int, done: int, eta: seconds or None}
+    """
+    client = _redis()
+    with client.pipeline() as pipe:
+        pipe.llen(REJUDGE_QUEUE)
+        pipe.hgetall(REJUDGE_COUNTER)
+        queued, counter = pipe.execute()
+    counter = {k.decode(): float(v) for k, v in counter.items()}
+    running, done = max(int(counter.get("running", 0)), 0), int(counter.get("done", 0))
+    eta = None
+    if done > 0:
+        eta = (queued + running) * counter.get("elapsed", 0) / done / max(_lane_concurrency(), 1)
+    return dict(queued=queued, running=running, done=done, eta=eta)
 
 
 def rejudge_all_submission_on_contest(contest: Contest):
@@ -1,24 +1,39 @@
 import json
+import multiprocessing
 import os
 import shutil
+import tempfile
 from datetime import datetime
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from os import path
 
 from account.models import User
 from polygon.models import Case, Revision, Asset, Statement, Program, Task
 from polygon.problem2.runner import Runner
+from polygon.problem2.runner.cache import CompileCache
 from polygon.problem2.runner.exception import CompileError
+from polygon.problem2.runner.pool import run_in_pool
 from polygon.problem2.views.case import CaseManagementTools
 from problem.models import Problem
 
 BASE_LOCATION = path.dirname(path.abspath(__file__))
 
 
+def pid_of(x):
+    if x < 0:
+        raise ValueError(x)
+    return x, os.getpid()
+
+
+def run_daemon_pool(queue):
+    queue.put([x for x, _ in run_in_pool(pid_of, [(x,) for x in range(6)], workers=3)])
+
+
 class RunnerTest(TestCase):
     def setUp(self):
         self.user = User.objects.create(email="something@user.com", username="myusername", is_staff=True,
@@ -101,4 +116,100 @@ print(a + b + b % 2)""", pk=31)
             self.assertEqual(sum(map(int, i.input_preview.split())), int(i.output_preview))
         # CaseManagementTools.check_case(self.revision, self.revision.cases.all(), [program, program2], None)
         current_task = Task.objects.last()
-        print(json.dumps(json.loads(current_task.report), sort_keys=True, indent=2))
\ No newline at end of file
+        print(json.dumps(json.loads(current_task.report), sort_keys=True, indent=2))
+
+
+@override_settings(POLYGON_CASE_WORKERS=3)
+class CaseToolsPoolTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="something@user.com", username="myusername", polygon_enabled=True)
+        self.problem = Problem.objects.create()
+        self.revision = Revision.objects.create(problem=self.problem, user=self.user, revision=1)
+        self.revision.programs.create(name="gen", lang="python", tag="generator",
+                                      code="import sys\nprint(sys.argv[1], sys.argv[2])", create_time=datetime.now())
+        self.solution = Program.objects.create(name="a+b", lang="python", tag="solution_main", create_time=datetime.now(),
+                                               code="a, b = map(int, input().split())\nprint(a + b)")
+        self.wrong = Program.objects.create(name="a-b", lang="python", tag="solution_wa", create_time=datetime.now(),
+                                            code="a, b = map(int, input().split())\nprint(a - b)")
+        self.checker = Program.objects.create(name="checker", lang="python", tag="checker", create_time=datetime.now(),
+                                              code="import sys\nexit(open(sys.argv[2]).read().split() != "
+                                                   "open(sys.argv[3]).read().split())")
+
+    def test_generate_run_check(self):
+        CaseManagementTools.generate_cases(self.revision, ["gen %d %d" % (i, i * 2) for i in range(1, 8)] + ["foo"])
+        report = json.loads(Task.objects.last().report)
+        self.assertEqual(8, len(report))
+        self.assertEqual(list(range(1, 8)), [r["case_number"] for r in report[:7]])
+        self.assertFalse(report[7]["success"])
+        cases = self.revision.cases.order_by("case_number")
+        self.assertEqual(["%d %d" % (i, i * 2) for i in range(1, 8)], [c.input_preview for c in cases])
+
+        CaseManagementTools.run_case_output(self.revision, list(cases), self.solution)
+        task = Task.objects.last()
+        self.assertEqual(0, task.status)
+        cases = self.revision.cases.order_by("case_number")
+        self.assertEqual([str(i * 3) for i in range(1, 8)], [c.output_preview for c in cases])
+
+        validator = Program.objects.create(name="validator", lang="python", tag="validator", create_time=datetime.now(),
+                                           code="a, b = map(int, input().split())\nexit(a > 5)")
+        CaseManagementTools.validate_case(self.revision, list(cases), validator)
+        report = json.loads(Task.objects.last().report)
+        self.assertEqual([i <= 5 for i in range(1, 8)], [r["success"] for r in report])
+
+        CaseManagementTools.check_case(self.revision, list(cases), [self.solution, self.wrong], self.checker)
+        task = Task.objects.last()
+        report = json.loads(task.report)
+        self.assertEqual(0, task.status, msg=report.get("error"))
+        self.assertEqual(14, len(report["tasks"]))
+        self.assertEqual({"OK"}, {r["verdict"] for r in report["tasks"] if r["solution"] == self.solution.id})
+        self.assertEqual({"WRONG_ANSWER"}, {r["verdict"] for r in report["tasks"] if r["solution"] == self.wrong.id})
+        self.assertEqual(100, report["summary"][str(self.solution.id)]["points"])
+        self.assertEqual(0, report["summary"][str(self.wrong.id)]["points"])
+
+
+class PoolTest(SimpleTestCase):
+    def test_order(self):
+        results = list(run_in_pool(pid_of, [(x,) for x in range(10)], workers=4))
+        self.assertEqual(list(range(10)), [x for x, _ in results])
+        self.assertNotIn(os.getpid(), {pid for _, pid in results})
+        self.assertEqual(10, len({pid for _, pid in results}))
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            list(run_in_pool(pid_of, [(1,), (-1,), (2,)], workers=2))
+
+    def test_daemon(self):
+        # e.g. django-q workers
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_daemon_pool, args=(queue,), daemon=True)
+        process.start()
+        self.assertEqual(list(range(6)), queue.get(timeout=30))
+        process.join()
+
+
+class CompileCacheTest(TestCase):
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir, ignore_errors=True)
+
+    def test_compile_once(self):
+        with override_settings(REPO_DIR=self.repo_dir):
+            program = Program(name="hello", lang="cpp", code="int main() { return 0; }", tag="solution_main")
+            with mock.patch.object(Runner, "compile", autospec=True, side_effect=Runner.compile) as compile:
+                runners = [Runner(program) for _ in range(3)]
+                self.assertEqual(1, compile.call_count)
+            self.assertEqual(3, len({runner.workspace for runner in runners}))
+            for runner in runners:
+                self.assertEqual("OK", runner.run()["verdict"])
+            program.code = "int main() { return 1; }"
+            self.assertEqual("RUNTIME_ERROR", Runner(program).run()["verdict"])
+
+    def test_evict(self):
+        with override_settings(REPO_DIR=self.repo_dir):
+            cache = CompileCache(max_size=0)
+            for code in ["print(1)", "print(2)"]:
+                Runner(Program(name="hello", lang="python", code=code, tag="solution_main"))
+                cache.evict()
+                self.assertEqual([], os.listdir(cache.root))
@@ -0,0 +1,117 @@
+"""
+Redis-backed counters for statistics of problems and users, updated one (problem, user) pair at a time.
+
+What a pair contributes is (number of submissions, number of accepted ones). `ContributionIndex` keeps the
+contribution of each member (users of a problem, or problems of a user) together with running totals, so a
+verdict only replaces one contribution, instead of counting all submissions of a problem again.
+
+Indexes are rebuilt from database (with one GROUP BY query) when missing, and reconciled periodically,
+refer to `problem.statistics.reconcile_statistics`.
+"""
+
+from django_redis import get_redis_connection
+
+INDEX_TIMEOUT = 86400 * 7
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+class ContributionIndex(object):
+    REPLACE_SCRIPT = """
+    local old = redis.call('hget', KEYS[1], ARGV[1])
+    local old_total, old_accept = 0, 0
+    if old then
+        local sep = string.find(old, ',')
+        old_total, old_accept = tonumber(string.sub(old, 1, sep - 1)), tonumber(string.sub(old, sep + 1))
+    end
+    local total, accept = tonumber(ARGV[2]), tonumber(ARGV[3])
+    if total > 0 then
+        redis.call('hset', KEYS[1], ARGV[1], total .. ',' .. accept)
+    else
+        redis.call('hdel', KEYS[1], ARGV[1])
+    end
+    redis.call('hincrby', KEYS[2], 'total', total - old_total)
+    redis.call('hincrby', KEYS[2], 'accept', accept - old_accept)
+    redis.call('hincrby', KEYS[2], 'member', (total > 0 and 1 or 0) - (old_total > 0 and 1 or 0))
+    redis.call('hincrby', KEYS[2], 'accept_member', (accept > 0 and 1 or 0) - (old_accept > 0 and 1 or 0))
+    return redis.call('hgetall', KEYS[2])
+    """
+
+    def __init__(self, prefix, client=None):
+        self.client = client or _redis()
+        self.contribution_key = prefix + ":CONTRIBUTION"
+        self.counter_key = prefix + ":COUNTER"
+        self.lock_key = prefix + ":LOCK"
+
+    @property
+    def ready(self):
+        return self.client.exists(self.counter_key)
+
+    def lock(self):
+        """
+        Saving totals to database is serialized, so that an older total never overwrites a newer one
+        """
+        return self.client.lock(self.lock_key, timeout=60)
+
+    def rebuild(self, contributions: dict):
+        """
+        :param contributions: {<member>: (total, accept)}, members with no submission should be left out
+        :return: counters, refer to `counters`
+        """
+        counter = dict(total=0, accept=0, member=0, accept_member=0)
+        for total, accept in contributions.values():
+            counter["total"] += total
+            counter["accept"] += accept
+            counter["member"] += 1
+            counter["accept_member"] += 1 if accept > 0 else 0
+        with self.client.pipeline() as pipe:
+            pipe.delete(self.contribution_key, self.counter_key)
+            if contributions:
+                pipe.hmset(self.contribution_key, {member: "%d,%d" % c for member, c in contributions.items()})
+            pipe.hmset(self.counter_key, counter)
+            pipe.expire(self.contribution_key, INDEX_TIMEOUT)
+            pipe.expire(self.counter_key, INDEX_TIMEOUT)
+            pipe.execute()
+        return counter
+
+    def replace(self, member, total, accept):
+        """
+        :return: counters after replacing, refer to `counters`
+        """
+        counter = self.client.eval(self.REPLACE_SCRIPT, 2, self.contribution_key, self.counter_key,
+                                   member, total, accept)
+        with self.client.pipeline() as pipe:
+            pipe.expire(self.contribution_key, INDEX_TIMEOUT)
+            pipe.expire(self.counter_key, INDEX_TIMEOUT)
+            pipe.execute()
+        return {k.decode(): int(v) for k, v in zip(counter[::2], counter[1::2])}
+
+    def counters(self):
+        """
+        :return: {total: submission count, accept: accepted submission count,
+                  member: number of members with submissions, accept_member: number of members accepted}
+        """
+        return {k.decode(): int(v) for k, v in self.client.hgetall(self.counter_key).items()}
+
+    def members(self):
+        """
+        :return: {<member>: (total, accept)}
+        """
+        return {int(member): tuple(map(int, c.decode().split(',')))
+                for member, c in self.client.hgetall(self.contribution_key).items()}
+
+
+def problem_index(problem_id):
+    """
+    Members are users, submissions with verdict ACCEPTED are accepted ones
+    """
+    return ContributionIndex("PROBLEM_STATISTICS:%d" % problem_id)
+
+
+def user_index(user_id, contest_id=0):
+    """
+    Members are problems, submissions with verdict ACCEPTED or PRETEST_PASSED are accepted ones
+    """
+    return ContributionIndex("USER_STATUS:%d:%d" % (user_id, contest_id))
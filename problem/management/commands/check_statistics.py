@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+from django_q.tasks import schedule
+
+from problem.statistics import check_statistics, reconcile_statistics
+
+RECONCILE_TASK = "problem.statistics.reconcile_statistics"
+
+
+class Command(BaseCommand):
+    help = "Check statistics of problems and users against those counted in database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="recount the inconsistent ones")
+        parser.add_argument('--schedule', action='store_true',
+                            help="reconcile statistics every hour with django-q, instead of checking now")
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            if not Schedule.objects.filter(func=RECONCILE_TASK).exists():
+                schedule(RECONCILE_TASK, name="reconcile statistics", schedule_type=Schedule.HOURLY)
+            self.stdout.write("Scheduled hourly.")
+            return
+        inconsistencies = reconcile_statistics() if options['fix'] else check_statistics()
+        for model, key, field, saved, counted in inconsistencies:
+            self.stdout.write("%s %s: %s is %s, counted %s" % (model, key, field, saved, counted))
+        self.stdout.write("%d inconsistencies found%s." % (len(inconsistencies), ", fixed" if options['fix'] else ""))
@@ -1,25 +1,79 @@
 from math import log10
 
+from django.db.models import Count, Q
+
 from problem.models import UserStatus, TagInfo, Problem
 from submission.models import Submission
 from submission.util import SubmissionStatus
 from utils.permission import is_problem_manager
-
-
-def invalidate_problem(problem: Problem, save=True):
-    query_list = list(problem.submission_set.all().values("author_id", "status"))
-    ac_list = list(filter(lambda x: x["status"] == SubmissionStatus.ACCEPTED, query_list))
-    problem.ac_user_count = len(set(map(lambda x: x["author_id"], ac_list)))
-    problem.total_user_count = len(set(map(lambda x: x["author_id"], query_list)))
-    problem.ac_count = len(ac_list)
-    problem.total_count = len(query_list)
+from .incremental import problem_index, user_index
+
+PROBLEM_STATISTICS_FIELDS = ["ac_user_count", "total_user_count", "ac_count", "total_count", "reward"]
+USER_ACCEPTED_STATUS = [SubmissionStatus.ACCEPTED, SubmissionStatus.PRETEST_PASSED]
+
+
+def _problem_contributions(problem_id):
+    """
+    :return: {<user_id>: (submission count, accepted submission count)}
+    """
+    return {author_id: (total, accept) for author_id, total, accept in
+            Submission.objects.filter(problem_id=problem_id).order_by().values("author_id").
+                annotate(total=Count("id"), accept=Count("id", filter=Q(status=SubmissionStatus.ACCEPTED))).
+                values_list("author_id", "total", "accept")}
+
+
+def _update_problem(problem: Problem, counter: dict, save=True):
+    """
+    :param counter: refer to `ContributionIndex.counters`
+    """
+    problem.ac_user_count = counter["accept_member"]
+    problem.total_user_count = counter["member"]
+    problem.ac_count = counter["accept"]
+    problem.total_count = counter["total"]
     problem.reward =  max(min(5 - (.02 * problem.ac_ratio + .03 * problem.ac_user_ratio) * min(log10(problem.ac_user_count + 1), 1.2)
                              + max(6 - 2 * log10(problem.ac_user_count + 1), 0), 9.9), 0.1)
-    for field in problem._meta.local_fields:
-        if field.name == "update_time":
-            field.auto_now = False
     if save:
-        problem.save(update_fields=["ac_user_count", "total_user_count", "ac_count", "total_count", "reward"])
+        problem.save(update_fields=PROBLEM_STATISTICS_FIELDS)
+
+
+def invalidate_problem(problem: Problem, save=True):
+    index = problem_index(problem.pk)
+    with index.lock():
+        _update_problem(problem, index.rebuild(_problem_contributions(problem.pk)), save)
+
+
+def _user_contributions(user_id, contest_id=0):
+    """
+    :return: {<problem_id>: (submission count, accepted submission count)}
+    """
+    submission_filter = Submission.objects.filter(author_id=user_id)
+    if contest_id:
+        submission_filter = submission_filter.filter(contest_id=contest_id)
+    return {problem_id: (total, accept) for problem_id, total, accept in
+            submission_filter.order_by().values("problem_id").
+                annotate(total=Count("id"), accept=Count("id", filter=Q(status__in=USER_ACCEPTED_STATUS))).
+                values_list("problem_id", "total", "accept")}
+
+
+def _save_user_status(user_id, contest_id, contributions: dict):
+    """
+    :param contributions: refer to `_user_contributions`
+    """
+    total_list = sorted(contributions.keys())
+    accept_list = sorted(problem_id for problem_id, (_, accept) in contributions.items() if accept > 0)
+    fields = {
+        "total_count": sum(total for total, _ in contributions.values()),
+        "total_list": ",".join(map(str, total_list)),
+        "ac_count": sum(accept for _, accept in contributions.values()),
+        "ac_list": ",".join(map(str, accept_list)),
+        "ac_distinct_count": len(accept_list)
+    }
+    us, created = UserStatus.objects.get_or_create(user_id=user_id, contest_id=contest_id, defaults=fields)
+    if not created:
+        for k, v in fields.items():
+            setattr(us, k, v)
+        us.save()
+    return us
 
 
 def invalidate_user(user_id, contest_id=0):
@@ -28,34 +82,46 @@ def invalidate_user(user_id, contest_id=0):
     if contest_id:
         invalidate_user(user_id)
 
+    index = user_index(user_id, contest_id)
+    with index.lock():
+        contributions = _user_contributions(user_id, contest_id)
+        index.rebuild(contributions)
+        return _save_user_status(user_id, contest_id, contributions)
+
+
+def apply_submission_to_statistics(submission: Submission):
+    """
+    Refresh statistics of the problem and the author after `submission` is judged (or rejudged). Only the
+    submissions of this author on this problem are counted, to replace what this pair contributed before.
+    Results are the same as `invalidate_problem` and `invalidate_user`.
+    """
+    user_id, problem_id, contest_id = submission.author_id, submission.problem_id, submission.contest_id or 0
+    pair = list(Submission.objects.filter(author_id=user_id, problem_id=problem_id).order_by().
+                values_list("status", "contest_id"))
+
+    index = problem_index(problem_id)
+    with index.lock():
+        if index.ready:
+            counter = index.replace(user_id, len(pair),
+                                    sum(1 for status, _ in pair if status == SubmissionStatus.ACCEPTED))
+        else:
+            counter = index.rebuild(_problem_contributions(problem_id))
+        _update_problem(submission.problem, counter)
+
+    scopes = [(0, pair)]
     if contest_id:
-        submission_filter = Submission.objects.filter(author_id=user_id, contest_id=contest_id).all()
-    else:
-        submission_filter = Submission.objects.filter(author_id=user_id).all()
-    ac_filter = submission_filter.filter(status__in=[SubmissionStatus.ACCEPTED, SubmissionStatus.PRETEST_PASSED]).all()
-
-    total_count = submission_filter.count()
-    total_list = list(submission_filter.order_by().values_list("problem_id", flat=True).distinct())
-    accept_count = ac_filter.count()
-    accept_list = list(ac_filter.order_by().values_list("problem_id", flat=True).distinct())
-    accept_diff = len(accept_list)
-
-    us, created = UserStatus.objects.get_or_create(user_id=user_id, contest_id=contest_id,
-                                                   defaults={
-                                                       "total_count": total_count,
-                                                       "total_list": ",".join(map(str, total_list)),
-                                                       "ac_count": accept_count,
-                                                       "ac_list": ",".join(map(str, accept_list)),
-                                                       "ac_distinct_count": accept_diff
-                                                   })
-    if not created:
-        us.total_count = total_count
-        us.total_list = ",".join(map(str, total_list))
-        us.ac_count = accept_count
-        us.ac_list = ",".join(map(str, accept_list))
-        us.ac_distinct_count = accept_diff
-        us.save()
-    return us
+        scopes.append((contest_id, [(status, c) for status, c in pair if c == contest_id]))
+    for scope, submissions in scopes:
+        index = user_index(user_id, scope)
+        with index.lock():
+            if index.ready:
+                index.replace(problem_id, len(submissions),
+                              sum(1 for status, _ in submissions if status in USER_ACCEPTED_STATUS))
+                contributions = index.members()
+            else:
+                contributions = _user_contributions(user_id, scope)
+                index.rebuild(contributions)
+            _save_user_status(user_id, scope, contributions)
 
 
 def _get_or_invalidate_user(user_id, contest_id, field_name):
@@ -102,3 +168,87 @@ def get_children_tag_id(tag: int = -1):
             break
         tags |= adds
     return tags
+
+
+def check_statistics():
+    """
+    Compare statistics of problems and users (saved in database, and counters in redis) with
+    those counted in database.
+
+    :return: list of (<"problem" or "user">, key, field, saved, counted), key is problem_id for problems,
+    (user_id, contest_id) for users
+    """
+    ans = []
+
+    counted = {row[0]: row[1:] for row in Submission.objects.order_by().values("problem_id").annotate(
+        total=Count("id"), accept=Count("id", filter=Q(status=SubmissionStatus.ACCEPTED)),
+        member=Count("author_id", distinct=True),
+        accept_member=Count("author_id", distinct=True, filter=Q(status=SubmissionStatus.ACCEPTED))).
+        values_list("problem_id", "total", "accept", "member", "accept_member")}
+    problems = list(Problem.objects.values_list("id", "total_count", "ac_count", "total_user_count", "ac_user_count"))
+    with problem_index(0).client.pipeline() as pipe:
+        for problem_id, *_ in problems:
+            pipe.hgetall(problem_index(problem_id).counter_key)
+        index_counters = pipe.execute()
+    for (problem_id, *saved), index_counter in zip(problems, index_counters):
+        expected = counted.get(problem_id, (0, 0, 0, 0))
+        for field, s, c in zip(["total_count", "ac_count", "total_user_count", "ac_user_count"], saved, expected):
+            if s != c:
+                ans.append(("problem", problem_id, field, s, c))
+        if index_counter:
+            index_counter = {k.decode(): int(v) for k, v in index_counter.items()}
+            for field, c in zip(["total", "accept", "member", "accept_member"], expected):
+                if index_counter.get(field) != c:
+                    ans.append(("problem", problem_id, "index." + field, index_counter.get(field), c))
+
+    user_statuses = list(UserStatus.objects.values_list("user_id", "contest_id", "total_count", "ac_count",
+                                                        "ac_distinct_count", "total_list"))
+    contest_ids = set(contest_id for _, contest_id, *_ in user_statuses if contest_id)
+    counted = {}
+    for author_id, total, accept, accept_distinct, total_distinct in Submission.objects.order_by().\
+            values("author_id").annotate(
+            total=Count("id"), accept=Count("id", filter=Q(status__in=USER_ACCEPTED_STATUS)),
+            accept_distinct=Count("problem_id", distinct=True, filter=Q(status__in=USER_ACCEPTED_STATUS)),
+            total_distinct=Count("problem_id", distinct=True)).\
+            values_list("author_id", "total", "accept", "accept_distinct", "total_distinct"):
+        counted[(author_id, 0)] = (total, accept, accept_distinct, total_distinct)
+    for author_id, contest_id, total, accept, accept_distinct, total_distinct in Submission.objects.order_by().\
+            filter(contest_id__in=contest_ids).values("author_id", "contest_id").annotate(
+            total=Count("id"), accept=Count("id", filter=Q(status__in=USER_ACCEPTED_STATUS)),
+            accept_distinct=Count("problem_id", distinct=True, filter=Q(status__in=USER_ACCEPTED_STATUS)),
+            total_distinct=Count("problem_id", distinct=True)).\
+            values_list("author_id", "contest_id", "total", "accept", "accept_distinct", "total_distinct"):
+        counted[(author_id, contest_id)] = (total, accept, accept_distinct, total_distinct)
+    with problem_index(0).client.pipeline() as pipe:
+        for user_id, contest_id, *_ in user_statuses:
+            pipe.hgetall(user_index(user_id, contest_id).counter_key)
+        index_counters = pipe.execute()
+    for (user_id, contest_id, total, accept, accept_distinct, total_list), index_counter in \
+            zip(user_statuses, index_counters):
+        saved = (total, accept, accept_distinct, len(list(filter(lambda x: x, total_list.split(',')))))
+        expected = counted.get((user_id, contest_id), (0, 0, 0, 0))
+        for field, s, c in zip(["total_count", "ac_count", "ac_distinct_count", "total_list"], saved, expected):
+            if s != c:
+                ans.append(("user", (user_id, contest_id), field, s, c))
+        if index_counter:
+            index_counter = {k.decode(): int(v) for k, v in index_counter.items()}
+            for field, c in zip(["total", "accept", "accept_member", "member"], expected):
+                if index_counter.get(field) != c:
+                    ans.append(("user", (user_id, contest_id), "index." + field, index_counter.get(field), c))
+    return ans
+
+
+def reconcile_statistics():
+    """
+    Recount statistics that are found inconsistent by `check_statistics`, meant to be run periodically
+
+    :return: the inconsistencies found
+    """
+    inconsistencies = check_statistics()
+    problems = set(key for model, key, *_ in inconsistencies if model == "problem")
+    users = set(key for model, key, *_ in inconsistencies if model == "user")
+    for problem in Problem.objects.filter(pk__in=problems):
+        invalidate_problem(problem)
+    for user_id, contest_id in users:
+        invalidate_user(user_id, contest_id)
+    return inconsistencies
@@ -3,28 +3,32 @@ from datetime import datetime
 from os import path
 
 from django.conf import settings
+from django_q.tasks import async_task
 
 from account.models import User
 from account.payment import reward_problem_ac, reward_contest_ac
 from dispatcher.judge import send_judge_through_watch
-from dispatcher.manage import upload_case, upload_checker, upload_interactor, upload_validator
+from dispatcher.manage import upload_cases, upload_checker, upload_interactor, upload_validator
 from dispatcher.models import Server
-from problem.statistics import invalidate_user
 from submission.models import Submission, SubmissionReport
 from submission.util import SubmissionStatus
 from utils.detail_formatter import response_fail_with_timestamp
+from utils.language import prerender_code
 from .models import Problem, SpecialProgram, ProblemRewardStatus
-from .statistics import invalidate_problem
+from .statistics import apply_submission_to_statistics
 
 
-def upload_problem_to_judge_server(problem, server):
+def upload_problem_to_judge_server(problem, server, with_cases=True):
     """
     :param problem: the problem to be uploaded
     :type problem: Problem
     :type server: Server
+    :param with_cases: False to upload checker, validator and interactor only
     """
-    for case in set(problem.pretest_list + problem.sample_list + problem.case_list):
-        upload_case(server, case)
+    if with_cases:
+        unavailable = upload_cases(server, problem.pretest_list + problem.sample_list + problem.case_list)
+        if unavailable:
+            raise FileNotFoundError("Data of cases %s cannot be found" % ", ".join(unavailable))
     if problem.checker:
         upload_checker(server, SpecialProgram.objects.get(fingerprint=problem.checker))
     if problem.validator:
@@ -43,11 +47,15 @@ def create_submission(problem, author: User, code, lang, contest=None, status=Su
         if contest.submission_set.filter(author=author, problem_id=problem, code=code, lang=lang).exists():
             raise ValueError("你以前交过完全一样的代码。")
     if isinstance(problem, (int, str)):
-        return Submission.objects.create(lang=lang, code=code, author=author, problem_id=problem, contest=contest,
-                                         status=status, ip=ip)
+        submission = Submission.objects.create(lang=lang, code=code, author=author, problem_id=problem,
+                                               contest=contest, status=status, ip=ip)
     else:
-        return Submission.objects.create(lang=lang, code=code, author=author, problem=problem, contest=contest,
-                                         status=status, ip=ip)
+        submission = Submission.objects.create(lang=lang, code=code, author=author, problem=problem, contest=contest,
+                                               status=status, ip=ip)
+    if settings.CODE_HTML_PRERENDER:
+        # it is usually viewed right after being submitted
+        async_task(prerender_code, code, lang)
+    return submission
 
 
 def process_failed_test(details):
@@ -182,8 +190,7 @@ def judge_submission_on_problem(submission, callback=None, **kwargs):
                         else:
                             reward_problem_ac(submission.author, problem.reward, submission.problem_id)
 
-                invalidate_user(submission.author_id, submission.contest_id)
-                invalidate_problem(submission.problem)
+                apply_submission_to_statistics(submission)
                 if callback:
                     callback()
                 return True
@@ -196,11 +203,12 @@ def judge_submission_on_problem(submission, callback=None, **kwargs):
 
     try:
         report_instance, _ = SubmissionReport.objects.get_or_create(submission=submission)
-        report_instance.content = ""
+        report_instance.content, report_instance.digest, report_instance.case_count = "", "", 0
         report_instance.save()
         send_judge_through_watch(code, submission.lang, problem.time_limit,
                                  problem.memory_limit, kwargs.get('run_until_complete', False),
                                  case_list, problem.checker, problem.interactor, group_config,
-                                 on_receive_data, report_instance=report_instance)
+                                 on_receive_data, report_instance=report_instance,
+                                 low_priority=kwargs.get('low_priority', False), affinity=str(problem.pk))
     except:
         on_receive_data(response_fail_with_timestamp())
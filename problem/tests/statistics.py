@@ -0,0 +1,81 @@
+import random
+
+from django.test import TestCase
+
+from account.models import User
+from contest.models import Contest
+from problem.incremental import problem_index, user_index
+from problem.models import Problem, UserStatus
+from problem.statistics import apply_submission_to_statistics, invalidate_problem, invalidate_user, \
+    check_statistics, reconcile_statistics
+from submission.models import Submission
+from submission.util import SubmissionStatus
+
+VERDICTS = [SubmissionStatus.ACCEPTED, SubmissionStatus.WRONG_ANSWER, SubmissionStatus.PRETEST_PASSED,
+            SubmissionStatus.COMPILE_ERROR, SubmissionStatus.WAITING]
+
+
+class IncrementalStatisticsTest(TestCase):
+    """
+    Statistics applied one verdict at a time must be the same as counted from all submissions.
+    """
+
+    def setUp(self):
+        self.rand = random.Random(0)
+        self.users = [User.objects.create(username="user%d" % i, email="user%d@example.com" % i) for i in range(5)]
+        self.problems = [Problem.objects.create(title="problem%d" % i) for i in range(3)]
+        self.contest = Contest.objects.create(title="contest")
+        self.submissions = []
+
+    def tearDown(self):
+        for user in self.users:
+            for contest_id in (0, self.contest.pk):
+                index = user_index(user.pk, contest_id)
+                index.client.delete(index.contribution_key, index.counter_key)
+        for problem in self.problems:
+            index = problem_index(problem.pk)
+            index.client.delete(index.contribution_key, index.counter_key)
+
+    def judge(self, submission):
+        submission.status = self.rand.choice(VERDICTS)
+        submission.save(update_fields=["status"])
+        apply_submission_to_statistics(submission)
+
+    def snapshot(self):
+        return (sorted(Problem.objects.values_list("id", "ac_user_count", "total_user_count", "ac_count",
+                                                   "total_count", "reward")),
+                sorted(UserStatus.objects.values_list("user_id", "contest_id", "total_count", "total_list",
+                                                      "ac_count", "ac_list", "ac_distinct_count")))
+
+    def test_same_as_invalidate(self):
+        for step in range(150):
+            if not self.submissions or self.rand.random() < 0.6:
+                submission = Submission.objects.create(author=self.rand.choice(self.users),
+                                                       problem=self.rand.choice(self.problems),
+                                                       contest=self.contest if self.rand.random() < 0.3 else None)
+                self.submissions.append(submission)
+            else:
+                submission = self.rand.choice(self.submissions)  # rejudge
+            self.judge(submission)
+        self.assertEqual([], check_statistics())
+        incremental = self.snapshot()
+
+        for problem in self.problems:
+            invalidate_problem(problem)
+        for user in self.users:
+            invalidate_user(user.pk, self.contest.pk)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_reconcile(self):
+        for _ in range(20):
+            submission = Submission.objects.create(author=self.rand.choice(self.users),
+                                                   problem=self.rand.choice(self.problems))
+            self.judge(submission)
+        expected = self.snapshot()
+        # changed behind the counters
+        Submission.objects.filter(pk=submission.pk).update(status=SubmissionStatus.ACCEPTED)
+        Submission.objects.filter(pk=self.rand.choice(self.problems).submission_set.first().pk).delete()
+        self.assertNotEqual([], check_statistics())
+        reconcile_statistics()
+        self.assertEqual([], check_statistics())
+        self.assertNotEqual(expected, self.snapshot())
@@ -499,7 +499,8 @@ class ProblemSubmissionView(LoginRequiredMixin, TemplateView):
             data['submission_block'] = render_submission(submission, permission=permission)
             if permission == 2 or (self.request.user == submission.author and (submission.report_paid or open_all_protocols())) or \
                     (self.request.user.is_authenticated and self.request.user.has_coach_access()):
-                data['report_block'] = render_submission_report(submission.pk)
+                data['report_block'] = render_submission_report(submission.pk,
+                                                                self.request.GET.get('report_page', 1))
             else:
                 data['report_block'] = ''
         else:
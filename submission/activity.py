@@ -0,0 +1,97 @@
+"""
+Daily counts of submissions of each user (`SubmissionDailyCount`), for heatmaps of profiles and the count API,
+so that a year of activity is read from a few hundred rows rather than from all submissions of the user.
+
+A new submission adds one to the count of its day. When a verdict is saved, the day is counted again from
+submissions, which also corrects anything missed. Changes bypassing signals (e.g. `QuerySet.update`) are only
+reflected after `manage.py rebuild_daily_counts`.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, F
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from utils.db import update_or_create
+from .models import Submission, SubmissionDailyCount
+from .util import SubmissionStatus
+
+
+def count_submissions(submissions):
+    """
+    :return: queryset of {author_id, date, submissions, accepted}, the raw query that daily counts are made of
+    """
+    return submissions.annotate(date=TruncDate('create_time')).order_by().values('author_id', 'date'). \
+        annotate(submissions=Count('id'), accepted=Count('id', filter=Q(status=SubmissionStatus.ACCEPTED)))
+
+
+def refresh_day(user_id, date):
+    """
+    Count submissions of a user on a day again
+    """
+    start = datetime.combine(date, time())
+    counts = Submission.objects.filter(author_id=user_id, create_time__gte=start,
+                                       create_time__lt=start + timedelta(days=1)). \
+        aggregate(submissions=Count('id'), accepted=Count('id', filter=Q(status=SubmissionStatus.ACCEPTED)))
+    if not counts['submissions']:
+        SubmissionDailyCount.objects.filter(user_id=user_id, date=date).delete()
+        return
+    update_or_create(SubmissionDailyCount, dict(user_id=user_id, date=date), counts)
+
+
+def add_submission(user_id, date, accepted):
+    update_or_create(SubmissionDailyCount, dict(user_id=user_id, date=date),
+                     dict(submissions=F('submissions') + 1, accepted=F('accepted') + int(accepted)),
+                     dict(submissions=1, accepted=int(accepted)))
+
+
+def daily_counts(user_id, since):
+    """
+    :param since: date
+    :return: [(date, submissions, accepted)] in the order of date, days without submissions are omitted
+    """
+    return list(SubmissionDailyCount.objects.filter(user_id=user_id, date__gte=since).order_by('date').
+                values_list('date', 'submissions', 'accepted'))
+
+
+def rebuild_daily_counts(user_ids=None, batch_size=1000):
+    """
+    :param user_ids: only count submissions of these users, all by default
+    :return: number of daily counts saved
+    """
+    submissions = Submission.objects.all()
+    counts = SubmissionDailyCount.objects.all()
+    if user_ids is not None:
+        submissions = submissions.filter(author_id__in=user_ids)
+        counts = counts.filter(user_id__in=user_ids)
+    total, batch = 0, []
+    with transaction.atomic():
+        counts.delete()
+        for row in count_submissions(submissions).iterator():
+            batch.append(SubmissionDailyCount(user_id=row['author_id'], date=row['date'],
+                                              submissions=row['submissions'], accepted=row['accepted']))
+            if len(batch) >= batch_size:
+                SubmissionDailyCount.objects.bulk_create(batch)
+                total, batch = total + len(batch), []
+        SubmissionDailyCount.objects.bulk_create(batch)
+    return total + len(batch)
+
+
+@receiver(post_save, sender=Submission)
+def submission_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if created:
+        add_submission(instance.author_id, instance.create_time.date(),
+                       instance.status == SubmissionStatus.ACCEPTED)
+        return
+    # progress of judging is saved many times, while counts only change with verdicts (or rejudging)
+    if update_fields is not None and 'status' not in update_fields or instance.status == SubmissionStatus.JUDGING:
+        return
+    refresh_day(instance.author_id, instance.create_time.date())
+
+
+@receiver(post_delete, sender=Submission)
+def submission_deleted(sender, instance, **kwargs):
+    refresh_day(instance.author_id, instance.create_time.date())
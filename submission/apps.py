@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SubmissionConfig(AppConfig):
+    name = 'submission'
+
+    def ready(self):
+        # receivers updating daily counts of submissions
+        from . import activity
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import User
+from submission.activity import rebuild_daily_counts
+
+
+class Command(BaseCommand):
+    help = "Count submissions of each user on each day again from scratch (refer to submission.activity), e.g. " \
+           "to fill the counts for submissions created before them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="only count submissions of these users")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('id', flat=True))
+            if len(user_ids) != len(set(options['usernames'])):
+                raise CommandError("Some users do not exist")
+        start = time.time()
+        count = rebuild_daily_counts(user_ids)
+        self.stdout.write("%d daily counts saved in %.1f s" % (count, time.time() - start))
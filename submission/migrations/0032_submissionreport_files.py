@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submission', '0031_submissiondailycount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionreport',
+            name='case_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='submissionreport',
+            name='digest',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
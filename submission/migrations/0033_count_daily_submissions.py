@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+ACCEPTED = 0  # submission.util.SubmissionStatus.ACCEPTED
+
+
+def count_daily_submissions(apps, schema_editor):
+    Submission = apps.get_model('submission', 'Submission')
+    SubmissionDailyCount = apps.get_model('submission', 'SubmissionDailyCount')
+    SubmissionDailyCount.objects.all().delete()
+    counts = Submission.objects.annotate(date=TruncDate('create_time')).order_by().values('author_id', 'date'). \
+        annotate(submissions=Count('id'), accepted=Count('id', filter=Q(status=ACCEPTED)))
+    batch = []
+    for row in counts.iterator():
+        batch.append(SubmissionDailyCount(user_id=row['author_id'], date=row['date'],
+                                          submissions=row['submissions'], accepted=row['accepted']))
+        if len(batch) >= 1000:
+            SubmissionDailyCount.objects.bulk_create(batch)
+            batch = []
+    SubmissionDailyCount.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submission', '0032_submissionreport_files'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_daily_submissions, migrations.RunPython.noop),
+    ]
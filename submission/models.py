@@ -125,7 +125,24 @@ class Submission(models.Model):
 
 class SubmissionReport(models.Model):
     submission = models.OneToOneField(Submission, on_delete=models.CASCADE)
+    # reports saved before files were used, refer to `submission.report`
     content = models.TextField(blank=True)
+    # digest of the index of cases stored in files
+    digest = models.CharField(max_length=64, blank=True)
+    case_count = models.PositiveIntegerField(default=0)
+
+
+class SubmissionDailyCount(models.Model):
+    """
+    Submissions of a user created on a day, and how many of them are accepted (refer to `submission.activity`)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    submissions = models.PositiveIntegerField(default=0)
+    accepted = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'date')
 
 
 class PrintManager(models.Model):
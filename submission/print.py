@@ -1,15 +1,20 @@
 import os
 import re
-
 import subprocess
+import tempfile
+import time
 import traceback
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Sum
+from django.core.cache import cache
+from django.db.models import Sum, Q
 from django.http import Http404
+from django_q.tasks import async_task
+from django_redis import get_redis_connection
 
 from account.models import User
 from django.http import HttpResponse
@@ -22,9 +27,14 @@ from account.permissions import StaffRequiredMixin
 from submission.models import PrintManager, PrintCode
 from utils import random_string
 from utils.download import respond_generate_file
+from utils.hash import sha_hash
 from utils.site_settings import site_settings_get
 from utils.upload import save_uploaded_file_to
 
+PRINT_RENDER_SLOT_KEY = "PRINT_RENDER_SLOT:%d"
+PRINT_RENDER_TIMES_KEY = "PRINT_RENDER_TIMES"
+PRINT_RENDER_TIMES_KEPT = 200
+
 
 def latex_replace(s):
     d = {
@@ -47,34 +57,108 @@ def latex_replace(s):
     return res
 
 
+def render_tex(tex_code, pdf_path):
+    """
+    Compile with xelatex in a directory of its own (nothing else of the process changes, e.g. working directory),
+    and move the PDF to pdf_path
+    """
+    with tempfile.TemporaryDirectory(dir=settings.GENERATE_DIR) as work_dir:
+        with open(os.path.join(work_dir, "code.tex"), "w") as f:
+            f.write(tex_code)
+        tex_gen = subprocess.run(["/usr/bin/xelatex", "-interaction=nonstopmode", "code.tex"], cwd=work_dir,
+                                 stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                 timeout=settings.PRINT_RENDER_TIMEOUT)
+        if tex_gen.returncode != 0 or not os.path.exists(os.path.join(work_dir, "code.pdf")):
+            raise ValueError("TeX generation failed")
+        os.replace(os.path.join(work_dir, "code.pdf"), pdf_path)
+
+
+@contextmanager
+def render_slot():
+    """
+    One of `settings.PRINT_RENDER_WORKERS` slots, shared by all processes, so that at most that many PDFs are rendered
+    at a time however many tasks are running
+    """
+    while True:
+        for slot in range(settings.PRINT_RENDER_WORKERS):
+            key = PRINT_RENDER_SLOT_KEY % slot
+            if cache.add(key, 1, settings.PRINT_RENDER_TIMEOUT):
+                try:
+                    yield
+                finally:
+                    cache.delete(key)
+                return
+        time.sleep(0.2)
+
+
+def record_render_time(seconds):
+    try:
+        redis = get_redis_connection("default")
+        redis.lpush(PRINT_RENDER_TIMES_KEY, "%.3f" % seconds)
+        redis.ltrim(PRINT_RENDER_TIMES_KEY, 0, PRINT_RENDER_TIMES_KEPT - 1)
+    except:
+        pass
+
+
+def print_queue_status():
+    """
+    :return: dict of jobs waiting and statistics (in seconds) of recent renders
+    """
+    try:
+        times = sorted(float(t) for t in get_redis_connection("default").lrange(PRINT_RENDER_TIMES_KEY, 0, -1))
+    except:
+        times = []
+    status = dict(queue=PrintCode.objects.filter(status=-1).count(), renders=len(times))
+    if times:
+        status.update(median=times[len(times) // 2],
+                      p90=times[min(int(len(times) * 0.9), len(times) - 1)], max=times[-1])
+    return status
+
+
+def pages_used(manager_id):
+    """
+    :return: (limit of the manager, pages printed or to be printed in the last day), in one query
+    """
+    since = datetime.now() - timedelta(days=1)
+    return PrintManager.objects.filter(pk=manager_id).annotate(
+        used=Sum("printcode__pages", filter=Q(printcode__create_time__gt=since, printcode__status__in=[-1, 0]))). \
+        values_list("limit", "used").get()
+
+
+def count_pages(pdf_file_path):
+    pdfinfo = subprocess.check_output(["/usr/bin/pdfinfo", pdf_file_path]).decode()
+    pdfinfo_match = re.match(r"Pages:\s+(\d+)", pdfinfo)
+    if pdfinfo_match:
+        return int(pdfinfo_match.group(1))
+    return None
+
+
 def process_code(code: PrintCode):
-    base_dir, gen_dir = settings.BASE_DIR, settings.GENERATE_DIR
-    os.chdir(gen_dir)
+    """
+    Render (unless uploaded as PDF) and print, run by django-q workers
+    """
     try:
         if not code.generated_pdf:
-            with open(os.path.join(base_dir, "submission/assets/template.tex")) as f:
+            with open(os.path.join(settings.BASE_DIR, "submission/assets/template.tex")) as f:
                 tex_code = f.read()
                 tex_code = tex_code.replace("$$username$$", latex_replace(code.user.username))
                 tex_code = tex_code.replace("$$comment$$", latex_replace(code.comment))
                 tex_code = tex_code.replace("$$code$$", code.code.replace("\\end{lstlisting}", ""))
-            secret_key = random_string()
-            tex_file_path = secret_key + ".tex"
-            pdf_file_path = secret_key + ".pdf"
-            with open(tex_file_path, "w") as f:
-                f.write(tex_code)
-            tex_gen = subprocess.run(["/usr/bin/xelatex", tex_file_path])
-            if tex_gen.returncode != 0 or not os.path.exists(pdf_file_path):
-                raise ValueError("TeX generation failed")
-            code.generated_pdf = secret_key
+            # PDF of the same code (with same username and comment) is rendered once
+            generated_pdf = "print-" + sha_hash(tex_code)
+            pdf_file_path = os.path.join(settings.GENERATE_DIR, generated_pdf + ".pdf")
+            if not os.path.exists(pdf_file_path):
+                with render_slot():
+                    start_time = time.time()
+                    render_tex(tex_code, pdf_file_path)
+                    record_render_time(time.time() - start_time)
+            code.generated_pdf = generated_pdf
         else:
-            pdf_file_path = code.generated_pdf + ".pdf"
-        pdfinfo = subprocess.check_output(["/usr/bin/pdfinfo", pdf_file_path]).decode()
-        pdfinfo_match = re.match(r"Pages:\s+(\d+)", pdfinfo)
-        if pdfinfo_match:
-            code.pages = int(pdfinfo_match.group(1))
-        code.save()
-        if code.pages > code.manager.limit or \
-                code.manager.printcode_set.filter(create_time__gt=datetime.now() - timedelta(days=1)).aggregate(Sum("pages"))["pages__sum"] > code.manager.limit:
+            pdf_file_path = os.path.join(settings.GENERATE_DIR, code.generated_pdf + ".pdf")
+        code.pages = count_pages(pdf_file_path) or code.pages
+        code.save(update_fields=["generated_pdf", "pages"])
+        limit, used = pages_used(code.manager_id)
+        if code.pages > limit or (used or 0) > limit:
             # limit pages
             raise ValueError("Too many pages")
         subprocess.run(["/usr/bin/lp", "-d", site_settings_get("PRINTER_NAME", "LaserJet"), pdf_file_path])
@@ -82,8 +166,11 @@ def process_code(code: PrintCode):
     except:
         traceback.print_exc()
         code.status = 1
-    os.chdir(base_dir)
-    code.save()
+    code.save(update_fields=["status"])
+
+
+def process_code_by_id(code_id):
+    process_code(PrintCode.objects.select_related("user").get(pk=code_id))
 
 
 class PrintAdminView(StaffRequiredMixin, ListView):
@@ -93,6 +180,11 @@ class PrintAdminView(StaffRequiredMixin, ListView):
     def get_queryset(self):
         return PrintManager.objects.all().order_by("-create_time")
 
+    def get_context_data(self, **kwargs):
+        data = super().get_context_data(**kwargs)
+        data['queue_status'] = print_queue_status()
+        return data
+
     def post(self, request, *args, **kwargs):
         if request.POST.get('users').strip():
             for username in request.POST['users'].split():
@@ -136,7 +228,7 @@ class PrintCodeView(LoginRequiredMixin, ListView):
             p.pages = 0
             p.save()
         else:
-            process_code(p)
+            async_task(process_code_by_id, p.pk)
         return redirect(request.path)
 
 
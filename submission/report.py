@@ -0,0 +1,121 @@
+"""
+Storage of judge reports (protocols) out of the database.
+
+A report from the judge server is made of lines, one for each case: `meta|input|output|answer|checker` (or
+`meta|input|output|stderr|answer|checker`), texts encoded with base64. Each text is decoded and stored as a
+compressed file named by its hash under `settings.REPORT_DIR`, so inputs and answers shared by all submissions of
+a problem are stored once. An index of the report ([{"meta": ..., <field>: <digest>}] for each case) is stored
+the same way, and only its digest is kept in `SubmissionReport.digest`.
+
+Reports are written line by line while they are received (refer to `save_report`), and cases are read a page at
+a time (refer to `load_cases`). Reports saved before in `SubmissionReport.content` are still read from there.
+
+Files are never deleted, since they are shared by reports.
+"""
+
+import json
+import os
+import tempfile
+import zlib
+from base64 import b64decode
+from binascii import Error as Base64Error
+
+from django.conf import settings
+
+from utils.hash import sha_hash
+
+FIELDS = ['input', 'output', 'answer', 'checker']
+FIELDS_WITH_STDERR = ['input', 'output', 'stderr', 'answer', 'checker']
+
+
+def blob_path(digest):
+    return os.path.join(settings.REPORT_DIR, digest[:2], digest[2:])
+
+
+def put_blob(data: bytes):
+    """
+    :return: digest of data
+    """
+    digest = sha_hash(data)
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(zlib.compress(data))
+        os.replace(temp_path, path)
+    return digest
+
+
+def get_blob(digest):
+    with open(blob_path(digest), 'rb') as f:
+        return zlib.decompress(f.read())
+
+
+def parse_line(line: bytes):
+    """
+    :return: (meta, {field: decoded bytes}), None if the line is not a case
+    """
+    meta, *b64s = line.strip().split(b'|')
+    if len(b64s) == len(FIELDS):
+        fields = FIELDS
+    elif len(b64s) == len(FIELDS_WITH_STDERR):
+        fields = FIELDS_WITH_STDERR
+    else:
+        return None
+    try:
+        return meta.decode(errors='replace'), {field: b64decode(b64) for field, b64 in zip(fields, b64s)}
+    except Base64Error:
+        return None
+
+
+def save_report(report, lines):
+    """
+    :param report: SubmissionReport
+    :param lines: iterable of lines (bytes) of the report, e.g. streamed from the judge server
+    """
+    index = []
+    for line in lines:
+        case = parse_line(line)
+        if case is None:
+            continue
+        meta, texts = case
+        entry = {field: put_blob(text) for field, text in texts.items()}
+        entry['meta'] = meta
+        index.append(entry)
+    report.digest = put_blob(json.dumps(index).encode())
+    report.case_count = len(index)
+    report.content = ''
+    report.save(update_fields=['digest', 'case_count', 'content'])
+
+
+def _truncate(data: bytes):
+    limit = settings.REPORT_TEXT_LIMIT
+    text = data[:limit].decode(errors='replace')
+    if len(data) > limit:
+        text += '\n... (%d bytes in total)' % len(data)
+    return text
+
+
+def load_cases(report, start=0, stop=None):
+    """
+    :return: (number of cases, [{meta, input, output, stderr, answer, checker}] for cases [start, stop)), texts
+             are truncated to `settings.REPORT_TEXT_LIMIT` bytes
+    """
+    if report.digest:
+        index = json.loads(get_blob(report.digest).decode())
+        cases = [dict(meta=entry['meta'], **{field: get_blob(entry[field])
+                                             for field in FIELDS_WITH_STDERR if field in entry})
+                 for entry in index[start:stop]]
+    else:
+        # saved in the database before
+        index = [line for line in report.content.strip().split('\n') if line]
+        cases = []
+        for line in index[start:stop]:
+            case = parse_line(line.encode())
+            if case is not None:
+                cases.append(dict(meta=case[0], **case[1]))
+    for case in cases:
+        for field in FIELDS_WITH_STDERR:
+            case[field] = _truncate(case.get(field, b''))
+    return len(index), cases
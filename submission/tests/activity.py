@@ -0,0 +1,96 @@
+import json
+import random
+from datetime import datetime, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory
+
+from account.models import User
+from account.profile import ProfileView
+from problem.models import Problem
+from submission.activity import count_submissions
+from submission.models import Submission, SubmissionDailyCount
+from submission.util import SubmissionStatus
+from submission.views import submission_count_api
+
+VERDICTS = [SubmissionStatus.ACCEPTED, SubmissionStatus.WRONG_ANSWER, SubmissionStatus.COMPILE_ERROR,
+            SubmissionStatus.TIME_LIMIT_EXCEEDED]
+
+
+class DailyCountTest(TestCase):
+
+    def setUp(self):
+        self.rand = random.Random(0)
+        self.users = [User.objects.create(username="user%d" % i, email="user%d@example.com" % i) for i in range(3)]
+        self.problem = Problem.objects.create(title="problem")
+        self.today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def submit(self, days_ago, user=None, status=SubmissionStatus.SUBMITTED):
+        create_time = self.today - timedelta(days=days_ago, minutes=self.rand.randint(-600, 600))
+        with mock.patch("django.utils.timezone.now", return_value=create_time):
+            return Submission.objects.create(author=user or self.rand.choice(self.users), problem=self.problem,
+                                             status=status)
+
+    def assertConsistent(self):
+        expected = {(row["author_id"], row["date"]): (row["submissions"], row["accepted"])
+                    for row in count_submissions(Submission.objects.all())}
+        self.assertEqual(expected, {(c.user_id, c.date): (c.submissions, c.accepted)
+                                    for c in SubmissionDailyCount.objects.all()})
+
+    def test_consistent(self):
+        submissions = [self.submit(self.rand.randint(0, 30)) for _ in range(60)]
+        self.assertConsistent()
+        for submission in submissions:
+            submission.status = SubmissionStatus.JUDGING
+            submission.save(update_fields=["status"])
+            submission.status = self.rand.choice(VERDICTS)
+            submission.save(update_fields=["status", "status_percent"])
+        self.assertConsistent()
+        for submission in self.rand.sample(submissions, 20):
+            # rejudged
+            submission.status = SubmissionStatus.WAITING
+            submission.save(update_fields=["status"])
+        self.assertConsistent()
+        for submission in self.rand.sample(submissions, 20):
+            submission.delete()
+        self.submit(0, status=SubmissionStatus.ACCEPTED)
+        self.assertConsistent()
+
+    def test_judging_progress(self):
+        submission = self.submit(0)
+        submission.status = SubmissionStatus.JUDGING
+        with self.assertNumQueries(1):
+            submission.save(update_fields=["status", "status_detail"])
+
+    def test_rebuild(self):
+        for _ in range(20):
+            self.submit(self.rand.randint(0, 30), status=self.rand.choice(VERDICTS))
+        Submission.objects.filter(pk__in=Submission.objects.all()[:5].values_list("pk", flat=True)). \
+            update(status=SubmissionStatus.ACCEPTED)
+        call_command("rebuild_daily_counts", stdout=StringIO())
+        self.assertConsistent()
+        call_command("rebuild_daily_counts", "user0", stdout=StringIO())
+        self.assertConsistent()
+
+    def test_migration(self):
+        for _ in range(20):
+            self.submit(self.rand.randint(0, 30), status=self.rand.choice(VERDICTS))
+        SubmissionDailyCount.objects.all().delete()
+        import_module("submission.migrations.0033_count_daily_submissions").count_daily_submissions(apps, None)
+        self.assertConsistent()
+
+    def test_read(self):
+        user = self.users[0]
+        for days_ago in [0, 0, 1, 3, 400]:
+            self.submit(days_ago, user=user)
+        counts = json.loads(submission_count_api(RequestFactory().get("/"), user.username).content.decode())
+        self.assertEqual([2, 1, 1], [counts[k] for k in sorted(counts, key=float, reverse=True)])
+        view = ProfileView()
+        view.user = user
+        heatmap = json.loads(view.get_heatmap_data()[0])
+        self.assertEqual(4, sum(day["submissions"] for day in heatmap))
+        self.assertEqual(2, heatmap[-1]["submissions"])
@@ -0,0 +1,83 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from account.models import User
+from submission.models import PrintManager, PrintCode
+from submission.print import process_code_by_id, print_queue_status
+
+
+class PrintTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="printer", email="printer@example.com")
+        self.manager = PrintManager.objects.create(user=self.user, limit=5)
+        self.generate_dir = tempfile.mkdtemp()
+        self.renders, self.printed = 0, []
+
+    def tearDown(self):
+        shutil.rmtree(self.generate_dir)
+
+    def run_command(self, args, cwd=None, **kwargs):
+        if args[0].endswith("xelatex"):
+            with open(os.path.join(cwd, "code.pdf"), "w") as f:
+                f.write("%PDF")
+            self.renders += 1
+        else:
+            self.printed.append(args[-1])
+        return subprocess.CompletedProcess(args, 0)
+
+    def process(self, code="int main() { return 0; }", comment=""):
+        code = self.manager.printcode_set.create(code=code, user=self.user, comment=comment)
+        cwd = os.getcwd()
+        with override_settings(GENERATE_DIR=self.generate_dir), \
+                mock.patch("submission.print.subprocess.run", side_effect=self.run_command), \
+                mock.patch("submission.print.subprocess.check_output", return_value=b"Pages:          3\n"):
+            process_code_by_id(code.pk)
+        self.assertEqual(cwd, os.getcwd())
+        return PrintCode.objects.get(pk=code.pk)
+
+    def test_print(self):
+        code = self.process()
+        self.assertEqual((0, 3), (code.status, code.pages))
+        self.assertEqual([os.path.join(self.generate_dir, code.generated_pdf + ".pdf")], self.printed)
+        self.assertEqual([code.generated_pdf + ".pdf"], os.listdir(self.generate_dir))
+        self.assertEqual(0, print_queue_status()["queue"])
+
+    def test_cached(self):
+        self.manager.limit = 50
+        self.manager.save()
+        first = self.process(comment="a")
+        second = self.process(comment="a")
+        self.assertEqual(1, self.renders)
+        self.assertEqual(first.generated_pdf, second.generated_pdf)
+        self.assertNotEqual(first.generated_pdf, self.process(comment="b").generated_pdf)
+        self.assertEqual(2, self.renders)
+
+    def test_limit(self):
+        self.assertEqual(0, self.process().status)
+        self.assertEqual(1, self.process(code="int main() { return 1; }").status)
+        self.assertEqual(1, len(self.printed))
+
+    def test_queued(self):
+        self.client.force_login(self.user)
+        with mock.patch("submission.print.async_task") as async_task:
+            self.client.post(reverse("print"), {"uploadtype": "code", "code": "int main() {}", "comment": "c"})
+        code = PrintCode.objects.get()
+        self.assertEqual(-1, code.status)
+        async_task.assert_called_once_with(process_code_by_id, code.pk)
+        self.assertEqual(1, print_queue_status()["queue"])
+
+    def test_admin(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.process()
+        response = self.client.get(reverse("print_admin"))
+        self.assertEqual(200, response.status_code)
+        self.assertIn("In queue", response.content.decode())
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+from base64 import b64encode
+
+from django.test import TestCase, override_settings
+
+from account.models import User
+from problem.models import Problem
+from submission.models import Submission, SubmissionReport
+from submission.report import save_report, load_cases
+from submission.views import render_submission_report
+
+
+def b64(text):
+    return b64encode(text.encode()).decode()
+
+
+def report_line(i, output=None, stderr=None):
+    texts = ["input %d\n" % i, output or "output %d\n" % i, "answer %d\n" % i, "ok"]
+    if stderr is not None:
+        texts.insert(2, stderr)
+    return "|".join(["verdict %d" % i] + [b64(text) for text in texts])
+
+
+class ReportTest(TestCase):
+
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp()
+        self.override = override_settings(REPORT_DIR=self.report_dir, REPORT_CASES_PER_PAGE=3, REPORT_TEXT_LIMIT=16)
+        self.override.enable()
+        user = User.objects.create(username="user", email="user@example.com")
+        problem = Problem.objects.create(title="problem")
+        self.submissions = [Submission.objects.create(author=user, problem=problem) for _ in range(2)]
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.report_dir)
+
+    def count_files(self):
+        return sum(len(files) for _, _, files in os.walk(self.report_dir))
+
+    def save(self, submission, lines):
+        report = SubmissionReport.objects.create(submission=submission)
+        save_report(report, (line.encode() for line in lines))
+        return SubmissionReport.objects.get(pk=report.pk)
+
+    def test_save(self):
+        report = self.save(self.submissions[0], [report_line(i) for i in range(1, 8)] + ["", "garbage"])
+        self.assertEqual(7, report.case_count)
+        self.assertEqual("", report.content)
+        files = self.count_files()
+        # inputs and answers are shared with the first report, "ok" is shared by all cases
+        self.save(self.submissions[1], [report_line(i, output="wrong\n") for i in range(1, 8)])
+        self.assertEqual(files + 2, self.count_files())
+
+        count, cases = load_cases(report, 2, 5)
+        self.assertEqual(7, count)
+        self.assertEqual(["verdict 3", "verdict 4", "verdict 5"], [case["meta"] for case in cases])
+        self.assertEqual("input 3\n", cases[0]["input"])
+        self.assertEqual("", cases[0]["stderr"])
+
+    def test_truncate(self):
+        report = self.save(self.submissions[0], [report_line(1, output="x" * 100, stderr="error")])
+        _, cases = load_cases(report)
+        self.assertEqual("x" * 16 + "\n... (100 bytes in total)", cases[0]["output"])
+        self.assertEqual("error", cases[0]["stderr"])
+
+    def test_legacy(self):
+        report = SubmissionReport.objects.create(submission=self.submissions[0],
+                                                 content="\n".join(report_line(i) for i in range(1, 5)))
+        count, cases = load_cases(report, 3)
+        self.assertEqual(4, count)
+        self.assertEqual("answer 4\n", cases[0]["answer"])
+
+    def test_render(self):
+        self.save(self.submissions[0], [report_line(i) for i in range(1, 8)])
+        html = render_submission_report(self.submissions[0].pk, page=3)
+        self.assertIn("input 7", html)
+        self.assertNotIn("input 6", html)
+        self.assertIn("report_page=2", html)
+        self.assertIn("input 1", render_submission_report(self.submissions[0].pk))
+        self.assertEqual("", render_submission_report(self.submissions[1].pk))
+        self.assertEqual("", render_submission_report(self.submissions[0].pk, page="x"))
@@ -1,6 +1,5 @@
 import datetime
 import json
-from base64 import b64decode
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
@@ -21,6 +20,8 @@ from account.permissions import is_admin_or_root
 from contest.models import ContestProblem
 from dispatcher.models import Server
 from utils.permission import get_permission_for_submission
+from .activity import daily_counts
+from .report import load_cases
 from .models import Submission, SubmissionReport
 from submission.util import SubmissionStatus
 
@@ -57,23 +58,20 @@ def render_submission(submission: Submission, permission=1, hide_problem=False,
     return t.render(c)
 
 
-def render_submission_report(pk):
+def render_submission_report(pk, page=1):
+    """
+    :param page: cases are shown `settings.REPORT_CASES_PER_PAGE` at a time, only those of the page are read
+    """
     try:
         report = SubmissionReport.objects.get(submission_id=pk)
-        lines = report.content.strip().split("\n")
-        ans = []
-        for line in lines:
-            meta, *b64s = line.split('|')
-            if len(b64s) == 4:
-                input, output, answer, checker = map(lambda txt: b64decode(txt.encode()).decode(), b64s)
-                stderr = ""
-            else:
-                input, output, stderr, answer, checker = map(lambda txt: b64decode(txt.encode()).decode(), b64s)
-            ans.append({'meta': meta, 'input': input, 'output': output, 'stderr': stderr,
-                        'answer': answer, 'checker': checker})
+        page = max(int(page), 1)
+        per_page = settings.REPORT_CASES_PER_PAGE
+        start = (page - 1) * per_page
+        count, ans = load_cases(report, start, start + per_page)
         t = loader.get_template('components/submission_report.jinja2')
-        return t.render(Context({'testcases': ans}))
-    except (SubmissionReport.DoesNotExist, ValueError):
+        return t.render(Context({'testcases': ans, 'offset': start, 'page': page, 'per_page': per_page,
+                                 'page_count': (count + per_page - 1) // per_page}))
+    except (SubmissionReport.DoesNotExist, ValueError, OSError):
         return ''
 
 
@@ -81,6 +79,7 @@ def submission_count_api(request, name):
     user = get_object_or_404(User, username=name)
     now = datetime.datetime.now()
     one_year_ago = now.replace(year=now.year - 1)
-    submissions = Submission.objects.filter(author=user, create_time__gte=one_year_ago)
-    result = {submission.create_time.timestamp(): 1 for submission in submissions}
+    # submissions of a day are counted at its start
+    result = {datetime.datetime.combine(date, datetime.time()).timestamp(): count
+              for date, count, _ in daily_counts(user.id, one_year_ago.date())}
     return JsonResponse(result)
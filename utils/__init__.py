@@ -1,5 +1,7 @@
 from shortuuid import ShortUUID
 
+default_app_config = 'utils.apps.UtilsConfig'
+
 random_gen = ShortUUID()
 
 def random_string(length=24):
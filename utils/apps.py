@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class UtilsConfig(AppConfig):
+    name = 'utils'
+
+    def ready(self):
+        # receivers updating votes of comments and dropping cached comment trees
+        from . import comment_tree
+        # receivers storing HTML of problems, blogs and comments when they are saved (`settings.MARKDOWN_PRERENDER`)
+        from . import markdown3
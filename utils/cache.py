@@ -0,0 +1,155 @@
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django_redis.cache import RedisCache
+
+from utils import instrumentation
+from utils.hash import sha_hash
+
+_missing = object()
+
+
+class LRUCache(object):
+    """
+    A dict local to the process, bounded by number of entries, or by total weight (e.g. bytes) when `weight` is given.
+    Least recently used entries are evicted first. Thread-safe.
+    """
+
+    def __init__(self, max_size, weight=None):
+        """
+        :param weight: function of value, 1 for each entry by default
+        """
+        self.max_size = max_size
+        self.weight = weight or (lambda value: 1)
+        self.size = 0
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        weight = self.weight(value)
+        if weight > self.max_size:
+            return
+        with self._lock:
+            if key in self._data:
+                self.size -= self.weight(self._data.pop(key))
+            self._data[key] = value
+            self.size += weight
+            while self.size > self.max_size:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= self.weight(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RenderCache(object):
+    """
+    Output of a pure function of text (e.g. markdown to HTML), keyed by hash of the text: looked up in a local LRU,
+    then in the default cache (redis), and computed only when missing in both.
+
+    Bump `version` when the output of the function changes for the same text.
+    """
+
+    def __init__(self, prefix, render, local_size, timeout, version=1, weight=None):
+        self.prefix = prefix
+        self.render = render
+        self.local = LRUCache(local_size, weight)
+        self.timeout = timeout
+        self.version = version
+
+    def digest(self, text):
+        return sha_hash("%d:%s" % (self.version, text))
+
+    def key(self, digest):
+        return "%s:%s" % (self.prefix, digest)
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    def get_many(self, texts):
+        """
+        Missing ones are fetched from redis in one round trip
+        """
+        digests = [self.digest(text) for text in texts]
+        results = {}
+        for digest in digests:
+            value = self.local.get(digest)
+            if value is not None:
+                results[digest] = value
+        missing = [digest for digest in digests if digest not in results]
+        if missing:
+            try:
+                found = cache.get_many([self.key(digest) for digest in missing])
+            except:
+                found = {}
+            for digest in missing:
+                value = found.get(self.key(digest))
+                if value is not None:
+                    results[digest] = value
+                    self.local.set(digest, value)
+        rendered = {}
+        for text, digest in zip(texts, digests):
+            if digest not in results:
+                results[digest] = rendered[self.key(digest)] = self.render(text)
+                self.local.set(digest, results[digest])
+        if rendered:
+            try:
+                cache.set_many(rendered, self.timeout)
+            except:
+                pass
+        return [results[digest] for digest in digests]
+
+    def put(self, text, value):
+        digest = self.digest(text)
+        self.local.set(digest, value)
+        try:
+            cache.set(self.key(digest), value, self.timeout)
+        except:
+            pass
+
+
+class InstrumentedRedisCache(RedisCache):
+    """
+    Redis cache counting hits and misses of requests, refer to `utils.instrumentation`
+    """
+
+    def get(self, key, default=None, version=None, client=None):
+        recorder = instrumentation.current()
+        if recorder is None:
+            return super(InstrumentedRedisCache, self).get(key, default, version, client)
+        value = super(InstrumentedRedisCache, self).get(key, _missing, version, client)
+        if value is _missing:
+            recorder.cache_misses += 1
+            return default
+        recorder.cache_hits += 1
+        return value
+
+    def get_many(self, keys, *args, **kwargs):
+        keys = list(keys)
+        values = super(InstrumentedRedisCache, self).get_many(keys, *args, **kwargs)
+        recorder = instrumentation.current()
+        if recorder is not None:
+            recorder.cache_hits += len(values)
+            recorder.cache_misses += len(keys) - len(values)
+        return values
@@ -0,0 +1,188 @@
+"""
+Comment trees of objects (blogs, problems, contests), refer to `render_comment_tree` in `utils.jinja2.globals`.
+
+Likes and dislikes of each comment are counted in `CommentVotes`, updated when feedback flags are saved or deleted,
+instead of joining all flags of all comments on every render. The tree of an object (comments with votes, nested
+and sorted) is cached as plain dicts, and dropped when one of its comments or their flags changes, so that a render
+reads the cache, authors of the comments and, for logged in users, their own flags only.
+"""
+
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Count, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django_comments.models import CommentFlag
+from django_comments_xtd.models import XtdComment, LIKEDIT_FLAG, DISLIKEDIT_FLAG
+
+from account.models import User
+from utils.db import update_or_create
+
+FEEDBACK_FLAGS = {LIKEDIT_FLAG: 1, DISLIKEDIT_FLAG: -1}
+# of comments in trees, rendered by comments/comment_tree.jinja2
+COMMENT_FIELDS = ('pk', 'user_id', 'submit_date', 'comment', 'is_removed', 'level', 'parent_id')
+
+
+class CommentVotes(models.Model):
+    comment = models.OneToOneField(XtdComment, primary_key=True, on_delete=models.CASCADE, related_name='votes')
+    likes = models.PositiveIntegerField(default=0)
+    dislikes = models.PositiveIntegerField(default=0)
+
+
+def get_config(content_type):  # from django_comments_xtd.utils
+    _default = {
+        'allow_flagging': False,
+        'allow_feedback': False,
+        'show_feedback': False
+    }
+    key = "%s.%s" % (content_type.app_label, content_type.model)
+    try:
+        return settings.COMMENTS_XTD_APP_MODEL_OPTIONS[key]
+    except KeyError:
+        return settings.COMMENTS_XTD_APP_MODEL_OPTIONS.setdefault('default', _default)
+
+
+def count_votes(comment_id, create=True):
+    """
+    Count likes and dislikes of a comment again
+
+    :param create: create counts if missing, not when flags are deleted (maybe along with the comment)
+    """
+    counts = CommentFlag.objects.filter(comment_id=comment_id). \
+        aggregate(likes=Count('id', filter=Q(flag=LIKEDIT_FLAG)), dislikes=Count('id', filter=Q(flag=DISLIKEDIT_FLAG)))
+    if create:
+        update_or_create(CommentVotes, dict(comment_id=comment_id), counts)
+    else:
+        CommentVotes.objects.filter(comment_id=comment_id).update(**counts)
+
+
+def tree_key(content_type_id, object_pk):
+    return "COMMENT_TREE:%d:%s" % (content_type_id, object_pk)
+
+
+def build_tree(comments, with_feedback=False):
+    """
+    :param comments: {COMMENT_FIELDS, 'likes', 'dislikes'} of comments of an object, ordered by thread_id, order
+                     (parents before their replies)
+    :return: [{'comment', 'children', 'likes_count', 'dislikes_count'}] of top level comments, with comment as
+             {COMMENT_FIELDS}, replies to comments that are not given (e.g. not public) are left out
+    """
+    nodes, roots = {}, []
+    for row in comments:
+        comment = {field: row[field] for field in COMMENT_FIELDS}
+        node = nodes[comment['pk']] = {'comment': comment, 'children': []}
+        if with_feedback:
+            node['likes_count'] = row['likes'] or 0
+            node['dislikes_count'] = row['dislikes'] or 0
+        if comment['parent_id'] == comment['pk']:
+            roots.append(node)
+        elif comment['parent_id'] in nodes:
+            nodes[comment['parent_id']]['children'].append(node)
+    return roots
+
+
+def sort_tree(nodes, sort_with_like, depth, now=None):
+    now = now or datetime.now()
+
+    def key(x):
+        day = (now - x['comment']['submit_date']).seconds / 86400
+        if sort_with_like:
+            vote = x['likes_count'] - x['dislikes_count'] * 3
+        else:
+            vote = 0
+        return vote - day
+
+    nodes = sorted(nodes, key=key, reverse=True)
+    if depth:
+        for node in nodes:
+            if node['children']:
+                node['children'] = sort_tree(node['children'], sort_with_like, depth - 1, now)
+    return nodes
+
+
+def get_tree(content_type, object_pk, with_feedback=False):
+    """
+    :return: sorted tree of public comments of an object, refer to `build_tree` (without users, refer to
+             `with_users`)
+    """
+    key = tree_key(content_type.pk, object_pk)
+    try:
+        tree = cache.get(key)
+    except:
+        tree = None
+    if tree is None:
+        comments = XtdComment.objects.filter(content_type=content_type, object_pk=object_pk,
+                                             site__pk=settings.SITE_ID, is_public=True). \
+            order_by('thread_id', 'order'). \
+            values(*COMMENT_FIELDS, likes=models.F('votes__likes'), dislikes=models.F('votes__dislikes'))
+        tree = sort_tree(build_tree(comments, with_feedback), sort_with_like=with_feedback, depth=2)
+        try:
+            cache.set(key, tree, settings.COMMENT_TREE_CACHE_TIMEOUT)
+        except:
+            pass
+    return tree
+
+
+def iter_comments(tree):
+    for node in tree:
+        yield node['comment']
+        yield from iter_comments(node['children'])
+
+
+def with_users(tree):
+    """
+    :return: a copy of the tree with 'user' of comments
+    """
+    users = User.objects.in_bulk({comment['user_id'] for comment in iter_comments(tree)})
+
+    def copy(nodes):
+        return [dict(node, children=copy(node['children']),
+                     comment=dict(node['comment'], user=users.get(node['comment']['user_id'])))
+                for node in nodes]
+
+    return copy(tree)
+
+
+def with_user_feedback(tree, user):
+    """
+    :return: a copy of the tree with 'likes_flag' of the user (1 for like, -1 for dislike, 0 for none)
+    """
+    flags = {}
+    if user.is_authenticated:
+        flags = {comment_id: FEEDBACK_FLAGS[flag] for comment_id, flag in
+                 CommentFlag.objects.filter(user=user, flag__in=FEEDBACK_FLAGS.keys(),
+                                            comment_id__in=[comment['pk'] for comment in iter_comments(tree)]).
+                 values_list('comment_id', 'flag')}
+
+    def copy(nodes):
+        return [dict(node, children=copy(node['children']), likes_flag=flags.get(node['comment']['pk'], 0))
+                for node in nodes]
+
+    return copy(tree)
+
+
+def invalidate_tree(content_type_id, object_pk):
+    try:
+        cache.delete(tree_key(content_type_id, object_pk))
+    except:
+        pass
+
+
+@receiver(post_save, sender=XtdComment)
+@receiver(post_delete, sender=XtdComment)
+def comment_changed(sender, instance, **kwargs):
+    invalidate_tree(instance.content_type_id, instance.object_pk)
+
+
+@receiver(post_save, sender=CommentFlag)
+@receiver(post_delete, sender=CommentFlag)
+def flag_changed(sender, instance, signal, **kwargs):
+    if instance.flag not in FEEDBACK_FLAGS:
+        return
+    count_votes(instance.comment_id, create=signal is post_save)
+    comment = XtdComment.objects.filter(pk=instance.comment_id).values_list('content_type_id', 'object_pk').first()
+    if comment is not None:
+        invalidate_tree(*comment)
@@ -0,0 +1,23 @@
+from django.db import transaction, IntegrityError
+
+
+def update_or_create(model, lookup, updates, defaults=None):
+    """
+    Update rows matching lookup, or create one if there is none. Unlike `QuerySet.update_or_create`, no row is
+    locked and updates can be expressions (e.g. `F('count') + 1`). If the row is created by another one at the
+    same time, it is updated instead.
+
+    :param lookup: {field: value} of the row
+    :param updates: {field: value or expression} to update
+    :param defaults: {field: value} for creation (besides lookup), updates by default
+    :return: True if created
+    """
+    if model.objects.filter(**lookup).update(**updates):
+        return False
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **(updates if defaults is None else defaults))
+        return True
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**updates)
+        return False
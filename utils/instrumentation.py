@@ -0,0 +1,252 @@
+"""
+Always-on instrumentation of requests, refer to `utils.middleware.globalrequestmiddleware`.
+
+For each request, database queries (count and time), hits and misses of the cache, time spent rendering templates and
+the total latency are recorded, and added up by endpoint (method and view name). Queries run many times with the same
+SQL in a request (N+1 queries, usually a relation looked up in a loop) are recorded as offenders.
+
+Numbers are added up in the process first, and written to redis every few seconds (`INSTRUMENTATION_FLUSH_INTERVAL`),
+as counters in buckets of `INSTRUMENTATION_BUCKET` seconds kept for `INSTRUMENTATION_WINDOW` seconds. `report` reads
+buckets of a recent period, for the backstage.
+"""
+
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django_redis import get_redis_connection
+
+PREFIX = "INSTRUMENTATION"
+
+# upper bounds (ms) of buckets of the latency histogram, the last one is unbounded
+LATENCY_BOUNDS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_local = threading.local()
+
+
+class Recorder(object):
+    """
+    What happens during a request, collected in the thread handling it
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.
+        self.sql = Counter()
+        self.cache_hits = self.cache_misses = 0
+        self.template_time = 0.
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # installed as an execute wrapper of database connections
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.sql[sql] += 1
+
+    def render(self, render, *args, **kwargs):
+        # templates rendered by templates (e.g. with `render_to_string` in globals) are not counted twice
+        if self.template_depth:
+            return render(*args, **kwargs)
+        start = time.perf_counter()
+        self.template_depth += 1
+        try:
+            return render(*args, **kwargs)
+        finally:
+            self.template_depth -= 1
+            self.template_time += time.perf_counter() - start
+
+    def stats(self):
+        """
+        :return: counters of the request, times are in microseconds
+        """
+        return {
+            "count": 1,
+            "queries": self.queries,
+            "db_time": int(self.db_time * 1e6),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "template_time": int(self.template_time * 1e6),
+            "time": int((time.perf_counter() - self.start) * 1e6),
+        }
+
+    def repeated(self):
+        """
+        :return: [(sql, times)] of queries run at least `INSTRUMENTATION_N_PLUS_ONE` times
+        """
+        return [(sql, times) for sql, times in self.sql.items() if times >= settings.INSTRUMENTATION_N_PLUS_ONE]
+
+
+def current():
+    """
+    :return: recorder of the request handled by this thread, None outside requests or when disabled
+    """
+    return getattr(_local, "recorder", None)
+
+
+class Collector(object):
+    """
+    Counters added up in the process before being written to redis
+    """
+
+    def __init__(self):
+        self.endpoints = defaultdict(int)
+        self.offenders = defaultdict(int)
+        self.bucket = None
+        self.flushed = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, recorder):
+        stats = recorder.stats()
+        bound = len(LATENCY_BOUNDS)
+        for i, upper in enumerate(LATENCY_BOUNDS):
+            if stats["time"] <= upper * 1000:
+                bound = i
+                break
+        now = time.time()
+        bucket = int(now // settings.INSTRUMENTATION_BUCKET)
+        with self._lock:
+            if self.bucket != bucket or now - self.flushed >= settings.INSTRUMENTATION_FLUSH_INTERVAL:
+                self.flush()
+                self.bucket = bucket
+            for stat, value in stats.items():
+                self.endpoints[endpoint, stat] += value
+            self.endpoints[endpoint, "h%d" % bound] += 1
+            for sql, times in recorder.repeated():
+                sql = sql[:settings.INSTRUMENTATION_SQL_LENGTH]
+                self.offenders[endpoint, sql, "requests"] += 1
+                self.offenders[endpoint, sql, "queries"] += times
+
+    def flush(self):
+        """
+        Write counters to redis, called with the lock held
+        """
+        endpoints, offenders = self.endpoints, self.offenders
+        self.endpoints, self.offenders = defaultdict(int), defaultdict(int)
+        self.flushed = time.time()
+        if self.bucket is None or not endpoints:
+            return
+        try:
+            pipe = get_redis_connection("default").pipeline(transaction=False)
+            for name, counters in ((key(self.bucket), endpoints), (key(self.bucket, "N1"), offenders)):
+                for parts, value in counters.items():
+                    pipe.hincrby(name, field(*parts), value)
+                pipe.expire(name, settings.INSTRUMENTATION_WINDOW + settings.INSTRUMENTATION_BUCKET)
+            pipe.execute()
+        except:
+            # instrumentation never breaks requests, numbers are lost when redis is down
+            pass
+
+
+collector = Collector()
+
+
+def field(*parts):
+    return json.dumps(parts, ensure_ascii=False)
+
+
+def key(bucket, kind=""):
+    return ":".join(filter(None, [PREFIX, kind, str(bucket)]))
+
+
+def start():
+    """
+    Start recording the request handled by this thread
+
+    :return: (recorder or None when disabled, context manager wrapping queries of database connections)
+    """
+    stack = ExitStack()
+    if not settings.INSTRUMENTATION_ENABLED:
+        return None, stack
+    recorder = _local.recorder = Recorder()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return recorder, stack
+
+
+def finish(recorder, request):
+    """
+    Add the recorded request to counters of its endpoint
+    """
+    _local.recorder = None
+    match = getattr(request, "resolver_match", None)
+    collector.add("%s %s" % (request.method, match.view_name if match else "<unresolved>"), recorder)
+
+
+def percentile(histogram, count, ratio):
+    """
+    :return: upper bound (ms) of the latency bucket containing the percentile, None when it is unbounded
+    """
+    seen = 0
+    for i, upper in enumerate(LATENCY_BOUNDS + [None]):
+        seen += histogram[i]
+        if seen >= count * ratio:
+            return upper
+    return None
+
+
+def report(seconds):
+    """
+    :param seconds: recent period to report
+    :return: (endpoints, offenders), dicts sorted by total time and by queries, averages are in ms
+    """
+    with collector._lock:
+        collector.flush()
+    now = int(time.time() // settings.INSTRUMENTATION_BUCKET)
+    buckets = range(now - max(seconds // settings.INSTRUMENTATION_BUCKET, 1) + 1, now + 1)
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    for bucket in buckets:
+        pipe.hgetall(key(bucket))
+        pipe.hgetall(key(bucket, "N1"))
+    results = pipe.execute()
+
+    endpoints = defaultdict(lambda: defaultdict(int))
+    offenders = defaultdict(lambda: defaultdict(int))
+    for i, counters in enumerate(results):
+        for f, value in counters.items():
+            parts = json.loads(f.decode())
+            (offenders[tuple(parts[:2])] if i % 2 else endpoints[parts[0]])[parts[-1]] += int(value)
+
+    endpoint_list = []
+    for endpoint, stats in endpoints.items():
+        count = stats["count"]
+        if not count:
+            continue
+        histogram = [stats["h%d" % i] for i in range(len(LATENCY_BOUNDS) + 1)]
+        cache_gets = stats["cache_hits"] + stats["cache_misses"]
+        endpoint_list.append({
+            "endpoint": endpoint,
+            "count": count,
+            "total_time": stats["time"] / 1e6,
+            "time": stats["time"] / count / 1000,
+            "p50": percentile(histogram, count, .5),
+            "p95": percentile(histogram, count, .95),
+            "queries": stats["queries"] / count,
+            "db_time": stats["db_time"] / count / 1000,
+            "template_time": stats["template_time"] / count / 1000,
+            "cache_hit_ratio": stats["cache_hits"] / cache_gets if cache_gets else None,
+        })
+    endpoint_list.sort(key=lambda x: x["total_time"], reverse=True)
+
+    offender_list = [{"endpoint": endpoint, "sql": sql, "requests": stats["requests"],
+                      "queries": stats["queries"] / stats["requests"]}
+                     for (endpoint, sql), stats in offenders.items() if stats["requests"]]
+    offender_list.sort(key=lambda x: (x["requests"] * x["queries"]), reverse=True)
+    return endpoint_list, offender_list
+
+
+def clear():
+    with collector._lock:
+        collector.endpoints.clear()
+        collector.offenders.clear()
+    r = get_redis_connection("default")
+    for name in r.scan_iter(PREFIX + ":*"):
+        r.delete(name)
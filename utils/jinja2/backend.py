@@ -0,0 +1,24 @@
+from django_jinja import backend
+
+from utils import instrumentation
+
+
+class Template(backend.Template):
+    """
+    Template with rendering time recorded, refer to `utils.instrumentation`
+    """
+
+    def render(self, context=None, request=None):
+        recorder = instrumentation.current()
+        if recorder is None:
+            return super(Template, self).render(context, request)
+        return recorder.render(super(Template, self).render, context, request)
+
+
+class Jinja2(backend.Jinja2):
+
+    def get_template(self, template_name):
+        return Template(super(Jinja2, self).get_template(template_name).template, self)
+
+    def from_string(self, template_code):
+        return Template(self.env.from_string(template_code), self)
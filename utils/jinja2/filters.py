@@ -5,7 +5,7 @@ from django_jinja import library
 from submission.util import STATUS_CHOICE
 import utils.markdown3 as md3
 from bs4 import BeautifulSoup
-from utils.xss_filter import XssHtml
+from utils.sanitizer import sanitize
 
 
 @library.filter(name='status_choice')
@@ -88,10 +88,7 @@ def n2br(value):
 
 @library.filter(name="safer")
 def xss_filter(value):
-    parser = XssHtml()
-    parser.feed(str(value))
-    parser.close()
-    return parser.getHtml()
+    return sanitize(value)
 
 
 @library.filter(name='naturalduration')
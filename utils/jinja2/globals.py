@@ -1,5 +1,4 @@
 import os
-from datetime import datetime
 
 import jinja2
 import markupsafe
@@ -7,12 +6,12 @@ from bs4 import BeautifulSoup
 from django.core.cache import cache
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Sum, Case, IntegerField, When
 from django.http import QueryDict
 from django.utils import translation
-from django_comments_xtd.templatetags.comments_xtd import XtdComment
 from django_jinja import library
 
+import utils.markdown3 as md3
+from utils import comment_tree
 from utils.pagination import EndlessPaginator
 
 
@@ -85,114 +84,15 @@ def paginator(context, adjacent_pages=3):
 @jinja2.contextfunction
 @library.render_with("comments/comment_tree.jinja2")
 def render_comment_tree(context, obj):
-
-    def tree_from_queryset(queryset, with_feedback=False, user=None):
-        """Converts a XtdComment queryset into a list of nested dictionaries.
-        The queryset has to be ordered by thread_id, order.
-        Each dictionary contains two attributes::
-            {
-                'comment': the comment object itself,
-                'children': [list of child comment dictionaries]
-            }
-        """
-        def get_user_feedback(comment, user):
-            d = {
-                'likes_count': comment.likes__count,
-                'dislikes_count': comment.dislikes__count,
-                 }
-            if user.is_authenticated:
-                d['likes_flag'] = comment.likes__flag
-            else:
-                d['likes_flag'] = 0
-            return d
-
-        def add_children(children, obj, user):
-            for item in children:
-                if item['comment'].pk == obj.parent_id:
-                    child_dict = {'comment': obj, 'children': []}
-                    if with_feedback:
-                        child_dict.update(get_user_feedback(obj, user))
-                    item['children'].append(child_dict)
-                    return True
-                elif item['children']:
-                    if add_children(item['children'], obj, user):
-                        return True
-            return False
-
-        def get_new_dict(obj):
-            new_dict = {'comment': obj, 'children': []}
-            if with_feedback:
-                new_dict.update(get_user_feedback(obj, user))
-            return new_dict
-
-        dic_list = []
-        cur_dict = None
-        for obj in queryset:
-            if cur_dict and obj.level == cur_dict['comment'].level:
-                dic_list.append(cur_dict)
-                cur_dict = None
-            if not cur_dict:
-                cur_dict = get_new_dict(obj)
-                continue
-            if obj.parent_id == cur_dict['comment'].pk:
-                child_dict = get_new_dict(obj)
-                cur_dict['children'].append(child_dict)
-            else:
-                add_children(cur_dict['children'], obj, user)
-        if cur_dict:
-            dic_list.append(cur_dict)
-        return dic_list
-
-    def sort(c, sort_with_like, depth):
-        def key(x):
-            day = (datetime.now() - x['comment'].submit_date).seconds / 86400
-            if sort_with_like:
-                vote = x['likes_count'] - x['dislikes_count'] * 3
-            else:
-                vote = 0
-            return vote - day
-        c = sorted(c, key=key, reverse=True)
-        if depth:
-            for i in range(len(c)):
-                if c[i]['children']:
-                    c[i]['children'] = sort(c[i]['children'], sort_with_like, depth - 1)
-        return c
-
-    def get_config(content_type):  # from django_comments_xtd.utils
-        _default = {
-            'allow_flagging': False,
-            'allow_feedback': False,
-            'show_feedback': False
-        }
-        key = "%s.%s" % (content_type.app_label, content_type.model)
-        try:
-            return settings.COMMENTS_XTD_APP_MODEL_OPTIONS[key]
-        except KeyError:
-            return settings.COMMENTS_XTD_APP_MODEL_OPTIONS.setdefault(
-                'default', _default)
-
     ctype = ContentType.objects.get_for_model(obj)
-    config = get_config(ctype)
-    from django_comments_xtd.models import LIKEDIT_FLAG
-    from django_comments_xtd.models import DISLIKEDIT_FLAG
-    queryset = XtdComment.objects.filter(content_type=ctype,
-                                         object_pk=obj.pk,
-                                         site__pk=settings.SITE_ID,
-                                         is_public=True).annotate(
-        likes__count=Sum(Case(When(flags__flag=LIKEDIT_FLAG, then=1), default=0, output_field=IntegerField()))).annotate(
-        dislikes__count=Sum(Case(When(flags__flag=DISLIKEDIT_FLAG, then=1), default=0, output_field=IntegerField())))
+    config = comment_tree.get_config(ctype)
     user = context['user']
-    if user.is_authenticated:
-        queryset = queryset.annotate(
-            likes__flag=Sum(Case(When(flags__user=user, flags__flag=LIKEDIT_FLAG, then=1),
-                                 When(flags__user=user, flags__flag=DISLIKEDIT_FLAG, then=-1),
-                                 default=0, output_field=IntegerField())))
-    comments = tree_from_queryset(
-        queryset,
-        with_feedback=config['allow_feedback'],
-        user=user
-    )
-    comments = sort(comments, sort_with_like=config['allow_feedback'], depth=2)
+    comments = comment_tree.with_users(comment_tree.get_tree(ctype, obj.pk, with_feedback=config['allow_feedback']))
+    if config['allow_feedback']:
+        comments = comment_tree.with_user_feedback(comments, user)
+    # fetch HTML of all comments at once, instead of one by one in the template
+    md3.convert_many([comment['comment'] for comment in comment_tree.iter_comments(comments)
+                      if not comment['is_removed']])
     ctx = dict(comments=comments, user=user)
     ctx.update(config)
     return ctx
@@ -1,7 +1,10 @@
+from django.conf import settings
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name
 from pygments.formatters.html import HtmlFormatter
 
+from utils.cache import RenderCache
+
 
 LANG_CHOICE = (
     ('c', 'C'),
@@ -62,5 +65,48 @@ LANG_EXT = (
 )
 
 
+def _get_lexer(lang):
+    return get_lexer_by_name(dict(LANG_REGULAR_NAME).get(lang, lang))
+
+
+# lexers and formatters keep no state between calls, so they are created once
+_lexers = {lang: _get_lexer(lang) for lang, _ in LANG_CHOICE}
+_formatter = HtmlFormatter()
+
+
+def highlight_code(code, lang):
+    """
+    Highlight without any cache
+    """
+    lexer = _lexers.get(lang)
+    if lexer is None:
+        lexer = _lexers[lang] = _get_lexer(lang)
+    return highlight(code, lexer, _formatter)
+
+
+# code is cached together with its language, as "<lang>\n<code>"
+def _highlight_key(code, lang):
+    return "%s\n%s" % (lang, code)
+
+
+def _highlight(key):
+    lang, code = key.split("\n", 1)
+    return highlight_code(code, lang)
+
+
+code_html_cache = RenderCache('CODE_HTML', _highlight, settings.CODE_HTML_LOCAL_CACHE_SIZE,
+                              settings.CODE_HTML_CACHE_TIMEOUT, weight=len)
+
+
 def transform_code_to_html(code, lang):
-    return highlight(code, get_lexer_by_name(dict(LANG_REGULAR_NAME).get(lang, lang)), HtmlFormatter())
+    """
+    Highlighted code, cached by hash of (code, lang), refer to `utils.cache.RenderCache`
+    """
+    return code_html_cache.get(_highlight_key(code, lang))
+
+
+def prerender_code(code, lang):
+    """
+    Highlight code before it is viewed (e.g. right after it is submitted, refer to `settings.CODE_HTML_PRERENDER`)
+    """
+    transform_code_to_html(code, lang)
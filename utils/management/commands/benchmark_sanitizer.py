@@ -0,0 +1,96 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django_comments_xtd.models import XtdComment
+
+from blog.models import Blog
+from problem.models import Problem
+from utils import markdown3 as md3
+from utils import sanitizer
+from utils.sanitizer import Sanitizer, _Fallback
+from utils.xss_filter import XssHtml
+
+SYNTHETIC_PARTS = [
+    "Given $n$ integers $a_1, a_2, \\ldots, a_n$ ($1 \\le n \\le 10^5$), find the **maximum** sum.\n\n",
+    "```cpp\n#include <bits/stdc++.h>\nusing namespace std;\nint main() {\n  int n; cin >> n;\n"
+    "  for (int i = 0; i < n; ++i) { long long x; cin >> x; }\n  return 0;\n}\n```\n\n",
+    "| input | output |\n|---|---|\n| `1 2` | `3` |\n| `2 3` | `5` |\n\n",
+    "See [the editorial](http://acm.ecnu.edu.cn/blog/1/) and ![figure](/upload/figure.png).\n\n",
+    "- the first line contains $n$;\n- the second line contains <b>n</b> integers & nothing else.\n\n",
+    "> \"quoted\" -- a note...\n\n",
+]
+
+
+def synthetic_pages(count, seed):
+    rand = random.Random(seed)
+    return ["".join(rand.choice(SYNTHETIC_PARTS) for _ in range(rand.randint(2, 12))) for _ in range(count)]
+
+
+def xss_html(html):
+    parser = XssHtml()
+    parser.feed(html)
+    parser.close()
+    return parser.getHtml()
+
+
+class Command(BaseCommand):
+    help = "Sanitize pages of site content (problems, blogs and comments rendered from markdown) with XssHtml and " \
+           "utils.sanitizer, report pages per second, and check both give the same HTML"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help="pages of each kind of content")
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help="use this many synthetic pages instead of site content")
+        parser.add_argument('--seconds', type=float, default=3, help="time spent on each engine")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def load_pages(self, options):
+        if options['synthetic']:
+            texts = synthetic_pages(options['synthetic'], options['seed'])
+        else:
+            texts = []
+            for problem in Problem.objects.only("description", "input", "output", "hint")[:options['limit']]:
+                texts.append("\n\n".join([problem.description, problem.input, problem.output, problem.hint]))
+            texts.extend(Blog.objects.values_list("text", flat=True)[:options['limit']])
+            texts.extend(XtdComment.objects.values_list("comment", flat=True)[:options['limit']])
+            if not texts:
+                self.stdout.write("No site content, using synthetic pages")
+                texts = synthetic_pages(100, options['seed'])
+        return [md3.render(text) for text in texts]
+
+    def run(self, name, sanitize, pages, seconds):
+        count, start = 0, time.time()
+        while time.time() - start < seconds:
+            for page in pages:
+                sanitize(page)
+            count += len(pages)
+        elapsed = time.time() - start
+        self.stdout.write("%-24s %12.1f pages/s %12.3f ms/page" % (name, count / elapsed, elapsed / count * 1000))
+
+    def handle(self, *args, **options):
+        pages = self.load_pages(options)
+        self.stdout.write("%d pages, %.1f KB on average" % (len(pages), sum(map(len, pages)) / len(pages) / 1024))
+
+        sanitizer_ = Sanitizer()
+        failed, fallback, different = 0, 0, 0
+        for page in pages:
+            try:
+                expected = xss_html(page)
+            except:
+                failed += 1
+                continue
+            try:
+                sanitizer_._sanitize(page)
+            except _Fallback:
+                fallback += 1
+            if sanitizer_.sanitize(page) != expected:
+                different += 1
+        self.stdout.write("different from XssHtml:  %d (%d pages XssHtml fails on, %d pages parsed by HTMLParser)" % (
+            different, failed, fallback))
+
+        pages = [page for page in pages if page]
+        self.run("XssHtml", xss_html, pages, options['seconds'])
+        self.run("Sanitizer", sanitizer_.sanitize, pages, options['seconds'])
+        sanitizer._cache.clear()
+        self.run("sanitize (cached)", sanitizer.sanitize, pages, options['seconds'])
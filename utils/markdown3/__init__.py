@@ -1,24 +1,117 @@
+"""
+Markdown to HTML, for problem statements, blogs, comments and so on.
+
+Each thread keeps its own `markdown.Markdown` instance (instances are not thread-safe, and are costly to build), and
+HTML is cached by hash of the text (refer to `utils.cache.RenderCache`). With `settings.MARKDOWN_PRERENDER`, HTML
+of problems, blogs and comments is also rendered and stored in the database when they are saved, so that they are
+never rendered on page views, even after redis is flushed.
+"""
+
+import threading
+
 import markdown
+import markupsafe
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.shortcuts import HttpResponse
+from django_comments_xtd.models import XtdComment
+
+from blog.models import Blog
+from problem.models import Problem
+from utils.cache import RenderCache
 from . import mdx_downheader
 from . import mdx_math
 from . import semantic
-from django.shortcuts import HttpResponse
+from .models import RenderedMarkdown
+
+# bump when extensions change, so that cached HTML is not used
+RENDERER_VERSION = 1
+
+PRERENDER_FIELDS = {
+    Problem: ['description', 'input', 'output', 'hint'],
+    Blog: ['text'],
+    XtdComment: ['comment'],
+}
+
+_local = threading.local()
+
+
+def _markdown():
+    md = getattr(_local, 'md', None)
+    if md is None:
+        md = _local.md = markdown.Markdown(
+            extensions=[mdx_downheader.makeExtension(levels=2),
+                        mdx_math.makeExtension(enable_dollar_delimiter=True, add_preview=False),
+                        'fenced_code',
+                        'codehilite',
+                        'markdown.extensions.attr_list',
+                        'nl2br',
+                        'tables',
+                        'markdown.extensions.smarty'
+                        ]
+        )
+    return md
+
+
+def render(text):
+    """
+    Convert without any cache
+    """
+    md = _markdown()
+    md.reset()
+    return str(semantic.semantic_processor(md.convert(text)))
+
+
+def _render_or_load(text):
+    if settings.MARKDOWN_PRERENDER:
+        rendered = RenderedMarkdown.objects.filter(digest=html_cache.digest(text)).first()
+        if rendered is not None:
+            return rendered.html
+    return render(text)
+
+
+html_cache = RenderCache('MARKDOWN', _render_or_load, settings.MARKDOWN_LOCAL_CACHE_SIZE,
+                         settings.MARKDOWN_CACHE_TIMEOUT, version=RENDERER_VERSION)
 
 
 def convert(text):
-    md = markdown.Markdown(
-        extensions=[mdx_downheader.makeExtension(levels=2),
-                    mdx_math.makeExtension(enable_dollar_delimiter=True, add_preview=False),
-                    'fenced_code',
-                    'codehilite',
-                    'markdown.extensions.attr_list',
-                    'nl2br',
-                    'tables',
-                    'markdown.extensions.smarty'
-                    ]
-    )
-    return semantic.semantic_processor(md.convert(text))
+    return markupsafe.Markup(html_cache.get(str(text)))
+
+
+def convert_many(texts):
+    """
+    Same as `convert` for each text, with cached ones fetched at once
+    """
+    return [markupsafe.Markup(html) for html in html_cache.get_many([str(text) for text in texts])]
+
+
+def prerender(texts):
+    """
+    Render and store HTML of texts not stored yet
+    """
+    texts = {html_cache.digest(text): text for text in texts if text}
+    stored = set(RenderedMarkdown.objects.filter(digest__in=texts.keys()).values_list('digest', flat=True))
+    rendered = []
+    for digest, text in texts.items():
+        if digest not in stored:
+            rendered.append(RenderedMarkdown(digest=digest, html=render(text)))
+            html_cache.put(text, rendered[-1].html)
+    RenderedMarkdown.objects.bulk_create(rendered, ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Problem)
+@receiver(post_save, sender=Blog)
+@receiver(post_save, sender=XtdComment)
+def prerender_instance(sender, instance, update_fields=None, **kwargs):
+    if not settings.MARKDOWN_PRERENDER:
+        return
+    fields = PRERENDER_FIELDS[sender]
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    prerender(getattr(instance, field) for field in fields)
 
 
 def markdown_convert_api(request):
-    return HttpResponse(convert(request.POST.get('text', '')))
+    # previews are not cached, they are mostly drafts never seen again
+    return HttpResponse(render(request.POST.get('text', '')))
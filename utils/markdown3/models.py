@@ -0,0 +1,10 @@
+from django.db import models
+
+
+class RenderedMarkdown(models.Model):
+    """
+    HTML rendered ahead of time, keyed by hash of markdown text (refer to `utils.markdown3.RenderCache.digest`)
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    html = models.TextField()
+    create_time = models.DateTimeField(auto_now_add=True)
@@ -1,5 +1,7 @@
 import threading
 
+from utils import instrumentation
+
 
 class GlobalRequestMiddleware(object):
     _threadmap = {}
@@ -9,7 +11,13 @@ class GlobalRequestMiddleware(object):
 
     def __call__(self, request):
         self.process_request(request)
-        response = self.get_response(request)
+        recorder, wrappers = instrumentation.start()
+        try:
+            with wrappers:
+                response = self.get_response(request)
+        finally:
+            if recorder is not None:
+                instrumentation.finish(recorder, request)
         return self.process_response(request, response)
 
     @classmethod
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 05:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments_xtd', '0001_initial'),
+        ('utils', '0002_renderedmarkdown'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentVotes',
+            fields=[
+                ('comment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='votes', serialize=False, to='django_comments_xtd.XtdComment')),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('dislikes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+from django.db.models import Count, Q
+
+# flags of django_comments_xtd
+LIKEDIT_FLAG = "I liked it"
+DISLIKEDIT_FLAG = "I disliked it"
+
+
+def count_comment_votes(apps, schema_editor):
+    CommentFlag = apps.get_model('django_comments', 'CommentFlag')
+    CommentVotes = apps.get_model('utils', 'CommentVotes')
+    counts = CommentFlag.objects.filter(flag__in=[LIKEDIT_FLAG, DISLIKEDIT_FLAG], comment__xtdcomment__isnull=False). \
+        order_by().values('comment_id'). \
+        annotate(likes=Count('id', filter=Q(flag=LIKEDIT_FLAG)), dislikes=Count('id', filter=Q(flag=DISLIKEDIT_FLAG)))
+    votes = []
+    for row in counts.iterator():
+        votes.append(CommentVotes(comment_id=row['comment_id'], likes=row['likes'], dislikes=row['dislikes']))
+        if len(votes) >= 1000:
+            CommentVotes.objects.bulk_create(votes, ignore_conflicts=True)
+            votes = []
+    CommentVotes.objects.bulk_create(votes, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0003_commentvotes'),
+        ('django_comments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_comment_votes, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,7 @@
+import threading
+import time
+import uuid
+
 from django.conf import settings
 from django.db import models
 from django.core.cache import cache
@@ -14,27 +18,80 @@ class SiteSettings(models.Model):
     val = models.TextField(blank=True)
 
 
+class SiteSettingsSnapshot(object):
+    """
+    All site settings, kept in the process. Missing keys are known to be missing, so they cost nothing either.
+
+    Changes are noticed by a version in redis, bumped on every change and checked at most every
+    `SITE_SETTINGS_CHECK_INTERVAL` seconds, so most reads do no I/O at all.
+    """
+
+    version_key = 'site_settings_version'
+
+    def __init__(self):
+        self.values = None
+        self.version = None
+        self.checked = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, fresh=False):
+        """
+        :param fresh: check the version now instead of trusting a recent check
+        """
+        values = self.values
+        if fresh or values is None or time.monotonic() - self.checked >= settings.SITE_SETTINGS_CHECK_INTERVAL:
+            values = self.refresh()
+        return values.get(key, default)
+
+    def refresh(self):
+        """
+        :return: all site settings, read them from this dict rather than from `self.values` that may be replaced
+        """
+        with self._lock:
+            try:
+                version = cache.get(self.version_key)
+                if version is None:
+                    cache.add(self.version_key, uuid.uuid4().hex, None)
+                    version = cache.get(self.version_key)
+            except:
+                version = None
+            self.checked = time.monotonic()
+            if self.values is not None and version is not None and version == self.version:
+                return self.values
+            # rows are loaded after the version is read, so a change in between is loaded again next time
+            self.values = dict(SiteSettings.objects.values_list('key', 'val'))
+            self.version = version
+            return self.values
+
+    def changed(self):
+        try:
+            cache.set(self.version_key, uuid.uuid4().hex, None)
+        except:
+            pass
+        with self._lock:
+            # loaded again on next read, while other threads keep reading the old values
+            self.version = None
+            self.checked = float('-inf')
+
+
+snapshot = SiteSettingsSnapshot()
+
+
 def site_settings_get(key, default=None, use_cache=False):
-    try:
-        cache_key = 'site_settings_' + key
-        get_from_cache = cache.get(cache_key)
-        if use_cache and get_from_cache:
-            return get_from_cache
-        value = SiteSettings.objects.get(key=key).val
-        cache.set(cache_key, value, 300)
-        return value
-    except SiteSettings.DoesNotExist:
-        return default
+    """
+    :param use_cache: stale value (for a few seconds) is acceptable, otherwise the version is checked
+    """
+    return snapshot.get(key, default, fresh=not use_cache)
 
 
 def site_settings_set(key, val):
-    if not SiteSettings.objects.filter(key=key).exists():
-        SiteSettings.objects.create(key=key, val=val)
-    else:
-        settings = SiteSettings.objects.get(key=key)
-        settings.val = val
-        settings.save(update_fields=['val'])
-    cache.set('site_settings_' + key, val, 300)
+    SiteSettings.objects.update_or_create(key=key, defaults={'val': val})
+    snapshot.changed()
+
+
+def site_settings_delete(key):
+    SiteSettings.objects.filter(key=key).delete()
+    snapshot.changed()
 
 
 def is_site_closed(request):
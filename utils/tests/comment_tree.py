@@ -0,0 +1,101 @@
+import random
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Model
+from django.test import TestCase
+from django_comments.models import CommentFlag
+from django_comments_xtd.models import XtdComment, LIKEDIT_FLAG, DISLIKEDIT_FLAG
+
+from account.models import User
+from blog.models import Blog
+from utils import comment_tree
+from utils.comment_tree import CommentVotes
+
+
+class CommentTreeTest(TestCase):
+
+    def setUp(self):
+        self.rand = random.Random(0)
+        self.users = [User.objects.create(username="user%d" % i, email="user%d@example.com" % i) for i in range(3)]
+        self.blog = Blog.objects.create(title="blog", text="text", author=self.users[0], visible=True)
+        self.ctype = ContentType.objects.get_for_model(self.blog)
+        cache.delete(comment_tree.tree_key(self.ctype.pk, self.blog.pk))
+
+    def comment(self, parent=None, text="comment", **kwargs):
+        return XtdComment.objects.create(content_type=self.ctype, object_pk=str(self.blog.pk), site_id=settings.SITE_ID,
+                                         user=self.rand.choice(self.users), comment=text,
+                                         parent_id=parent.pk if parent else 0, **kwargs)
+
+    def vote(self, comment, user, flag):
+        return CommentFlag.objects.create(comment=comment, user=user, flag=flag)
+
+    def get_tree(self):
+        return comment_tree.get_tree(self.ctype, self.blog.pk, with_feedback=True)
+
+    def assertTree(self, tree, comments):
+        # every public comment under its parent, once
+        def walk(nodes, parent_id):
+            for node in nodes:
+                if parent_id is not None:
+                    self.assertEqual(parent_id, node['comment']['parent_id'])
+                yield node['comment']['pk']
+                yield from walk(node['children'], node['comment']['pk'])
+        self.assertEqual(sorted(comment.pk for comment in comments), sorted(walk(tree, None)))
+
+    def test_build(self):
+        comments = []
+        for _ in range(80):
+            parent = self.rand.choice(comments) if comments and self.rand.random() < 0.8 else None
+            if parent is not None and parent.level >= settings.COMMENTS_XTD_MAX_THREAD_LEVEL:
+                parent = None
+            comments.append(self.comment(parent))
+        hidden = self.comment(comments[0], is_public=False)
+        self.comment(hidden)
+        self.assertTree(self.get_tree(), comments)
+
+    def test_votes(self):
+        comment, other = self.comment(), self.comment()
+        self.vote(comment, self.users[0], LIKEDIT_FLAG)
+        self.vote(comment, self.users[1], LIKEDIT_FLAG)
+        flag = self.vote(comment, self.users[2], DISLIKEDIT_FLAG)
+        self.vote(comment, self.users[2], CommentFlag.SUGGEST_REMOVAL)
+        self.vote(other, self.users[0], DISLIKEDIT_FLAG).delete()
+        votes = CommentVotes.objects.get(comment=comment)
+        self.assertEqual((2, 1), (votes.likes, votes.dislikes))
+        flag.delete()
+        self.assertEqual(0, CommentVotes.objects.get(comment=comment).dislikes)
+        self.assertEqual(0, CommentVotes.objects.get(comment=other).dislikes)
+        comment.delete()
+        self.assertFalse(CommentVotes.objects.filter(comment_id=comment.pk).exists())
+
+    def test_cache(self):
+        first = self.comment()
+        reply = self.comment(first)
+        self.vote(first, self.users[1], DISLIKEDIT_FLAG)
+        self.vote(reply, self.users[1], LIKEDIT_FLAG)
+        tree = self.get_tree()
+        # only plain values are cached, not models
+        self.assertFalse([value for comment in comment_tree.iter_comments(tree) for value in comment.values()
+                          if isinstance(value, Model)])
+        with self.assertNumQueries(0):
+            self.assertEqual(tree, self.get_tree())
+        self.assertEqual(1, tree[0]['dislikes_count'])
+        with self.assertNumQueries(1):
+            tree = comment_tree.with_user_feedback(tree, self.users[1])
+        self.assertEqual(-1, tree[0]['likes_flag'])
+        self.assertEqual(1, tree[0]['children'][0]['likes_flag'])
+        self.assertNotIn('likes_flag', self.get_tree()[0])
+        with self.assertNumQueries(1):
+            tree = comment_tree.with_users(tree)
+        self.assertEqual(first.user, tree[0]['comment']['user'])
+        self.assertEqual(reply.user, tree[0]['children'][0]['comment']['user'])
+        self.assertNotIn('user', self.get_tree()[0]['comment'])
+
+        # a new comment, or a vote, drops the tree
+        second = self.comment()
+        self.assertEqual(second.pk, self.get_tree()[0]['comment']['pk'])
+        self.vote(second, self.users[0], DISLIKEDIT_FLAG)
+        self.vote(second, self.users[1], DISLIKEDIT_FLAG)
+        self.assertEqual(first.pk, self.get_tree()[0]['comment']['pk'])
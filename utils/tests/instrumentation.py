@@ -0,0 +1,73 @@
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse, resolve
+
+from account.models import User
+from utils import instrumentation
+from utils.middleware.globalrequestmiddleware import GlobalRequestMiddleware
+
+
+def n_plus_one_view(request):
+    for user in User.objects.all():
+        User.objects.filter(pk=user.pk).exists()
+    recorder = instrumentation.current() or instrumentation.Recorder()
+    hits, misses = recorder.cache_hits, recorder.cache_misses
+    cache.set("instrumentation_test", None)
+    cache.get("instrumentation_test")
+    cache.get("instrumentation_test_missing")
+    cache.get_many(["instrumentation_test", "instrumentation_test_missing"])
+    request.cache_gets = recorder.cache_hits - hits, recorder.cache_misses - misses
+    return render(request, "backstage/site/site.jinja2", {"site_settings": []})
+
+
+class InstrumentationTest(TestCase):
+
+    def setUp(self):
+        instrumentation.clear()
+        for i in range(12):
+            User.objects.create(username="user%d" % i, email="user%d@example.com" % i)
+
+    def request(self, view, path="/"):
+        request = RequestFactory().get(path)
+        request.user = User.objects.first()
+        request.resolver_match = resolve(path)
+        GlobalRequestMiddleware(view)(request)
+        return request
+
+    def test_record(self):
+        # None is a hit, like any cached value
+        self.assertEqual((2, 2), self.request(n_plus_one_view).cache_gets)
+        self.request(lambda request: HttpResponse())
+        endpoints, offenders = instrumentation.report(3600)
+        self.assertEqual(1, len(endpoints))
+        endpoint = endpoints[0]
+        self.assertEqual("GET home", endpoint["endpoint"])
+        self.assertEqual(2, endpoint["count"])
+        self.assertGreaterEqual(endpoint["queries"] * 2, 13)
+        self.assertIsNotNone(endpoint["cache_hit_ratio"])
+        self.assertGreater(endpoint["template_time"], 0)
+        self.assertGreaterEqual(endpoint["time"], endpoint["db_time"] + endpoint["template_time"])
+        self.assertEqual(1, len(offenders))
+        self.assertEqual(1, offenders[0]["requests"])
+        self.assertEqual(12, offenders[0]["queries"])
+        self.assertIn("LIMIT 1", offenders[0]["sql"])
+
+    def test_not_inside_requests(self):
+        User.objects.count()
+        self.assertIsNone(instrumentation.current())
+        self.assertEqual(([], []), instrumentation.report(3600))
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled(self):
+        self.request(n_plus_one_view)
+        self.assertEqual(([], []), instrumentation.report(3600))
+
+    def test_backstage(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin)
+        self.request(n_plus_one_view)
+        response = self.client.get(reverse("backstage:requests"))
+        self.assertContains(response, "GET home")
+        self.assertContains(response, "N+1")
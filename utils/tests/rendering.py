@@ -0,0 +1,169 @@
+import os
+import subprocess
+import sys
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from pygments import highlight
+from pygments.formatters.html import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+
+from account.models import User
+from blog.models import Blog
+from problem.models import Problem
+from problem.tasks import create_submission
+from utils import language
+from utils import markdown3 as md3
+from utils.cache import LRUCache
+from utils.markdown3.models import RenderedMarkdown
+
+TEXTS = [
+    "# Title\n\nSome *text* with $a^2$ and a table:\n\n| a | b |\n|---|---|\n| 1 | 2 |\n",
+    "```cpp\nint main() { return 0; }\n```\n\n![image](/a.png)",
+    "line one\nline two \"quoted\" -- dash",
+    "",
+]
+
+
+class LRUCacheTest(SimpleTestCase):
+
+    def test_evict(self):
+        lru = LRUCache(3)
+        for i in range(3):
+            lru.set(i, i)
+        lru.get(0)
+        lru.set(3, 3)
+        self.assertEqual([0, 2, 3], sorted(lru._data.keys()))
+
+    def test_weight(self):
+        lru = LRUCache(10, weight=len)
+        lru.set("a", "x" * 6)
+        lru.set("b", "x" * 3)
+        lru.set("c", "x" * 3)
+        self.assertNotIn("a", lru)
+        self.assertEqual(6, lru.size)
+        lru.set("d", "x" * 11)
+        self.assertNotIn("d", lru)
+
+
+class MarkdownCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        md3.html_cache.local.clear()
+
+    def test_same_as_render(self):
+        expected = [md3.render(text) for text in TEXTS]
+        self.assertEqual(expected, [str(md3.convert(text)) for text in TEXTS])
+        self.assertEqual(expected, [str(html) for html in md3.convert_many(TEXTS)])
+        # state of the reused instance does not leak between texts
+        self.assertEqual(expected, [md3.render(text) for text in reversed(TEXTS)][::-1])
+
+    def test_cached(self):
+        md3.convert(TEXTS[0])
+        md3.html_cache.local.clear()
+        with mock.patch('utils.markdown3.render') as render:
+            md3.convert(TEXTS[0])  # from redis
+            md3.convert(TEXTS[0])  # from local
+        render.assert_not_called()
+
+    def test_threads(self):
+        expected = [md3.render(text) for text in TEXTS]
+        results, errors = [], []
+
+        def work():
+            try:
+                for _ in range(20):
+                    results.append([md3.render(text) for text in TEXTS])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertTrue(all(result == expected for result in results))
+
+
+@override_settings(MARKDOWN_PRERENDER=True)
+class PrerenderTest(TestCase):
+
+    def test_blog(self):
+        text = "prerendered **blog** %s" % id(self)
+        user = User.objects.create(username="blogger", email="blogger@example.com")
+        Blog.objects.create(title="blog", text=text, author=user)
+        self.assertTrue(RenderedMarkdown.objects.filter(digest=md3.html_cache.digest(text)).exists())
+        md3.html_cache.local.clear()
+        with mock.patch('utils.cache.cache.get_many', return_value={}), \
+                mock.patch('utils.markdown3.render') as render:
+            self.assertEqual(RenderedMarkdown.objects.get(digest=md3.html_cache.digest(text)).html,
+                             str(md3.convert(text)))
+        render.assert_not_called()
+
+
+    def test_connected_on_setup(self):
+        # in a fresh process (e.g. a worker or a management command) that imports no markdown module by itself
+        code = "\n".join([
+            "import django",
+            "django.setup()",
+            "from django.db.models.signals import post_save",
+            "from blog.models import Blog",
+            "from problem.models import Problem",
+            "print(sorted(r.__module__ + '.' + r.__name__ for model in (Blog, Problem)",
+            "             for r in post_save._live_receivers(model)))",
+        ])
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=settings.BASE_DIR,
+                                         env=dict(os.environ, DJANGO_SETTINGS_MODULE="eoj3.settings"),
+                                         stderr=subprocess.DEVNULL)
+        self.assertEqual(2, output.decode().count("utils.markdown3.prerender_instance"))
+
+
+CODES = [
+    ("cpp", "#include <cstdio>\nint main() { int a, b; scanf(\"%d%d\", &a, &b); printf(\"%d\\n\", a + b); }\n"),
+    ("cc17", "auto main() -> int { return 0; }"),
+    ("python", "print(sum(map(int, input().split())))  # <b>\n"),
+    ("py2", "print 1\n\n"),
+    ("java", "public class Main { public static void main(String[] args) {} }"),
+    ("pas", "begin writeln('a < b'); end."),
+    ("text", "plain\ntext"),
+]
+
+
+class CodeHighlightTest(SimpleTestCase):
+
+    def setUp(self):
+        language.code_html_cache.local.clear()
+
+    def test_same_as_highlight(self):
+        for lang, code in CODES:
+            expected = highlight(code, get_lexer_by_name(dict(language.LANG_REGULAR_NAME).get(lang, lang)),
+                                 HtmlFormatter())
+            self.assertEqual(expected, language.transform_code_to_html(code, lang), lang)
+            self.assertEqual(expected, language.transform_code_to_html(code, lang), lang)
+
+    def test_cached_by_lang(self):
+        code = "x = 1  # %d" % id(self)
+        language.transform_code_to_html(code, "python")
+        language.code_html_cache.local.clear()
+        with mock.patch('utils.language.highlight_code') as highlight_code:
+            language.transform_code_to_html(code, "python")  # from redis
+            language.transform_code_to_html(code, "python")  # from local
+        highlight_code.assert_not_called()
+        self.assertEqual(language.highlight_code(code, "text"), language.transform_code_to_html(code, "text"))
+
+
+@override_settings(SUBMISSION_INTERVAL_LIMIT=0)
+class CodePrerenderTest(TestCase):
+
+    def test_create_submission(self):
+        user = User.objects.create(username="coder", email="coder@example.com")
+        problem = Problem.objects.create(title="problem")
+        with override_settings(CODE_HTML_PRERENDER=True), mock.patch('problem.tasks.async_task') as async_task:
+            submission = create_submission(problem, user, "int main() {}", "cpp")
+        async_task.assert_called_once_with(language.prerender_code, submission.code, submission.lang)
+        with mock.patch('problem.tasks.async_task') as async_task:
+            create_submission(problem, user, "int main() { return 0; }", "cpp")
+        async_task.assert_not_called()
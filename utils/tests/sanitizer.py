@@ -0,0 +1,101 @@
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from utils import markdown3 as md3
+from utils import sanitizer
+from utils.sanitizer import Sanitizer
+from utils.xss_filter import XssHtml
+
+# what users write in statements, blogs and comments, rendered to HTML before the `safer` filter
+MARKDOWN = [
+    "# A + B\n\nGiven $a$ and $b$ ($1 \\le a, b \\le 10^9$), print $a + b$.\n\n$$\\sum_{i=1}^n i$$\n",
+    "```cpp\n#include <cstdio>\nint main() { int a, b; scanf(\"%d%d\", &a, &b); printf(\"%d\\n\", a + b); }\n```\n",
+    "```python\nprint(sum(map(int, input().split())))  # <, > and &\n```\n",
+    "| n | answer |\n|---|---|\n| 1 | `1` |\n| 2 | **3** |\n",
+    "![graph](/upload/graph.png)\n\n[statement](http://acm.ecnu.edu.cn/problem/1/) and [relative](problem/2/)\n",
+    "- first\n- second with <b>html</b>\n\n1. one\n2. two\n\n> quoted & \"smart\" -- dashes...\n",
+    "Hint{: .hint-class}\n\n<div class=\"alert\" onclick=\"alert(1)\">inline <span style=\"color: red\">html</span></div>",
+    "<script>alert(document.cookie)</script> and <img src=x onerror=alert(1)> &nbsp; &copy; &#169; &#xA9;",
+    "Sample input:\n\n    3\n    1 2 3\n\nline one\nline two\n",
+    "",
+]
+
+# written by hand
+HTML = [
+    """<p><img src=1 onerror=alert(/xss/)></p><div class="left">
+        <a href='javascript:prompt(1)'><br />hehe</a></div>
+        <p id="test" onmouseover="alert(1)" style="expresSion(alert(1))">&gt;M<svg>
+        <a href="https://www.baidu.com" target="self">MM</a></p>
+        <embed src='javascript:alert(/hehe/)' allowscriptaccess=always />
+        <a href="/problem/">Problems</a>
+        <script type="math/tex">(1<n \\leq 100)</script>
+        <td rowspan="2">
+        <p><code>&lt;int&gt;</code></p>
+        <script>setInterval(function() { alert("hello"); }, 100);</script>
+    """,
+    "<style>body { display: none }</style><STYLE>p {}</STYLE >",
+    "<a title='x>y' href=/a/b/ target=_self>a</a><a href=\"a\"title=\"b\">b</a><a b='x'c=d>",
+    "<!-- comment --><!--unclosed",
+    "<!DOCTYPE html><?php echo 1; ?><![CDATA[x]]>",
+    "1 < 2 && 3 > 2 &amp &a-b; &a.b c &#12a; &#;",
+    "<p/><br/><br / ><img src=\"x\" /><p\tclass=a\nstyle='b'>",
+    "</ p></p ></>text</a>",
+    "<script type=\"math/tex; mode=display\">x</script x><script>y",
+    "unterminated <a href=\"x",
+    "trailing <",
+    "trailing &",
+]
+
+FRAGMENTS = ['<p>', '</p>', '<a href="x">', '<a href=/y target=_self>', '</a>', '<img src=1 onerror=alert(1)>',
+             '<br/>', '&amp;', '&nbsp', '&#123;', '&#x41;', '& ', '&', '<', '<3', '<!-- c -->', '<!--', '<!x>',
+             '</ p >', '<script>', '</script>', '<style>', '</style>', 'text', '\n', '<P CLASS=x>',
+             '<div class="a" class=\'b\' style="expression(1)">', '</div>', "<span data-x='&lt;'>", '<b x="',
+             '<embed src=a play=true wmode=x>', '<a title="a>b">', '<a/title=x>', '&a-b;', '<b', '"', '<a href=x/>']
+
+
+def xss_html(html):
+    parser = XssHtml()
+    parser.feed(html)
+    parser.close()
+    return parser.getHtml()
+
+
+class SanitizerTest(SimpleTestCase):
+
+    def assertSameAsXssHtml(self, documents):
+        sanitizer_ = Sanitizer()
+        for html in documents:
+            try:
+                expected = xss_html(html)
+            except:
+                # e.g. attributes without value, which XssHtml fails on
+                continue
+            self.assertEqual(expected, sanitizer_.sanitize(html), html)
+
+    def test_markdown(self):
+        self.assertSameAsXssHtml([md3.render(text) for text in MARKDOWN])
+
+    def test_html(self):
+        self.assertSameAsXssHtml(HTML)
+
+    def test_random(self):
+        rand = random.Random(0)
+        self.assertSameAsXssHtml(''.join(rand.choice(FRAGMENTS) for _ in range(rand.randint(1, 12)))
+                                 for _ in range(3000))
+
+    def test_script(self):
+        self.assertEqual('<script type="math/tex">alert(1)</script>',
+                         Sanitizer().sanitize('<script type="text/javascript">alert(1)</script>'))
+
+    def test_attribute_without_value(self):
+        self.assertEqual('<td rowspan=""></td><a href="http://" target="_blank">',
+                         Sanitizer().sanitize('<td rowspan></td><a href>'))
+
+    def test_cached(self):
+        html = "<p onclick=\"x\">cached %d</p>" % id(self)
+        self.assertEqual("<p>cached %d</p>" % id(self), sanitizer.sanitize(html))
+        with mock.patch.object(sanitizer.default_sanitizer, 'sanitize') as sanitize:
+            self.assertEqual("<p>cached %d</p>" % id(self), sanitizer.sanitize(html))
+        sanitize.assert_not_called()
@@ -0,0 +1,50 @@
+from django.test import TestCase, override_settings
+
+from utils import site_settings
+from utils.site_settings import site_settings_get, site_settings_set, site_settings_delete, SiteSettings, \
+    SiteSettingsSnapshot
+
+
+class SiteSettingsTest(TestCase):
+
+    def setUp(self):
+        # rows are rolled back after each test, without the version being bumped
+        site_settings.snapshot.changed()
+
+    def test_get(self):
+        site_settings_set("BULLETIN", "hello")
+        self.assertEqual("hello", site_settings_get("BULLETIN"))
+        self.assertEqual("hello", site_settings_get("BULLETIN", use_cache=True))
+        site_settings_set("BULLETIN", "world")
+        self.assertEqual("world", site_settings_get("BULLETIN", use_cache=True))
+        site_settings_delete("BULLETIN")
+        self.assertEqual("", site_settings_get("BULLETIN", "", use_cache=True))
+
+    def test_missing_cached(self):
+        site_settings_get("FESTIVAL", default=False, use_cache=True)
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                self.assertFalse(site_settings.is_festival())
+                self.assertFalse(site_settings.nonstop_judge())
+            self.assertEqual("naive", site_settings_get("POLYGON_TOKEN", "naive"))
+
+    def test_changed_while_reading(self):
+        site_settings_set("BULLETIN", "hello")
+        values = site_settings.snapshot.refresh()
+        site_settings_set("BULLETIN", "world")
+        # a thread that read the snapshot before the change keeps a consistent dict
+        self.assertIs(values, site_settings.snapshot.values)
+        self.assertEqual("hello", values["BULLETIN"])
+        self.assertEqual("world", site_settings_get("BULLETIN", use_cache=True))
+
+    def test_other_process(self):
+        # another process is another snapshot, sharing redis and the database
+        other = SiteSettingsSnapshot()
+        self.assertIsNone(other.get("NONSTOP_JUDGE"))
+        site_settings_set("NONSTOP_JUDGE", "1")
+        self.assertIsNone(other.get("NONSTOP_JUDGE"))
+        self.assertEqual("1", other.get("NONSTOP_JUDGE", fresh=True))
+        with override_settings(SITE_SETTINGS_CHECK_INTERVAL=0):
+            SiteSettings.objects.filter(key="NONSTOP_JUDGE").delete()
+            site_settings.snapshot.changed()
+            self.assertIsNone(other.get("NONSTOP_JUDGE"))
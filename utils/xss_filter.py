@@ -118,10 +118,11 @@ class XssHtml(HTMLParser):
         return attrs
 
     def node_script(self, attrs):
-        attrs = self._set_attr_default(attrs, "type", "math/tex")
+        # limit before default, a script without type is javascript
         attrs = self._limit_attr(attrs, {
             "type": ["math/tex", "math/tex; mode=display"]
         })
+        attrs = self._set_attr_default(attrs, "type", "math/tex")
         return attrs
 
     def node_embed(self, attrs):